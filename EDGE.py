@@ -7,12 +7,23 @@ import numpy as np
 import matplotlib.pyplot as plt
 #from astropy.io import ascii
 from astropy.io import fits
+from astropy.table import Table
 import scipy.interpolate as sinterp
+import scipy.sparse as sparse
 #from matplotlib.backends.backend_pdf import PdfPages
 import os
+import re
 import math
 import cPickle
+import itertools
+import bisect
+import heapq
+import time
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
 import pdb
+from collections import OrderedDict
+from collate import jobParse, jobSub, gridName, gridRead, GRIDAXES, GRIDFLAGS, GRIDCOUNTS
 
 #----------------------------------------------PLOTTING PARAMETERS-----------------------------------------------
 # Regularizes the plotting parameters like tick sizes, legends, etc.
@@ -478,49 +489,217 @@ def look(obs, model=None, jobn=None, save=0, savepath=figurepath, colkeys=None,
 
     return
 
-def searchJobs(target, dpath=datapath, **kwargs):
+# Header indices already loaded this session, by index filename:
+headerCache     = {}
+
+def headerIndex(target, dpath=datapath, save=1, indexpath=None):
+    """
+    Builds an index of the headers of all of the collated disk model files of a target, so they can be searched without
+    opening every file. The index is saved and updated on later calls: every file's size and modification time are
+    checked, and only files that are new or changed are opened again.
+    
+    INPUTS
+    target: The name of the target (e.g., cvso109, DMTau, etc.).
+    dpath: The directory containing the collated files.
+    save: BOOLEAN -- if 1 (True), the index is saved as target_index.npz for the next session. It is not saved if the
+          directory it goes in can't be written to.
+    indexpath: The directory to save the index in. If None, uses dpath.
+    
+    OUTPUT
+    index: Dictionary of numpy arrays with one entry per model file, sorted by file name. 'filename', 'jobnum', 'mtime' and
+           'size' describe the files, and each header keyword is an upper case key. Files that do not have a keyword get
+           NaN (or '' for strings) there.
+    """
+    
+    if indexpath is None:
+        indexpath       = dpath
+    indexfile           = indexpath + target + '_index.npz'
+    
+    # Start from the index in memory, or the one saved by an earlier session:
+    if indexfile in headerCache:
+        old             = headerCache[indexfile]
+    elif os.path.exists(indexfile):
+        saved           = np.load(indexfile)
+        old             = dict((key, saved[key]) for key in saved.files)
+        saved.close()
+    else:
+        old             = {'filename': np.array([])}
+    oldRows             = dict((f, i) for i, f in enumerate(old['filename']))
+    
+    # Only the disk model files, e.g. target_012.fits, are indexed:
+    pattern             = re.compile('^' + re.escape(target) + r'_([0-9]{3,4})\.fits$')
+    files               = sorted([f for f in filelist(dpath or '.') if pattern.match(f)])
+    
+    # Check the size and modification time of every file, like collate's _jobSignature:
+    stats               = [os.stat(dpath + f) for f in files]
+    same                = [f in oldRows and old['mtime'][oldRows[f]] == stat.st_mtime and
+                           old['size'][oldRows[f]] == stat.st_size for f, stat in zip(files, stats)]
+    if len(files) == len(oldRows) and all(same):
+        headerCache[indexfile] = old
+        return old
+    
+    # Only the files that are new or changed are opened again. The others get back the keywords they had, which are
+    # the ones that are not NaN (or '') in the old index:
+    headers             = []
+    for f, stat, unchanged in zip(files, stats, same):
+        if unchanged:
+            header      = {}
+            for key in old:
+                if key.isupper():
+                    value = old[key][oldRows[f]]
+                    if (value != '') if old[key].dtype.kind in 'SU' else not np.isnan(value):
+                        header[key] = value
+        else:
+            header      = dict(fits.getheader(dpath + f))
+        headers.append((f, stat, header))
+    
+    # Put the headers into one array per keyword:
+    keys                = []
+    for f, stat, header in headers:
+        for key in header:
+            if key not in keys and key not in ['SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'EXTEND', 'COMMENT', 'HISTORY', '']:
+                keys.append(key)
+    index               = {'filename': np.array([f for f, stat, header in headers], dtype='string'),
+                           'jobnum': np.array([pattern.match(f).group(1) for f, stat, header in headers], dtype='string'),
+                           'mtime': np.array([stat.st_mtime for f, stat, header in headers], dtype=float),
+                           'size': np.array([stat.st_size for f, stat, header in headers], dtype=int)}
+    for key in keys:
+        values          = [header.get(key) for f, stat, header in headers]
+        if any(isinstance(value, str) for value in values):
+            index[key]  = np.array(['' if value is None else value for value in values], dtype='string')
+        else:
+            index[key]  = np.array([np.nan if value is None else value for value in values], dtype=float)
+    
+    # Save the index, unless it has nowhere to go:
+    if save and os.access(indexpath or '.', os.W_OK):
+        try:
+            np.savez(indexfile[:-4] + '_tmp.npz', **index)
+            os.rename(indexfile[:-4] + '_tmp.npz', indexfile)
+        except (IOError, OSError):
+            print('HEADERINDEX: Warning: Could not save the index in ' + indexpath)
+    headerCache[indexfile] = index
+    
+    return index
+
+def searchScale(column, value):
+    """
+    Scales a column of header values (and a value to compare them to) onto a common 0-1 range, so that parameters
+    with very different units can be combined into one distance. Positive parameters that cover more than a
+    factor of 100 are scaled in log space.
+    
+    INPUTS
+    column: The array of header values, with NaN for files that do not have it.
+    value: The value being searched for.
+    
+    OUTPUT
+    column: The scaled column.
+    point: The scaled value.
+    """
+    
+    good                = column[~np.isnan(column)]
+    if len(good) == 0:
+        return column, value
+    low, high           = good.min(), good.max()
+    if low > 0 and high > 100*low and value > 0:
+        column, value   = np.log10(column), np.log10(value)
+        low, high       = np.log10(low), np.log10(high)
+    span                = high - low
+    if span == 0:
+        span            = 1.0
+    return (column - low)/span, (value - low)/span
+
+def searchJobs(target, dpath=datapath, indexed=1, rtol=1e-6, atol=0.0, nearest=None, **kwargs):
     """
     Searches through the job file outputs to determine which jobs (if any) matches the set of input parameters.
     
     INPUTS
     target: The name of the target we're checking against (e.g., cvso109, DMTau, etc.).
+    indexed: BOOLEAN -- if 1 (True), the headers are taken from the index made by headerIndex() rather than by opening
+             every file. If 0 (False), every file is opened, and range and nearest searches are not supported.
+    rtol: The relative tolerance when matching numbers, so that 1e-08 and 1.0000001e-08 match. Set to 0 for exact matches.
+    atol: The absolute tolerance when matching numbers.
+    nearest: INTEGER -- if given, return the jobs closest to the number kwargs instead of exact matches, ordered by distance.
+             Distance is measured with each parameter scaled by its range in the grid (and in log space for positive
+             parameters covering more than a factor of 100, like MDOT). Jobs without one of the keywords are left out.
     **kwargs: Any keyword arguments (kwargs) supplied. These should correspond to the header filenames (not case sensitive). The code
-              will loop through each of these kwargs and see if they all match.
+              will loop through each of these kwargs and see if they all match. A value can also be a (low, high) tuple to
+              match a range (inclusive), where either end can be None. Keywords that hold strings in the headers (like
+              JOBNUM, e.g. '005') can only be matched with a string; anything else raises a TypeError.
     
     OUTPUTS
     job_matches: A numpy array containing all the jobs that matched the kwargs. Can be an empty array, single value array, or 
                  multivalued array. Will contain matches by their integer number.
+    
+    EXAMPLES
+    searchJobs('DMTau', mdot=(1e-9, 1e-8), altinh=3)        # Every job with 1e-9 <= MDOT <= 1e-8 and ALTINH = 3
+    searchJobs('DMTau', nearest=5, mdot=3e-9, temp=1400)    # The 5 jobs closest to MDOT = 3e-9 and TEMP = 1400
     """
     
+    if indexed:
+        index           = headerIndex(target, dpath=dpath)
+        match           = np.ones(len(index['filename']), dtype=bool)
+        distance        = np.zeros(len(index['filename']), dtype=float)
+        if len(index['filename']) == 0:
+            return np.array([], dtype='string')
+        
+        for kwarg, value in kwargs.items():
+            if kwarg.upper() not in index:
+                raise KeyError('SEARCHJOBS: Keyword ' + kwarg.upper() + ' is not in the headers of ' + target)
+            column      = index[kwarg.upper()]
+            if column.dtype.kind in 'SU' and not isinstance(value, str):
+                raise TypeError('SEARCHJOBS: Keyword ' + kwarg.upper() + ' holds strings, search it with a string')
+            
+            # Strings always have to match exactly, and ranges are always used as limits:
+            if isinstance(value, str):
+                match   = match & (column == value)
+            elif type(value) == tuple:
+                low, high = value
+                with np.errstate(invalid='ignore'):
+                    if low is not None:
+                        match = match & (column >= low)
+                    if high is not None:
+                        match = match & (column <= high)
+            elif nearest is not None:
+                column, point = searchScale(column, value)
+                distance = distance + (column - point)**2
+            else:
+                match   = match & np.isclose(column, value, rtol=rtol, atol=atol)
+        
+        if nearest is not None:
+            # Models without one of the keywords have a NaN distance, and are left out like non-matches:
+            match       = match & ~np.isnan(distance)
+            order       = np.argsort(np.where(match, distance, np.inf), kind='mergesort')
+            order       = order[:min(int(nearest), match.sum())]
+            return np.array(index['jobnum'][order], dtype='string')
+        return np.array(index['jobnum'][match], dtype='string')
+    
+    if nearest is not None or any(type(value) == tuple for value in kwargs.values()):
+        raise ValueError('SEARCHJOBS: Range and nearest searches need indexed=1')
+    
     job_matches         = np.array([], dtype='string')
-    targList            = filelist(dpath)
     
-    # Pop out all files that do not correspond to jobs:
-    not_data            = []
-    for f in targList:
-        if f.startswith(target+'_') and f.endswith('.fits'):
-            continue
-        else:
-            not_data.append(targList.index(f))
-    for ind, val in enumerate(not_data):
-        targList.pop(val - ind)
+    # Only the collated disk models (target_XXX.fits or target_XXXX.fits) are jobs, like in headerIndex(). This leaves
+    # out the optically thin dust models and the grid containers:
+    pattern             = re.compile('^' + re.escape(target) + r'_([0-9]{3,4})\.fits$')
+    targList            = [f for f in filelist(dpath) if pattern.match(f)]
     
     # Now go through the list and find any jobs matching the desired input parameters:
+    # Numbers are matched with the same tolerances as in the index:
     for jobi, job in enumerate(targList):
-        if 'OTD' in job:
-            continue
         fitsF           = fits.open(dpath+job)
         header          = fitsF[0].header
+        fitsF.close()
         for kwarg, value in kwargs.items():
-            if header[kwarg.upper()] != value:
+            headerValue = header[kwarg.upper()]
+            if isinstance(headerValue, str) and not isinstance(value, str):
+                raise TypeError('SEARCHJOBS: Keyword ' + kwarg.upper() + ' holds strings, search it with a string')
+            if isinstance(value, str) or isinstance(headerValue, str):
+                if headerValue != value:
+                    break
+            elif not np.isclose(headerValue, value, rtol=rtol, atol=atol):
                 break
         else:
-            # Check if three or four string number:
-            if job[-9] == '_':
-                job_matches = np.append(job_matches, job[-8:-5])
-            else:
-                job_matches = np.append(job_matches, job[-9:-5])
-        fitsF.close()
+            job_matches = np.append(job_matches, pattern.match(job).group(1))
     
     return job_matches
 
@@ -566,6 +745,71 @@ def loadPickle(name, picklepath=datapath, num=None, red=0):
             f.close()
         return pickle
 
+def jobSwitch(lines, alts, name, value, convert, problem, pair=0):
+    """
+    Switches which of the commented out alternatives of a job file variable is the active one.
+    
+    INPUTS
+    lines: The lines of the job file, as returned by jobParse. Changed in place.
+    alts: The list of set lines of the job file, as returned by jobParse.
+    name: The name of the variable to switch, e.g. 'AMAXS'.
+    value: The desired value, already converted with convert.
+    convert: Function that turns the value string in the job file into something comparable to value.
+    problem: Error message for a comment problem, with a %s where the value goes.
+    pair: The number of lines right after each alternative that are switched with it (e.g. lamaxs
+          goes with AMAXS).
+    
+    OUTPUT
+    True if the variable was found with the desired value, False if there is no such alternative.
+    """
+    
+    choices = [alt for alt in alts if alt[0] == name]
+    active  = [alt for alt in choices if alt[3]]
+    target  = [alt for alt in choices if convert(alt[1]) == value]
+    
+    # The sample must have exactly one active alternative, including its paired lines:
+    if len(active) != 1:
+        raise ValueError(problem % ', '.join([alt[1] for alt in active]))
+    if any(lines[active[0][2]+n][0] == '#' for n in range(1, pair+1)):
+        raise ValueError(problem % active[0][1])
+    if len(target) == 0:
+        return False
+    if target[0][2] == active[0][2]:
+        return True
+    
+    # Uncomment the desired alternative and comment out the one that was active:
+    for n in range(pair+1):
+        if lines[target[0][2]+n][0] != '#':
+            raise ValueError(problem % target[0][1])
+    for n in range(pair+1):
+        lines[target[0][2]+n] = lines[target[0][2]+n][1:]
+        lines[active[0][2]+n] = '#' + lines[active[0][2]+n]
+    
+    return True
+
+def jobSet(lines, alts, name, value, funcname):
+    """
+    Sets the value of a variable on every active set line for it in the job file.
+    
+    INPUTS
+    lines: The lines of the job file, as returned by jobParse. Changed in place.
+    alts: The list of set lines of the job file, as returned by jobParse.
+    name: The name of the variable to change.
+    value: The new value.
+    funcname: Name of the calling function, for the error message.
+    
+    OUTPUT
+    No formal outputs are returned by this function.
+    """
+    
+    linenos = [alt[2] for alt in alts if alt[0] == name and alt[3]]
+    if len(linenos) == 0:
+        raise ValueError(funcname+': There is no active line for '+name+' in the sample job file!')
+    for lineno in linenos:
+        lines[lineno] = jobSub(lines[lineno], value)
+    
+    return
+
 def job_file_create(jobnum, path, high=0, iwall=0, **kwargs):
     """
     Creates a new job file that is used by the D'Alessio Model.
@@ -607,229 +851,48 @@ def job_file_create(jobnum, path, high=0, iwall=0, **kwargs):
     
     # First, let's read in the sample job file so we have a template:
     job_file = open(path+'job_sample', 'r')
-    fullText = job_file.readlines()     # All text in a list of strings
+    params, alts, fullText = jobParse(job_file.read())     # All text in a list of strings
     job_file.close()
     
-    # Double check for the correct default amax and epsilon values:
-    if fullText[42][0] == '#' or fullText[43][0] == '#':
-        raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=0.25')
-    if fullText[70][0] == '#' or fullText[71][0] == '#':
-        raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.0001')
-    
     # Now we run through the list of changes desired and change them:
     # If we want to change the maximum grain size (amaxs):
     if 'amaxs' in kwargs:
         amaxVal = kwargs['amaxs']
         del kwargs['amaxs']
-        # amaxs is a commented out switch, so we need to know the desired size:
-        if amaxVal == 0.25:
-            pass
-        elif amaxVal == 0.05:
-            if fullText[36][0] == '#' and fullText[37][0] == '#':
-                fullText[36] = fullText[36][1:]     # Remove the pound at 0.05
-                fullText[37] = fullText[37][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=0.05')
-        elif amaxVal == 0.1:
-            if fullText[39][0] == '#' and fullText[40][0] == '#':
-                fullText[39] = fullText[39][1:]     # Remove the pound at 0.1
-                fullText[40] = fullText[40][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=0.1')
-        elif amaxVal == 1.0:
-            if fullText[45][0] == '#' and fullText[46][0] == '#':
-                fullText[45] = fullText[45][1:]     # Remove the pound at 1.0
-                fullText[46] = fullText[46][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=1.0')
-        elif amaxVal == 2.0:
-            if fullText[48][0] == '#' and fullText[49][0] == '#':
-                fullText[48] = fullText[48][1:]     # Remove the pound at 2.0
-                fullText[49] = fullText[49][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=2.0')
-        elif amaxVal == 3.0:
-            if fullText[51][0] == '#' and fullText[52][0] == '#':
-                fullText[51] = fullText[51][1:]     # Remove the pound at 3.0
-                fullText[52] = fullText[52][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=3.0')
-        elif amaxVal == 4.0:
-            if fullText[54][0] == '#' and fullText[55][0] == '#':
-                fullText[54] = fullText[54][1:]     # Remove the pound at 4.0
-                fullText[55] = fullText[55][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=4.0')
-        elif amaxVal == 5.0:
-            if fullText[57][0] == '#' and fullText[58][0] == '#':
-                fullText[57] = fullText[57][1:]     # Remove the pound at 5.0
-                fullText[58] = fullText[58][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=5.0')
-        elif amaxVal == 10.0:
-            if fullText[60][0] == '#' and fullText[61][0] == '#':
-                fullText[60] = fullText[60][1:]     # Remove the pound at 10.0
-                fullText[61] = fullText[61][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=10.0')
-        elif amaxVal == 100.0:
-            if fullText[63][0] == '#' and fullText[64][0] == '#':
-                fullText[63] = fullText[63][1:]     # Remove the pound at 100.0
-                fullText[64] = fullText[64][1:]
-                fullText[42] = '#' + fullText[42]   # Add the pound at 0.25
-                fullText[43] = '#' + fullText[43]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at amax=100.0')
-        else:
+        # amaxs is a commented out switch (with lamaxs on the next line), so we need to know the desired size:
+        if not jobSwitch(fullText, alts, 'AMAXS', float(amaxVal), float,
+                         'JOB_FILE_CREATE: There is a comment problem at amax=%s', pair=1):
             raise ValueError('JOB_FILE_CREATE: Invalid input for AMAXS!')
     
     # Now, we examine the epsilon parameter if a value provided:
     if 'epsilon' in kwargs:
         epsVal = kwargs['epsilon']
         del kwargs['epsilon']
-        # Epsilon is a commented out switch, so we need the desired parameter:
-        if epsVal == 0.0001:
-            pass        # Default value is 0.0001
-        elif epsVal == 0.001:
-            if fullText[73][0] == '#' and fullText[74][0] == '#':
-                fullText[73] = fullText[73][1:]     # Remove the pound at 0.001
-                fullText[74] = fullText[74][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.001')
-        elif epsVal == 0.01:
-            if fullText[76][0] == '#' and fullText[77][0] == '#':
-                fullText[76] = fullText[76][1:]     # Remove the pound at 0.01
-                fullText[77] = fullText[77][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.01')
-        elif epsVal == 0.1:
-            if fullText[79][0] == '#' and fullText[80][0] == '#':
-                fullText[79] = fullText[79][1:]     # Remove the pound at 0.1
-                fullText[80] = fullText[80][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.1')
-        elif epsVal == 0.2:
-            if fullText[82][0] == '#' and fullText[83][0] == '#':
-                fullText[82] = fullText[82][1:]     # Remove the pound at 0.2
-                fullText[83] = fullText[83][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.2')
-        elif epsVal == 0.5:
-            if fullText[85][0] == '#' and fullText[86][0] == '#':
-                fullText[85] = fullText[85][1:]     # Remove the pound at 0.5
-                fullText[86] = fullText[86][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=0.5')
-        elif epsVal == 1.0:
-            if fullText[88][0] == '#' and fullText[89][0] == '#':
-                fullText[88] = fullText[88][1:]     # Remove the pound at 1.0
-                fullText[89] = fullText[89][1:]
-                fullText[70] = '#' + fullText[70]   # Add the pound at 0.0001
-                fullText[71] = '#' + fullText[71]
-            else:
-                raise ValueError('JOB_FILE_CREATE: There is a comment problem at eps=1.0')
-        else:
+        # Epsilon is a commented out switch (with epsilonbig on the next line):
+        if not jobSwitch(fullText, alts, 'EPS', float(epsVal), float,
+                         'JOB_FILE_CREATE: There is a comment problem at eps=%s', pair=1):
             raise ValueError('JOB_FILE_CREATE: Invalid input for epsilon!')
     
     # Now we can cycle through the easier changes desired:
-    if 'mstar' in kwargs:                           # Stellar mass parameter
-        mstarVal = kwargs['mstar']
-        del kwargs['mstar']
-        fullText[15] = fullText[15][:11] + str(mstarVal) + fullText[15][-11:]
-    if 'tstar' in kwargs:                           # Photosphere temp parameter
-        tstarVal = kwargs['tstar']
-        del kwargs['tstar']
-        fullText[16] = fullText[16][:11] + str(tstarVal) + fullText[16][-8:]
-    if 'rstar' in kwargs:                           # Stellar radius parameter
-        rstarVal = kwargs['rstar']
-        del kwargs['rstar']
-        fullText[17] = fullText[17][:11] + str(rstarVal) + fullText[17][-12:]
-    if 'dist' in kwargs:                            # Stellar distance parameter
-        distVal = kwargs['dist']
-        del kwargs['dist']
-        fullText[18] = fullText[18][:15] + str(distVal) + fullText[18][-14:]
-    if 'mdot' in kwargs:                            # Accretion rate parameter
-        mdotVal = kwargs['mdot']
-        del kwargs['mdot']
-        fullText[19] = fullText[19][:10] + str(mdotVal) + fullText[19][-15:]
+    setnames = {'mstar':'MSTAR', 'tstar':'TSTAR', 'rstar':'RSTAR', 'dist':'DISTANCIA', 'mdot':'MDOT',
+                'alpha':'ALPHA', 'mui':'MUI', 'rdisk':'RDISK', 'labelend':'labelend', 'altinh':'ALTINH',
+                'fracolive':'AMORPFRAC_OLIVINE', 'fracpyrox':'AMORPFRAC_PYROXENE',
+                'fracforst':'FORSTERITE_FRAC', 'fracent':'ENSTATITE_FRAC'}
+    for key in setnames:
+        if key in kwargs:
+            jobSet(fullText, alts, setnames[key], kwargs[key], 'JOB_FILE_CREATE')
+            del kwargs[key]
+    # The shock and wall temperatures must be integers followed by a '.':
     if 'tshock' in kwargs:                          # Shock temp parameter
-        tshockVal = kwargs['tshock']
+        jobSet(fullText, alts, 'TSHOCK', str(int(kwargs['tshock'])) + '.', 'JOB_FILE_CREATE')
         del kwargs['tshock']
-        fullText[22] = fullText[22][:11] + str(int(tshockVal)) + '.\n'
-    if 'alpha' in kwargs:                           # Alpha viscosity parameter
-        alphaVal = kwargs['alpha']
-        del kwargs['alpha']
-        fullText[25] = fullText[25][:11] + str(alphaVal) + fullText[25][-3:]
-    if 'mui' in kwargs:                             # Cosine of inclination
-        muiVal = kwargs['mui']
-        del kwargs['mui']
-        fullText[26] = fullText[26][:9] + str(muiVal) + fullText[26][-32:]
-    if 'rdisk' in kwargs:                           # Outer disk radius parameter
-        rdiskVal = kwargs['rdisk']
-        del kwargs['rdisk']
-        fullText[31] = fullText[31][:11] + str(rdiskVal) + fullText[31][-31:]
-    if 'labelend' in kwargs:                        # Labelend on output files
-        labelVal = kwargs['labelend']
-        del kwargs['labelend']
-        fullText[146] = fullText[146][:14] + str(labelVal) + fullText[146][-2:]
     if 'temp' in kwargs:                            # Inner wall temp parameter
-        tempVal = kwargs['temp']
+        jobSet(fullText, alts, 'TEMP', str(int(kwargs['temp'])) + '.', 'JOB_FILE_CREATE')
         del kwargs['temp']
-        fullText[29] = fullText[29][:9] + str(int(tempVal)) + fullText[29][-50:]
-    if 'altinh' in kwargs:                          # Inner wall height parameter
-        altVal = kwargs['altinh']
-        del kwargs['altinh']
-        fullText[30] = fullText[30][:11] + str(altVal) + fullText[30][-24:]
-    if 'fracolive' in kwargs:                       # Fractional abundance of olivine
-        olivVal = kwargs['fracolive']
-        del kwargs['fracolive']
-        fullText[125] = fullText[125][:23] + str(olivVal) + fullText[125][26:]
-    if 'fracpyrox' in kwargs:                       # Fractional abundance of pyroxene
-        pyroVal = kwargs['fracpyrox']
-        del kwargs['fracpyrox']
-        fullText[126] = fullText[126][:24] + str(pyroVal) + fullText[126][27:]
-    if 'fracforst' in kwargs:                       # Fractional abundance of forsterite
-        forstVal = kwargs['fracforst']
-        del kwargs['fracforst']
-        fullText[127] = fullText[127][:21] + str(forstVal) + fullText[127][24:]
-    if 'fracent' in kwargs:                         # Fractional abundance of enstatite
-        enstVal = kwargs['fracent']
-        del kwargs['fracent']
-        fullText[128] = fullText[128][:20] + str(enstVal) + fullText[128][23:]
     if iwall:
         # If an inner wall job is desired, turn off all but isilcom and iwalldust:
-        fullText[153] = fullText[153][:-3] + '0' + fullText[153][-2:]   # IPHOT
-        fullText[165] = fullText[165][:-3] + '0' + fullText[165][-2:]   # IOPA
-        fullText[170] = fullText[170][:-3] + '0' + fullText[170][-2:]   # IVIS
-        fullText[176] = fullText[176][:-3] + '0' + fullText[176][-2:]   # IIRR
-        fullText[179] = fullText[179][:-5] + '0' + fullText[179][-4:]   # IPROP
-        fullText[191] = fullText[191][:-3] + '0' + fullText[191][-2:]   # ISEDT
+        for switch in ['IPHOT', 'IOPA', 'IVIS', 'IIRR', 'IPROP', 'ISEDT']:
+            jobSet(fullText, alts, switch, '0', 'JOB_FILE_CREATE')
     
     # Once all changes have been made, we just create a new job file:
     if high:
@@ -862,7 +925,7 @@ def job_optthin_create(jobn, path, high=0, **kwargs):
         rstar - radius of protostar
         dist - distance to the protostar (or likely, the cluster it's in)
         mui - the cosine of the inclination angle
-        rdisk - the outer radius
+        rout - the outer radius
         rin - the inner radius
         labelend - the labelend of all output files when job file is run
         tau - optical depth, I think
@@ -885,12 +948,15 @@ def job_optthin_create(jobn, path, high=0, **kwargs):
     
     # First, load in the sample job file for a template:
     job_file = open(path+'job_optthin_sample', 'r')
-    fullText = job_file.readlines()     # All text in a list of strings
+    params, alts, fullText = jobParse(job_file.read())     # All text in a list of strings
     job_file.close()
     
-    # Double check for the correct default amax value:
-    if fullText[30][0] == '#':
-        raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 0.25!')
+    # The grain size is given in the job file as e.g. amax0p25, or amax1mm:
+    def lamaxVal(lamax):
+        lamax = str(lamax).replace('amax', '', 1)
+        if lamax == '1mm':
+            return 1000.0
+        return float(lamax.replace('p', '.'))
     
     # Now we run through the list of changes desired and change them:
     # If we want to change amax:
@@ -898,132 +964,23 @@ def job_optthin_create(jobn, path, high=0, **kwargs):
         amaxVal = kwargs['amax']
         del kwargs['amax']
         # amax is a commented out switch, so we need to know the desired size:
-        if amaxVal == 0.25:
-            pass
-        elif amaxVal == 0.05 or amaxVal == '0p05':
-            if fullText[28][0] == '#':
-                fullText[28] = fullText[28][1:]     # Remove the pound at 0.05
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 0.05!')
-        elif amaxVal == 0.1 or amaxVal == '0p1':
-            if fullText[29][0] == '#':
-                fullText[29] = fullText[29][1:]     # Remove the pound at 0.1
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 0.1!')
-        elif amaxVal == 1.0 or amaxVal == '1p0':
-            if fullText[31][0] == '#':
-                fullText[31] = fullText[31][1:]     # Remove the pound at 1.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 1.0!')
-        elif amaxVal == 2.0 or amaxVal == '2p0':
-            if fullText[32][0] == '#':
-                fullText[32] = fullText[32][1:]     # Remove the pound at 2.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 2.0!')
-        elif amaxVal == 3.0 or amaxVal == '3p0':
-            if fullText[33][0] == '#':
-                fullText[33] = fullText[33][1:]     # Remove the pound at 3.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 3.0!')
-        elif amaxVal == 4.0 or amaxVal == '4p0':
-            if fullText[34][0] == '#':
-                fullText[34] = fullText[34][1:]     # Remove the pound at 4.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 4.0!')
-        elif amaxVal == 5.0 or amaxVal == '5p0':
-            if fullText[35][0] == '#':
-                fullText[35] = fullText[35][1:]     # Remove the pound at 5.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 5.0!')
-        elif amaxVal == 10.0 or amaxVal == '10':
-            if fullText[36][0] == '#':
-                fullText[36] = fullText[36][1:]     # Remove the pound at 10.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 10!')
-        elif amaxVal == 100.0 or amaxVal == '100':
-            if fullText[37][0] == '#':
-                fullText[37] = fullText[37][1:]     # Remove the pound at 100.0
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 100!')
-        elif amaxVal == 1000.0 or amaxVal == '1mm':
-            if fullText[38][0] == '#':
-                fullText[38] = fullText[38][1:]     # Remove the pound at 1mm
-                fullText[30] = '#' + fullText[30]   # Add the pound at 0.25
-            else:
-                raise ValueError('JOB_OPTTHIN_CREATE: There is a comment problem at amax = 1mm!')
-        else:
+        try:
+            amaxVal = lamaxVal(amaxVal)
+        except ValueError:
+            raise ValueError('JOB_OPTTHIN_CREATE: Invalid input for AMAX!')
+        if not jobSwitch(fullText, alts, 'lamax', amaxVal, lamaxVal,
+                         'JOB_OPTTHIN_CREATE: There is a comment problem at amax = %s!'):
             raise ValueError('JOB_OPTTHIN_CREATE: Invalid input for AMAX!')
     
-    # Now we can cycle through the easier changes desired:    
-    if 'labelend' in kwargs:                        # Labelend for output files
-        labelVal = kwargs['labelend']
-        del kwargs['labelend']
-        fullText[5] = fullText[5][:14] + str(labelVal) + fullText[5][-27:]
-    if 'tstar' in kwargs:                           # Stellar effective temperature
-        tstarVal = kwargs['tstar']
-        del kwargs['tstar']
-        fullText[8] = fullText[8][:10] + str(tstarVal) + fullText[8][-42:]
-    if 'rstar' in kwargs:                           # Stellar radius (solar units)
-        rstarVal = kwargs['rstar']
-        del kwargs['rstar']
-        fullText[9] = fullText[9][:10] + str(rstarVal) + fullText[9][-43:]
-    if 'dist' in kwargs:                            # Distance (in pc)
-        distVal = kwargs['dist']
-        del kwargs['dist']
-        fullText[10] = fullText[10][:15] + str(distVal) + fullText[10][-25:]
-    if 'mui' in kwargs:                             # Cosine of inclination angle
-        muiVal = kwargs['mui']
-        del kwargs['mui']
-        fullText[13] = fullText[13][:9] + str(muiVal) + fullText[13][-54:]
-    if 'rout' in kwargs:                            # Outer radius
-        routVal = kwargs['rout']
-        del kwargs['rout']
-        fullText[14] = fullText[14][:10] + str(routVal) + fullText[14][-21:]
-    if 'rin' in kwargs:                             # Inner radius
-        rinVal = kwargs['rin']
-        del kwargs['rin']
-        fullText[15] = fullText[15][:9] + str(rinVal) + fullText[15][-26:]
-    if 'tau' in kwargs:                             # Optical depth
-        tauVal = kwargs['tau']
-        del kwargs['tau']
-        fullText[17] = fullText[17][:12] + str(tauVal) + fullText[17][-4:]
-    if 'power' in kwargs:                           # No idea what this one is, hah.
-        powVal = kwargs['power']
-        del kwargs['power']
-        fullText[18] = fullText[18][:11] + str(powVal) + fullText[18][-2:]
-    if 'fudgeorg' in kwargs:                        # No idea what this is either...
-        orgVal = kwargs['fudgeorg']
-        del kwargs['fudgeorg']
-        fullText[19] = fullText[19][:14] + str(orgVal) + fullText[19][-2:]
-    if 'fudgetroi' in kwargs:                       # Or this...
-        troiVal = kwargs['fudgetroi']
-        del kwargs['fudgetroi']
-        fullText[20] = fullText[20][:15] + str(troiVal) + fullText[20][-2:]
-    if 'fracsil' in kwargs:                         # Fraction of silicates by mass
-        fsilVal = kwargs['fracsil']
-        del kwargs['fracsil']
-        fullText[21] = fullText[21][:13] + str(fsilVal) + fullText[21][-4:]
-    if 'fracent' in kwargs:                         # Fraction of enstatite by mass
-        fentVal = kwargs['fracent']
-        del kwargs['fracent']
-        fullText[22] = fullText[22][:13] + str(fentVal) + fullText[22][-2:]
-    if 'fracforst' in kwargs:                       # Fraction of forsterite by mass
-        forstVal = kwargs['fracforst']
-        del kwargs['fracforst']
-        fullText[23] = fullText[23][:15] + str(forstVal) + fullText[23][-2:]
-    if 'fracamc' in kwargs:                         # Fraction of amorphous carbon by mass
-        famcVal = kwargs['fracamc']
-        del kwargs['fracamc']
-        fullText[24] = fullText[24][:13] + str(famcVal) + fullText[24][-2:]
+    # Now we can cycle through the easier changes desired:
+    setnames = {'labelend':'labelend', 'tstar':'TSTAR', 'rstar':'RSTAR', 'dist':'DISTANCIA', 'mui':'MUI',
+                'rout':'ROUT', 'rin':'RIN', 'tau':'TAUMIN', 'power':'POWER', 'fudgeorg':'FUDGEORG',
+                'fudgetroi':'FUDGETROI', 'fracsil':'FRACSIL', 'fracent':'FRACENT', 'fracforst':'FRACFORST',
+                'fracamc':'FRACAMC'}
+    for key in setnames:
+        if key in kwargs:
+            jobSet(fullText, alts, setnames[key], kwargs[key], 'JOB_OPTTHIN_CREATE')
+            del kwargs[key]
     
     # Once all changes have been made, we just create a new optthin job file:
     if high:
@@ -1041,23 +998,19 @@ def job_optthin_create(jobn, path, high=0, **kwargs):
     
     return
 
-def model_rchi2(objname, model, path):
+def obsPrep(objectObs):
     """
-    Calculates a reduced chi-squared goodness of fit.
+    Builds the sorted wavelength and flux vectors of the observations used for fitting, along with their weights.
     
     INPUTS
-    objname: The name of the object to match for observational data.
-    model: The model to test. Must be an instance of TTS_Model(), with a calculated total.
-    path: The path containing the observations.
+    objectObs: The observations. Must be an instance of TTS_Obs() (or Red_Obs()).
     
     OUTPUT
-    rchi_sq: The value for the reduced chi-squared test on the model.
+    wavelength: The sorted wavelengths of the photometry (without DCT data and upper limits) and spectra.
+    flux: The corresponding fluxes, with any NaNs removed.
+    weights: The weight of each point in the reduced chi-squared.
     """
     
-    # Read in observations:
-    objectObs   = loadPickle(objname, picklepath=path)
-    
-    # Get the model and observations onto the same wavelength vector:
     wavelength  = np.array([], dtype=float)
     flux        = np.array([], dtype=float)
     # Build the observations flux and wavelength vectors:
@@ -1079,8 +1032,6 @@ def model_rchi2(objname, model, path):
         badVals = np.where(np.isnan(flux))      # Where the NaNs are located
         flux    = np.delete(flux, badVals)
         wavelength = np.delete(wavelength, badVals)
-    # Interpolate so the observations and model are on the same grid:
-    modelFlux   = np.interp(wavelength, model.data['wl'], model.data['total'])
     
     # The tough part -- figuring out the proper weights. Let's take a stab:
     weights     = np.ones(len(wavelength))      # Start with all ones
@@ -1090,12 +1041,820 @@ def model_rchi2(objname, model, path):
     #weights[wavelength <= 22]  = 75            # These weights good for opt. thin dust comparisons
     #weights[wavelength <= 1] = 1
     
+    return wavelength, flux, weights
+
+def model_rchi2(objname, model, path):
+    """
+    Calculates a reduced chi-squared goodness of fit.
+    
+    INPUTS
+    objname: The name of the object to match for observational data. Can also be the TTS_Obs() instance itself, so
+             that the pickle is not read again for every model.
+    model: The model to test. Must be an instance of TTS_Model(), with a calculated total.
+    path: The path containing the observations.
+    
+    OUTPUT
+    rchi_sq: The value for the reduced chi-squared test on the model.
+    """
+    
+    # Read in observations:
+    if isinstance(objname, TTS_Obs):
+        objectObs = objname
+    else:
+        objectObs = loadPickle(objname, picklepath=path)
+    wavelength, flux, weights = obsPrep(objectObs)
+    
+    # Interpolate so the observations and model are on the same grid:
+    modelFlux   = np.interp(wavelength, model.data['wl'], model.data['total'])
+    
     # Calculate the reduced chi-squared value for the model:
     chi_arr     = (flux - modelFlux) * weights / flux
     rchi_sq     = np.sum(chi_arr*chi_arr) / (len(chi_arr) - 1.)
     
     return rchi_sq
 
+def interpWeights(wl, wavelength):
+    """
+    Finds the model points bracketing each of the given wavelengths, so that many models on the same wavelength
+    grid can be interpolated at once: np.interp(wavelength, wl, f) equals f[lo]*(1-frac) + f[hi]*frac, including
+    the clamping to the end values outside of wl.
+    
+    INPUTS
+    wl: The (increasing) model wavelength array.
+    wavelength: The wavelengths to interpolate onto.
+    
+    OUTPUT
+    lo: Index of the model point at or below each wavelength.
+    hi: Index of the model point above each wavelength.
+    frac: The fraction of the way from wl[lo] to wl[hi] of each wavelength.
+    """
+    
+    wl          = np.asarray(wl, dtype=float)
+    wavelength  = np.asarray(wavelength, dtype=float)
+    hi          = np.clip(np.searchsorted(wl, wavelength, side='right'), 0, len(wl)-1)
+    lo          = np.clip(hi - 1, 0, len(wl)-1)
+    step        = wl[hi] - wl[lo]
+    frac        = np.zeros(len(wavelength))
+    inside      = step > 0
+    frac[inside] = (wavelength[inside] - wl[lo][inside]) / step[inside]
+    frac        = np.clip(frac, 0.0, 1.0)
+    # Past the last model point, np.interp uses the last value:
+    frac[wavelength >= wl[-1]] = 1.0
+    
+    return lo, hi, frac
+
+interpCache     = OrderedDict()
+
+def interpOperator(wl, wavelength, cachesize=16):
+    """
+    Makes the sparse matrix that interpolates model fluxes on the wavelengths wl onto the given wavelengths (with the
+    weights of interpWeights). Applying it to a whole stack of models is then a single product:
+    modelFlux = (operator * totals.T).T gives the same as np.interp(wavelength, wl, total) for each model.
+    
+    The operators are cached by the length and end points of both wavelength arrays, and a cached operator is only
+    used if its arrays are equal to the ones given, so new observations (or a new model grid) get a new operator while
+    repeated fits reuse the old one.
+    
+    INPUTS
+    wl: The (increasing) model wavelength array.
+    wavelength: The wavelengths to interpolate onto.
+    cachesize: The number of operators to keep in the cache.
+    
+    OUTPUT
+    operator: A scipy.sparse CSR matrix of shape (len(wavelength), len(wl)).
+    """
+    
+    wl          = np.asarray(wl, dtype=float)
+    wavelength  = np.asarray(wavelength, dtype=float)
+    key         = (len(wl), wl[0], wl[-1], len(wavelength), wavelength[0], wavelength[-1])
+    if key in interpCache:
+        cachedWl, cachedWavelength, operator = interpCache.pop(key)
+        if np.array_equal(cachedWl, wl) and np.array_equal(cachedWavelength, wavelength):
+            interpCache[key] = (cachedWl, cachedWavelength, operator)     # Move it to the most recently used end
+            return operator
+    
+    lo, hi, frac = interpWeights(wl, wavelength)
+    points      = np.arange(len(wavelength))
+    operator    = sparse.csr_matrix((np.concatenate((1-frac, frac)),
+                                     (np.concatenate((points, points)), np.concatenate((lo, hi)))),
+                                    shape=(len(wavelength), len(wl)))
+    operator.eliminate_zeros()
+    
+    interpCache[key] = (wl.copy(), wavelength.copy(), operator)
+    while len(interpCache) > cachesize:
+        interpCache.popitem(last=False)
+    
+    return operator
+
+def pair_totals(walls, disks, extinction, wl=None, wavelength=None, maxbytes=64*2**20):
+    """
+    Combines every inner wall with every outer disk of a pre-transitional disk grid at once. The total of each pair is
+    the disk total plus the inner wall attenuated by the disk's self-extinction (as in PTD_Model.dataInit), computed by
+    broadcasting over blocks of pairs so that no more than about maxbytes are used at a time.
+    
+    Stacks of components can be taken from a ModelGrid, e.g. for walls w and disks d of a grid:
+    walls = grid.component('iwall')[w], extinction = grid.component('extcorr')[d], and disks the sum of the 'phot',
+    'iwall' (the outer wall, for the disk jobs), 'disk' and 'scatt' components of d.
+    
+    INPUTS
+    walls: Array (walls x wavelengths) of the inner wall fluxes.
+    disks: Array (disks x wavelengths) of the total fluxes of the disks without the inner wall.
+    extinction: Array (disks x wavelengths) of the self-extinction (EXTAXIS) of the disks.
+    wl: The wavelength array shared by all of the models. Only needed with wavelength.
+    wavelength: If not None, the pair totals are interpolated onto these wavelengths (e.g. those of the observations).
+                Only the model points needed for the interpolation are computed.
+    maxbytes: The approximate memory each block of pairs may use.
+    
+    OUTPUT
+    A generator of (wallSlice, diskSlice, totals) for each block, where totals is an array of
+    (walls in wallSlice) x (disks in diskSlice) x wavelengths.
+    """
+    
+    walls       = np.atleast_2d(np.asarray(walls, dtype=float))
+    disks       = np.atleast_2d(np.asarray(disks, dtype=float))
+    extinction  = np.atleast_2d(np.asarray(extinction, dtype=float))
+    if disks.shape != extinction.shape or walls.shape[1] != disks.shape[1]:
+        raise ValueError('PAIR_TOTALS: The walls, disks and extinction must all have the same number of wavelengths!')
+    
+    attenuation = np.exp(-1*extinction)         # Computed once per disk instead of once per pair
+    if wavelength is None:
+        base    = disks
+        npoints = disks.shape[1]
+    else:
+        if wl is None:
+            raise ValueError('PAIR_TOTALS: The model wavelengths (wl) are needed to interpolate the totals.')
+        lo, hi, frac = interpWeights(wl, wavelength)
+        # Keep only the model points the interpolation uses:
+        cols, where = np.unique(np.concatenate((lo, hi)), return_inverse=True)
+        lo, hi  = where[:len(lo)], where[len(lo):]
+        walls   = walls[:, cols]
+        attenuation = attenuation[:, cols]
+        disks   = disks[:, cols]
+        base    = disks[:, lo]*(1-frac) + disks[:, hi]*frac
+        npoints = len(frac)
+    
+    # Work out how many pairs fit in one block:
+    pairs       = max(1, maxbytes // (8 * 2 * (walls.shape[1] + npoints)))
+    ndisk       = int(min(len(disks), pairs))
+    nwall       = int(max(1, pairs // ndisk))
+    
+    for w0 in range(0, len(walls), nwall):
+        wallSlice = slice(w0, min(w0+nwall, len(walls)))
+        for d0 in range(0, len(disks), ndisk):
+            diskSlice = slice(d0, min(d0+ndisk, len(disks)))
+            totals = walls[wallSlice, np.newaxis, :] * attenuation[np.newaxis, diskSlice, :]
+            if wavelength is not None:
+                totals = totals[..., lo]*(1-frac) + totals[..., hi]*frac
+            totals += base[np.newaxis, diskSlice, :]
+            yield wallSlice, diskSlice, totals
+
+def pair_rchi2(walls, disks, extinction, wl, wavelength, flux, weights, maxbytes=64*2**20):
+    """
+    Calculates the reduced chi-squared (as in model_rchi2) of every inner wall and outer disk pair of a
+    pre-transitional disk grid, without ever holding all of the pair totals in memory.
+    
+    INPUTS
+    walls: Array (walls x wavelengths) of the inner wall fluxes.
+    disks: Array (disks x wavelengths) of the total fluxes of the disks without the inner wall.
+    extinction: Array (disks x wavelengths) of the self-extinction (EXTAXIS) of the disks.
+    wl: The wavelength array shared by all of the models.
+    wavelength, flux, weights: The observations, as returned by obsPrep().
+    maxbytes: The approximate memory each block of pairs may use.
+    
+    OUTPUT
+    rchi_sq: Array (walls x disks) of the reduced chi-squared of each pair.
+    """
+    
+    walls       = np.atleast_2d(walls)
+    disks       = np.atleast_2d(disks)
+    rchi_sq     = np.zeros((len(walls), len(disks)))
+    scale       = np.asarray(weights, dtype=float) / np.asarray(flux, dtype=float)
+    for wallSlice, diskSlice, totals in pair_totals(walls, disks, extinction, wl=wl, wavelength=wavelength,
+                                                    maxbytes=maxbytes):
+        chi_arr = (flux - totals) * scale
+        rchi_sq[wallSlice, diskSlice] = np.sum(chi_arr*chi_arr, axis=2) / (len(flux) - 1.)
+    
+    return rchi_sq
+
+def calc_totals(models, components=None, mask=None, scales=None, out=None, rows=None):
+    """
+    Calculates the total fluxes of many models at once, as calc_total does for one. Each requested component is
+    scaled per model and accumulated in place into a single models x wavelengths array.
+    
+    INPUTS
+    models: Either a ModelGrid, or a list of TTS_Model/PTD_Model objects whose data have been initialized. The models
+            must all have the same number of wavelengths (padded models of a ModelGrid are NaN past their end).
+    components: List of the data keys to add up. If None, uses every flux component ('phot', 'iwall', 'owall',
+                'disk', 'scatt', 'dust') present. A component a model does not have is skipped for that model.
+    mask: Boolean array (models x components) of which components to add for each model. If None, adds all of them.
+    scales: Dictionary of data key -> scale factor (a number or an array with one factor per model) to multiply that
+            component by, e.g. {'iwall': altinh} in place of the altinh keyword of calc_total.
+    out: An array (models x wavelengths) to write the totals into, instead of allocating a new one.
+    rows: For a ModelGrid, the indices of the models to use. If None, uses all of them.
+    
+    OUTPUT
+    totals: Array (models x wavelengths) of the total fluxes.
+    """
+    
+    if scales is None:
+        scales  = {}
+    
+    if isinstance(models, ModelGrid):
+        if rows is None:
+            rows = np.arange(len(models))
+        rows    = np.asarray(rows)
+        if components is None:
+            components = [key for key in models.comps if key not in ['wl', 'extcorr']]
+        for key in components:
+            if key not in models.comps:
+                raise KeyError('CALC_TOTALS: ' + key + ' is not a component of the grid.')
+        nmodels = len(rows)
+        nwl     = models.flux.shape[2]
+        present = np.array([models.present[rows, models.comps.index(key)] for key in components]).T
+    else:
+        if components is None:
+            components = ['phot', 'iwall', 'owall', 'disk', 'scatt', 'dust']
+        nmodels = len(models)
+        nwl     = len(models[0].data['wl'])
+        for model in models:
+            if len(model.data['wl']) != nwl:
+                raise ValueError('CALC_TOTALS: The models must all have the same number of wavelengths!')
+        present = np.array([[key in model.data for key in components] for model in models]).reshape(nmodels, -1)
+    
+    if mask is None:
+        use     = present
+    else:
+        use     = present & np.asarray(mask, dtype=bool).reshape(nmodels, len(components))
+    
+    if out is None:
+        out     = np.zeros((nmodels, nwl), dtype=float)
+    elif out.shape != (nmodels, nwl):
+        raise ValueError('CALC_TOTALS: out must have shape ' + str((nmodels, nwl)))
+    else:
+        out[:]  = 0.0
+    
+    # One work buffer is reused for every component of a grid:
+    if isinstance(models, ModelGrid):
+        buff    = np.empty((nmodels, nwl), dtype=float)
+    for c, key in enumerate(components):
+        if not np.any(use[:, c]):
+            continue
+        scale   = np.ones(nmodels) * scales.get(key, 1.0)
+        if isinstance(models, ModelGrid):
+            np.take(models.component(key), rows, axis=0, out=buff)
+            if key in scales:
+                buff *= scale[:, np.newaxis]
+            buff[~use[:, c]] = 0.0
+            out += buff
+        else:
+            for i in np.where(use[:, c])[0]:
+                if key in scales:
+                    out[i] += models[i].data[key] * scale[i]
+                else:
+                    out[i] += models[i].data[key]
+    
+    return out
+
+def gridInterp(grid, totals, wavelength, rows=None):
+    """
+    Interpolates the total fluxes of the models of a grid onto the given wavelengths, like np.interp does for a single
+    model. Models sharing a wavelength array (usually all of them) are interpolated together. Only when they don't all
+    share one are they grouped by their wavelengths.
+    
+    INPUTS
+    grid: The ModelGrid the totals come from.
+    totals: Array (models x wavelengths) of the total fluxes, e.g. from calc_totals().
+    wavelength: The wavelengths to interpolate onto.
+    rows: The indices in the grid of the models in totals. If None, totals has every model of the grid.
+    
+    OUTPUT
+    modelFlux: Array (models x len(wavelength)) of the interpolated fluxes.
+    """
+    
+    if rows is None:
+        rows    = np.arange(len(grid))
+    rows        = np.asarray(rows)
+    modelFlux   = np.zeros((len(rows), len(wavelength)))
+    if len(rows) == 0:
+        return modelFlux
+    
+    # Usually the models all share one wavelength array, and are interpolated with a single operator:
+    try:
+        wl      = _gridWavelength(grid, rows, 'GRIDINTERP')
+    except ValueError:
+        wl      = None
+    if wl is not None:
+        modelFlux[:] = (interpOperator(wl, wavelength) * totals[:, :len(wl)].T).T
+        return modelFlux
+    
+    # Otherwise, group the models by their wavelength array:
+    wls         = grid.component('wl')
+    groups      = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(wls[row, :grid.nwl[row]].tostring(), []).append(i)
+    for members in groups.values():
+        row     = rows[members[0]]
+        operator = interpOperator(wls[row, :grid.nwl[row]], wavelength)
+        block   = totals[members, :grid.nwl[row]]
+        modelFlux[members] = (operator * block.T).T
+    
+    return modelFlux
+
+def fit_grid(obs, grid, components=None, mask=None, scales=None, rows=None, obspath=datapath, workers=1, free=None,
+             dust=0, dust_high=0):
+    """
+    Calculates the reduced chi-squared goodness of fit (the same one as model_rchi2) of every model of a grid at once.
+    The observations are only prepared once, and the chi-squared of all of the models is a single array operation.
+    
+    INPUTS
+    obs: The observations. Either a TTS_Obs() instance, or the name of the object to load the pickle of.
+    grid: The ModelGrid of the models to fit.
+    components, mask, scales: Which components make up the total flux of each model, and how they are scaled. See
+                              calc_totals(). By default, the total is made like calc_total does.
+    rows: The indices in the grid of the models to fit. If None, fits all of them.
+    obspath: The path containing the observations pickle, if obs is a name.
+    workers: The number of processes to split the models between. If None, uses one process per CPU. If more than 1,
+             the grid's flux array is moved to shared memory (see ModelGrid.share) the first time, and stays there for
+             any later fits, so the processes all use it without copying it. This relies on the processes being forked: the state of the fit,
+             including the grid, is handed to them through the initargs of the Pool rather than pickled for each chunk,
+             so it does not work where processes are spawned (e.g. on Windows).
+    free: List of the components (including 'dust') whose amplitudes are fit for each model, instead of being fixed.
+          The total flux is linear in them, so the best non-negative amplitudes are solved for directly (see
+          fit_amplitudes) rather than searched for by hand with calc_total(altinh=...) and model_rchi2.
+    dust: INTEGER -- if not 0, the job number of an optically thin dust model in the grid's directory to add to every
+          model, like the dust keyword of calc_total.
+    dust_high: BOOLEAN -- if 1 (True), will look for a 4 digit valued dust file.
+    
+    OUTPUT
+    results: An astropy Table with the JOBNUM and RCHI2 of each model, the fit amplitude of each free component (as
+             SCALE_IWALL, SCALE_DUST, etc.), and then its header parameters, sorted from the best fit to the worst.
+    """
+    
+    if not isinstance(obs, TTS_Obs):
+        obs     = loadPickle(obs, picklepath=obspath)
+    wavelength, flux, weights = obsPrep(obs)
+    
+    if rows is None:
+        rows    = np.arange(len(grid))
+    rows        = np.asarray(rows)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if components is None:
+        components = [key for key in grid.comps if key not in ['wl', 'extcorr']]
+    if free is None:
+        free    = []
+    for key in free:
+        if key not in components and key != 'dust':
+            raise ValueError('FIT_GRID: Free component ' + key + ' is not one of the components being added!')
+    if 'dust' in free and dust == 0:
+        raise ValueError('FIT_GRID: A dust job is needed to fit the dust amplitude.')
+    
+    # The optically thin dust is the same for every model, so it is interpolated onto the observations only once:
+    dustFlux    = None
+    if dust != 0:
+        try:
+            dustNum = numCheck(dust, high=dust_high)
+        except:
+            raise ValueError('FIT_GRID: Error! Dust input not a valid integer')
+        dustfile = grid.dpath + grid.name + '_OTD_' + dustNum + '.fits'
+        
+        def reader():
+            header, data = fits.getheader(dustfile), fits.getdata(dustfile)
+            return {'WLAXIS': data[header['WLAXIS'],:], 'LFLAXIS': data[header['LFLAXIS'],:]}
+        
+        dustComps = componentCache.fetch(dustfile, dustNum, ['WLAXIS', 'LFLAXIS'], reader)
+        dustFlux = interpOperator(dustComps['WLAXIS'], wavelength) * dustComps['LFLAXIS']
+    
+    state       = {'grid': grid, 'rows': rows, 'wavelength': wavelength, 'flux': flux, 'weights': weights,
+                   'components': components, 'mask': mask, 'scales': scales, 'free': free, 'dust': dustFlux}
+    if workers == 1 or len(rows) <= 1:
+        rchi_sq = _fitChunk(np.arange(len(rows)), state)
+    else:
+        # The flux array is only copied into shared memory the first time; later fits of the grid reuse it:
+        grid.share()
+        chunks  = np.array_split(np.arange(len(rows)), min(len(rows), 4*workers))
+        pool    = multiprocessing.Pool(processes=min(workers, len(chunks)), initializer=_fitInit, initargs=(state,))
+        try:
+            rchi_sq = np.concatenate(pool.map(_fitChunk, chunks, 1))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    
+    return fitTable(grid, rows, rchi_sq[:, 0], rchi_sq[:, 1:], free)
+
+# The fit_grid() inputs of each worker process, set when the process starts:
+_fitState       = None
+
+def _fitInit(state):
+    global _fitState
+    _fitState   = state
+
+def _fitChunk(positions, state=None):
+    """
+    Fits the models at the given positions of the rows being fit by fit_grid(). Returns an array with the reduced
+    chi-squared of each model in the first column, followed by the amplitudes of the free components.
+    """
+    
+    if state is None:
+        state   = _fitState
+    grid, rows, components = state['grid'], state['rows'][positions], state['components']
+    flux, free  = state['flux'], state['free']
+    
+    # Take the part of the mask and per-model scales that goes with these models:
+    mask        = state['mask']
+    if mask is None:
+        mask    = np.ones((len(rows), len(components)), dtype=bool)
+    else:
+        mask    = np.asarray(mask, dtype=bool).reshape(len(state['rows']), -1)[positions]
+    scales      = state['scales']
+    if scales is not None:
+        scales  = dict((key, value[positions] if np.ndim(value) else value) for key, value in scales.items())
+    
+    # Add up the fixed components (and the dust, if its amplitude is fixed):
+    fixed       = [c for c, key in enumerate(components) if key not in free]
+    totals      = calc_totals(grid, components=[components[c] for c in fixed], mask=mask[:, fixed], scales=scales,
+                              rows=rows)
+    modelFlux   = gridInterp(grid, totals, state['wavelength'], rows=rows)
+    if state['dust'] is not None and 'dust' not in free:
+        modelFlux += state['dust']
+    
+    scale       = state['weights'] / flux
+    if len(free) == 0:
+        # Calculate the reduced chi-squared values for these models:
+        chi_arr = (flux - modelFlux) * scale
+        return (np.sum(chi_arr*chi_arr, axis=1) / (len(flux) - 1.))[:, np.newaxis]
+    
+    # Otherwise, each free component is a column of the weighted least-squares problem of each model:
+    design      = np.zeros((len(rows), len(flux), len(free)))
+    for k, key in enumerate(free):
+        if key == 'dust':
+            design[:, :, k] = state['dust']
+        else:
+            c   = components.index(key)
+            part = calc_totals(grid, components=[key], mask=mask[:, [c]], scales=scales, rows=rows)
+            design[:, :, k] = gridInterp(grid, part, state['wavelength'], rows=rows)
+    chisq, amplitudes = fit_amplitudes(design * scale[:, np.newaxis], (flux - modelFlux) * scale)
+    
+    return np.column_stack((chisq / (len(flux) - 1.), amplitudes))
+
+def fit_amplitudes(design, target):
+    """
+    Solves the weighted least-squares problems min |target - design.amplitudes|^2 with non-negative amplitudes, for
+    a whole stack of models at once. With only a few components, the best non-negative solution is found exactly by
+    solving the normal equations on every subset of the components and keeping the best solution with no negative
+    amplitude (the best one is always the unconstrained solution on the components it leaves non-zero).
+    
+    INPUTS
+    design: Array (models x points x components) of the weighted component fluxes.
+    target: Array (models x points) of the weighted fluxes the components should make up.
+    
+    OUTPUT
+    chisq: The sum of the squared residuals of each model with its best amplitudes.
+    amplitudes: Array (models x components) of the best non-negative amplitudes.
+    """
+    
+    design      = np.asarray(design, dtype=float)
+    target      = np.asarray(target, dtype=float)
+    nmodels, npoints, ncomps = design.shape
+    normal      = np.einsum('mpk,mpl->mkl', design, design)
+    project     = np.einsum('mpk,mp->mk', design, target)
+    
+    # All amplitudes at zero is always allowed:
+    total       = np.sum(target*target, axis=1)
+    chisq       = total.copy()
+    amplitudes  = np.zeros((nmodels, ncomps))
+    
+    for subset in range(1, 2**ncomps):
+        active  = [k for k in range(ncomps) if subset & (1 << k)]
+        matrix  = normal[:, active][:, :, active]
+        vector  = project[:, active]
+        # Components that are zero (or degenerate) for a model can't be solved for; a smaller subset covers them:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            solvable = np.linalg.cond(matrix) < 1e12
+        matrix[~solvable] = np.eye(len(active))
+        solution = np.linalg.solve(matrix, vector[:, :, np.newaxis])[:, :, 0]
+        trial   = total - np.sum(solution * vector, axis=1)
+        better  = solvable & np.all(solution >= 0, axis=1) & (trial < chisq)
+        chisq[better] = trial[better]
+        amplitudes[better] = 0.0
+        amplitudes[np.ix_(better, active)] = solution[better]
+    
+    return chisq, amplitudes
+
+def benchmark_fit(obs=None, grid=None, workers=None, repeat=3, nmodels=4000, nwl=1200):
+    """
+    Times fit_grid() with 1 to N worker processes, and checks that they all give the same numbers.
+    
+    INPUTS
+    obs: The observations to fit. If None (default), a fake SED with photometry and an IRS-like spectrum is used.
+    grid: The ModelGrid to fit. If None (default), a fake grid of random models is used.
+    workers: The number of workers to time, or a list of them. If None, uses 1, 2, 4, ... up to the number of CPUs.
+    repeat: Number of times each fit is run. The best time is kept.
+    nmodels: Number of models in the fake grid. Only used if grid is None.
+    nwl: Number of wavelengths in the fake grid. Only used if grid is None.
+    
+    OUTPUT
+    Prints a table of timings, and returns a dictionary of workers -> (time, speedup).
+    """
+    
+    random      = np.random.RandomState(0)
+    if grid is None:
+        grid    = _benchmarkGrid(nmodels, nwl, random)
+    if obs is None:
+        obs     = _benchmarkObs(random)
+    if workers is None:
+        workers = [1]
+        while workers[-1]*2 <= multiprocessing.cpu_count():
+            workers.append(workers[-1]*2)
+    elif np.ndim(workers) == 0:
+        workers = [workers]
+    
+    results     = {}
+    reference   = None
+    print('WORKERS     TIME [s]     SPEEDUP')
+    for nworkers in workers:
+        best    = np.inf
+        for i in range(repeat):
+            start   = time.time()
+            fit     = fit_grid(obs, grid, workers=nworkers)
+            best    = min(best, time.time() - start)
+        if reference is None:
+            reference = (best, fit)
+        elif not np.allclose(fit['RCHI2'], reference[1]['RCHI2']):
+            print('WARNING: THE FIT WITH ' + str(nworkers) + ' WORKERS DOES NOT AGREE')
+        results[nworkers] = (best, reference[0]/best)
+        print(str(nworkers).ljust(12) + ('%.4f' % best).ljust(13) + ('%.2f' % (reference[0]/best)))
+    
+    return results
+
+def _benchmarkGrid(nmodels, nwl, random):
+    """
+    Makes a fake ModelGrid of smooth random models on a regular MDOT x ALPHA grid for the benchmarks.
+    """
+    
+    nalpha      = max(1, int(np.sqrt(nmodels)))
+    nmdot       = max(1, nmodels // nalpha)
+    nmodels     = nalpha * nmdot
+    grid        = ModelGrid.__new__(ModelGrid)
+    grid.name   = 'bench'
+    grid.dpath  = None
+    grid.comps  = [ModelGrid.axisKeys[axis] for axis in GRIDAXES]
+    grid.jobs   = np.array([numCheck(i, high=1) for i in range(nmodels)])
+    grid.nwl    = np.ones(nmodels, dtype=int) * nwl
+    grid.present = np.ones((nmodels, len(GRIDAXES)), dtype=bool)
+    grid.present[:, grid.comps.index('extcorr')] = False
+    grid.flux   = 10**random.uniform(-11, -9, (nmodels, len(GRIDAXES), 1)) * np.ones((1, 1, nwl))
+    grid.flux  *= 1 + 0.1*random.uniform(-1, 1, (nmodels, len(GRIDAXES), nwl))
+    grid.flux[:, 0, :] = np.logspace(-1, 3.3, nwl)
+    grid.flux[:, grid.comps.index('extcorr'), :] = np.nan
+    grid.params = np.rec.fromarrays([np.repeat(np.logspace(-10, -7, nmdot), nalpha),
+                                     np.tile(np.logspace(-4, -1, nalpha), nmdot)], names='MDOT,ALPHA')
+    return grid
+
+def _benchmarkObs(random):
+    """
+    Makes a fake TTS_Obs() with photometry and an IRS-like spectrum for the benchmarks.
+    """
+    
+    obs         = TTS_Obs('bench')
+    obs.add_photometry('PHOT', np.logspace(-0.5, 3, 30), random.uniform(1e-10, 1e-9, 30))
+    obs.add_spectra('IRS', np.linspace(5.2, 37.9, 360), random.uniform(1e-10, 1e-9, 360))
+    return obs
+
+# The components fit_stream() and fit_targets() add up by default, the same ones calc_total adds:
+STREAMCOMPS     = ['phot', 'iwall', 'disk', 'scatt']
+
+def fit_stream(obs, name, dpath=datapath, k=20, chunk=500, grid=0, components=None, obspath=datapath):
+    """
+    Finds the k best fitting models (by the reduced chi-squared of model_rchi2) of a grid too big to load at once.
+    The collated files (or the grid container) are read in chunks of models, each chunk is scored, and only the k
+    best models seen so far are kept, so the memory used does not grow with the size of the grid.
+    
+    INPUTS
+    obs: The observations. Either a TTS_Obs() instance, or the name of the object to load the pickle of.
+    name: Name of the object being modeled. Must match naming convention used for models.
+    dpath: The directory containing the collated files (or the grid container).
+    k: The number of best models to keep.
+    chunk: The number of models read and scored at a time.
+    grid: BOOLEAN -- if 1 (True), read the models from the grid container (name_grid.fits) in dpath.
+    components: The components to add up into the total flux of each model. If None, adds the photosphere, inner
+                wall, disk and (when there is one) scattered light, like calc_total.
+    obspath: The path containing the observations pickle, if obs is a name.
+    
+    OUTPUT
+    results: An astropy Table with the JOBNUM, RCHI2 and numeric header parameters of the k best models, sorted from
+             the best fit to the worst. Parameters a model doesn't have are NaN.
+    """
+    
+    if not isinstance(obs, TTS_Obs):
+        obs     = loadPickle(obs, picklepath=obspath)
+    wavelength, flux, weights = obsPrep(obs)
+    scale       = weights / flux
+    if components is None:
+        components = STREAMCOMPS
+    
+    # A heap of (-rchi2, count, jobnum, params), so that the worst of the k best is always on top:
+    best        = []
+    count       = 0
+    for models in _streamModels(name, dpath, chunk, grid):
+        chi_arr = (flux - _streamInterp(models, components, wavelength)) * scale
+        rchi_sq = np.sum(chi_arr*chi_arr, axis=1) / (len(flux) - 1.)
+        for i, (jobnum, params, data) in enumerate(models):
+            if np.isnan(rchi_sq[i]):
+                continue
+            count += 1
+            entry = (-rchi_sq[i], count, jobnum, params)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+    
+    best        = sorted(best, reverse=True)
+    keys        = sorted(set(key for entry in best for key in entry[3]))
+    results     = Table([np.array([entry[2] for entry in best], dtype='string'),
+                         np.array([-entry[0] for entry in best], dtype=float)], names=('JOBNUM', 'RCHI2'))
+    for key in keys:
+        results[key] = np.array([entry[3].get(key, np.nan) for entry in best], dtype=float)
+    
+    return results
+
+def _streamInterp(models, components, wavelength):
+    """
+    Adds up the components of a chunk of models from _streamModels() and interpolates the totals onto the given
+    wavelengths. The models sharing a wavelength array are interpolated together, with one operator. Only when they
+    don't all share one are they grouped by their wavelengths.
+    """
+    
+    modelFlux   = np.zeros((len(models), len(wavelength)))
+    if len(models) == 0:
+        return modelFlux
+    
+    # Usually the models all share one wavelength array, and are interpolated with a single operator:
+    wl          = models[0][2]['wl']
+    if all(len(data['wl']) == len(wl) for jobnum, params, data in models):
+        wls     = np.array([data['wl'] for jobnum, params, data in models])
+        if np.all(wls == wl):
+            totals = np.zeros((len(models), len(wl)))
+            for key in components:
+                for i, (jobnum, params, data) in enumerate(models):
+                    if key in data:
+                        totals[i] += data[key]
+            modelFlux[:] = (interpOperator(wl, wavelength) * totals.T).T
+            return modelFlux
+    
+    # Otherwise, group the models by their wavelength array:
+    groups      = {}
+    for i, (jobnum, params, data) in enumerate(models):
+        groups.setdefault(data['wl'].tostring(), []).append(i)
+    for members in groups.values():
+        wl      = models[members[0]][2]['wl']
+        totals  = np.zeros((len(members), len(wl)))
+        for j, i in enumerate(members):
+            for key in components:
+                if key in models[i][2]:
+                    totals[j] += models[i][2][key]
+        modelFlux[members] = (interpOperator(wl, wavelength) * totals.T).T
+    return modelFlux
+
+def _streamModels(name, dpath, chunk, grid):
+    """
+    Reads the models of an object in chunks for fit_stream(). Yields lists of (jobnum, params, data), where params is
+    a dictionary of the numeric header parameters and data a dictionary of the components, like TTS_Model.data.
+    """
+    
+    skip        = ['SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'EXTEND', 'NWL', 'JOBNUM'] + GRIDFLAGS
+    
+    if grid:
+        HDUlist = fits.open(gridName(dpath, name), memmap=True)
+        comps   = [HDUlist[0].header['COMP'+str(i)] for i in range(HDUlist[0].header['NCOMP'])]
+        table   = HDUlist['PARAMS'].data
+        # A component no job has gets no column in the container:
+        axes    = [(c, axis) for c, axis in enumerate(comps) if axis in table.names and axis in ModelGrid.axisKeys]
+        cube    = HDUlist['FLUX'].data
+        try:
+            for start in range(0, len(table), chunk):
+                rows    = table[start:start+chunk]
+                block   = np.array(cube[start:start+chunk], dtype=float)
+                models  = []
+                for i, row in enumerate(rows):
+                    data = {}
+                    for c, axis in axes:
+                        if row[axis] >= 0:
+                            data[ModelGrid.axisKeys[axis]] = block[i, c, :row['NWL']]
+                    params = dict((key, float(row[key])) for key in table.names if key not in skip and
+                                  not key.endswith('AXIS') and np.issubdtype(table.dtype[key], np.number) and
+                                  not (key in GRIDCOUNTS and row[key] < 0))
+                    models.append((str(row['JOBNUM']).strip(), params, data))
+                yield models
+        finally:
+            HDUlist.close()
+        return
+    
+    pattern     = re.compile('^' + re.escape(name) + r'_(\d{3,4})\.fits$')
+    files       = sorted(filename for filename in os.listdir(dpath) if pattern.match(filename))
+    for start in range(0, len(files), chunk):
+        models  = []
+        for filename in files[start:start+chunk]:
+            HDUlist = fits.open(dpath + filename)
+            header  = HDUlist[0].header
+            values  = HDUlist[0].data
+            if 'EXTAXIS' in header.keys() or 'NOEXT' in header.keys():
+                data = dict((key, np.array(values[header[axis],:], dtype=float)) for axis, key in
+                            ModelGrid.axisKeys.items() if axis in header.keys())
+            else:
+                data = dict((key, np.array(values[:,i], dtype=float)) for i, key in
+                            enumerate(['wl', 'phot', 'iwall', 'disk']))
+            params  = dict((key, float(header[key])) for key in header.keys() if key not in skip and
+                           not key.endswith('AXIS') and type(header[key]) in [int, float, long])
+            models.append((pattern.match(filename).group(1), params, data))
+            HDUlist.close()
+        yield models
+
+def fit_targets(obslist, source, dpath=datapath, grid=0, chunk=500, components=None, obspath=datapath):
+    """
+    Fits many targets against the same grid in a single pass over the models. Each chunk of models is read once and
+    interpolated onto the wavelengths of every target at the same time (with one interpolation operator for all of
+    them), then scored against each target with the reduced chi-squared of model_rchi2.
+    
+    INPUTS
+    obslist: List of the observations of the targets, each either a TTS_Obs() instance or the name of an object to
+             load the pickle of.
+    source: The ModelGrid of the models, or the name of the object in the model files, which are then read in chunks
+            like fit_stream() does.
+    dpath: The directory containing the collated files (or the grid container), if source is a name.
+    grid: BOOLEAN -- if 1 (True) and source is a name, read the models from the grid container in dpath.
+    chunk: The number of models scored at a time.
+    components: The components to add up into the total flux of each model. If None, adds the photosphere, inner
+                wall, disk and (when there is one) scattered light, like calc_total and fit_stream.
+    obspath: The path containing the observations pickles, for the targets given by name.
+    
+    OUTPUT
+    jobs: Array of the job numbers of the models.
+    rchi_sq: Array (targets x models) of the reduced chi-squared of each model for each target.
+    """
+    
+    # Put the observations of all of the targets end to end:
+    wavelength  = []
+    flux        = []
+    scale       = []
+    for obs in obslist:
+        if not isinstance(obs, TTS_Obs):
+            obs = loadPickle(obs, picklepath=obspath)
+        obsWave, obsFlux, obsWeights = obsPrep(obs)
+        if len(obsWave) < 2:
+            raise ValueError('FIT_TARGETS: ' + obs.name + ' needs at least two points to fit.')
+        wavelength.append(obsWave)
+        flux.append(obsFlux)
+        scale.append(obsWeights / obsFlux)
+    starts      = np.cumsum([0] + [len(obsWave) for obsWave in wavelength[:-1]])
+    dof         = np.array([len(obsWave) - 1. for obsWave in wavelength])
+    wavelength  = np.concatenate(wavelength)
+    flux        = np.concatenate(flux)
+    scale       = np.concatenate(scale)
+    
+    def score(modelFlux):
+        chi_arr = (flux - modelFlux) * scale
+        return (np.add.reduceat(chi_arr*chi_arr, starts, axis=1) / dof).T
+    
+    jobs        = []
+    scores      = []
+    if components is None:
+        components = STREAMCOMPS
+    if isinstance(source, ModelGrid):
+        for start in range(0, len(source), chunk):
+            rows    = np.arange(start, min(start+chunk, len(source)))
+            totals  = calc_totals(source, components=components, rows=rows)
+            scores.append(score(gridInterp(source, totals, wavelength, rows=rows)))
+        jobs    = source.jobs
+    else:
+        for models in _streamModels(source, dpath, chunk, grid):
+            jobs.extend(jobnum for jobnum, params, data in models)
+            scores.append(score(_streamInterp(models, components, wavelength)))
+        jobs    = np.array(jobs, dtype='string')
+    
+    if len(scores) == 0:
+        return np.array(jobs, dtype='string'), np.zeros((len(obslist), 0))
+    return jobs, np.concatenate(scores, axis=1)
+
+def fitTable(grid, rows, rchi_sq, amplitudes=None, free=None):
+    """
+    Makes the table of fit results returned by fit_grid(), sorted by the reduced chi-squared.
+    """
+    
+    results     = Table([grid.jobs[rows], rchi_sq], names=('JOBNUM', 'RCHI2'))
+    if free is not None:
+        for k, key in enumerate(free):
+            results['SCALE_' + key.upper()] = amplitudes[:, k]
+    for key in grid.params.dtype.names:
+        if key not in results.colnames:
+            results[key] = grid.params[key][rows]
+    results.sort('RCHI2')
+    
+    return results
+
 def star_param(sptype, mag, Av, dist, params, picklepath=edgepath, jnotv=0):
     """
     Calculates the effective temperature and luminosity of a T-Tauri star. Uses either values based on
@@ -1158,6 +1917,169 @@ def star_param(sptype, mag, Av, dist, params, picklepath=edgepath, jnotv=0):
     return float(Teff), lum
 
 #---------------------------------------------------CLASSES------------------------------------------------------
+class LazyData(dict):
+    """
+    The data dictionary of a model loaded with lazy=1. Each component is only read from the (memory mapped) fits file
+    the first time it is used; otherwise it behaves like the usual dictionary of components.
+    
+    ATTRIBUTES
+    loaders: Dictionary of the components that have not been read yet, with the function that reads each one.
+    """
+    
+    def __init__(self, loaders):
+        dict.__init__(self)
+        self.loaders    = dict(loaders)
+    
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        value           = self.loaders.pop(key)()
+        dict.__setitem__(self, key, value)
+        return value
+    
+    def __setitem__(self, key, value):
+        self.loaders.pop(key, None)
+        dict.__setitem__(self, key, value)
+    
+    def __delitem__(self, key):
+        if self.loaders.pop(key, None) is None or dict.__contains__(self, key):
+            dict.__delitem__(self, key)
+    
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.loaders
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def keys(self):
+        return dict.keys(self) + [key for key in self.loaders if not dict.__contains__(self, key)]
+    
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+    
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+    
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+class ComponentCache(object):
+    """
+    A size-bounded, least recently used cache of model components that are shared between models, like the inner
+    wall of a grid of PTD disks or an optically thin dust model. Entries are keyed by (file, job, axis), and are
+    dropped when the file has been modified since it was read. Callers get their own copies of the cached arrays and
+    headers, so changing them (e.g. model.data['dust'] *= 2) does not change what the next model gets.
+    
+    ATTRIBUTES
+    maxbytes: The most memory the cached components can take up before the least recently used ones are dropped.
+    nbytes: The memory currently taken up by the cached components.
+    hits: Number of components found in the cache.
+    misses: Number of components that had to be read from their file.
+    evictions: Number of components dropped to stay under maxbytes.
+    
+    METHODS
+    fetch: Returns components from the cache, reading them from their file if needed.
+    stats: Returns a dictionary with the hit/miss statistics.
+    clear: Empties the cache.
+    """
+    
+    def __init__(self, maxbytes=256*2**20):
+        self.maxbytes   = maxbytes
+        self.entries    = OrderedDict()
+        self.nbytes     = 0
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+    
+    def fetch(self, filename, job, axes, reader):
+        """
+        Returns the requested components of a job, calling reader() at most once for the ones not in the cache.
+        
+        INPUTS
+        filename: The file the components are read from. Its modification time is used to validate the entries.
+        job: The job number string of the components.
+        axes: List of the names of the components to return.
+        reader: Function returning a dictionary of name -> component. It may return more components than asked for;
+                these are cached too.
+        
+        OUTPUT
+        A dictionary of name -> copy of the component for every requested component the reader provides.
+        """
+        
+        mtime           = os.path.getmtime(filename)
+        found           = {}
+        for axis in axes:
+            key         = (filename, job, axis)
+            if key in self.entries and self.entries[key][0] == mtime:
+                found[axis] = self.entries.pop(key)[1]
+                self.entries[key] = (mtime, found[axis])     # Move it to the most recently used end
+                self.hits += 1
+        
+        missing         = [axis for axis in axes if axis not in found]
+        if len(missing) != 0:
+            self.misses += len(missing)
+            for axis, value in reader().items():
+                if isinstance(value, np.ndarray):
+                    value = np.array(value)                   # Don't keep the rest of the file alive through a view
+                    value.setflags(write=False)
+                self._store((filename, job, axis), mtime, value)
+                if axis in missing:
+                    found[axis] = value
+        return dict((axis, self._copy(value)) for axis, value in found.items())
+    
+    def _store(self, key, mtime, value):
+        if key in self.entries:
+            self.nbytes -= self._sizeOf(self.entries.pop(key)[1])
+        size            = self._sizeOf(value)
+        if size > self.maxbytes:
+            return
+        while self.nbytes + size > self.maxbytes:
+            self.nbytes -= self._sizeOf(self.entries.popitem(last=False)[1][1])
+            self.evictions += 1
+        self.entries[key] = (mtime, value)
+        self.nbytes    += size
+    
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, (np.ndarray, fits.Header)):
+            return value.copy()
+        return value
+    
+    @staticmethod
+    def _sizeOf(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, fits.Header):
+            return 80 * (len(value) + 1)
+        return 0
+    
+    def stats(self):
+        """
+        Returns a dictionary with the number of hits, misses and evictions, and the number of entries and bytes cached.
+        """
+        
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
+    
+    def clear(self):
+        """
+        Empties the cache and resets the statistics.
+        """
+        
+        self.entries.clear()
+        self.nbytes     = 0
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+# The cache shared by every model:
+componentCache  = ComponentCache()
+
 class TTS_Model(object):
     """
     Contains all the data and meta-data for a TTS Model from the D'Alessio et al. 2006 models. The input
@@ -1190,6 +2112,8 @@ class TTS_Model(object):
     rin: The inner radius in AU.
     dpath: Path where the data files are located.
     high: Whether or not the data was part of a 1000+ grid.
+    grid: Whether or not the data is loaded from the grid container made by collate.py.
+    lazy: Whether or not the components are only read from the file when they are first used (see LazyData).
     data: The data for each component inside the model.
     extcorr: The self-extinction correction. If not carried out, saved as None.
     new: Whether or not the model was made with the newer version of collate.py.
@@ -1203,57 +2127,227 @@ class TTS_Model(object):
                 the data attribute under the key 'total'.
     """
     
-    def __init__(self, name, jobn, dpath=datapath, high=0):
+    def __init__(self, name, jobn, dpath=datapath, high=0, grid=0, lazy=0):
+        """
+        Initializes instances of this class and loads the relevant data into attributes.
+        
+        INPUTS
+        name: Name of the object being modeled. Must match naming convention used for models.
+        jobn: Job number corresponding to the model being loaded into the object, either as an integer or as the 'XXX'/'XXXX'
+              string (e.g. from searchJobs or ModelGrid.jobs).
+        full_trans: BOOLEAN -- if 1 (True) will load data as a full or transitional disk. If 0 (False), as a pre-trans. disk.
+        high: BOOLEAN -- if 1 (True), the model file being read in has a 4-digit number string rather than 3-digit string.
+        grid: BOOLEAN -- if 1 (True), the model is loaded from the grid container (name_grid.fits, made by collate's
+              gridAppend) in dpath instead of from its own fits file.
+        lazy: BOOLEAN -- if 1 (True), the fits file is opened (memory mapped) only once, here, and dataInit reads each
+              component from it only when it is first used.
+        """
+        
+        # Read in the fits file:
+        self.dpath      = dpath
+        self.high       = high
+        self.grid       = grid
+        self.lazy       = lazy
+        header, data    = self._loadJob(name, jobn, headerOnly=not lazy) # Header of the fits file (or grid row)
+        if lazy:
+            self._job   = (header, data)                                # Kept for dataInit, so the file is not opened again
+        
+        # Initialize meta-data attributes for this object:
+        self.name       = name
+        self.jobn       = jobn
+        self._metaInit(header)
+        self.extcorr    = None
+        
+        return
+    
+    def _metaInit(self, header):
+        """
+        Sets the model parameter attributes from a header (or anything else that can be indexed by header keyword).
+        """
+        
+        self.mstar      = header['MSTAR']
+        self.tstar      = header['TSTAR']
+        self.rstar      = header['RSTAR']
+        self.dist       = header['DISTANCE']
+        self.mdot       = header['MDOT']
+        self.alpha      = header['ALPHA']
+        self.mui        = header['MUI']
+        self.rdisk      = header['RDISK']
+        self.amax       = header['AMAXS']
+        self.eps        = header['EPS']
+        self.tshock     = header['TSHOCK']
+        self.temp       = header['TEMP']
+        self.altinh     = header['ALTINH']
+        self.wlcut_an   = header['WLCUT_AN']
+        self.wlcut_sc   = header['WLCUT_SC']
+        self.nsilcomp   = header['NSILCOMP']
+        self.siltotab   = header['SILTOTAB']
+        self.amorf_ol   = header['AMORF_OL']
+        self.amorf_py   = header['AMORF_PY']
+        self.forsteri   = header['FORSTERI']
+        self.enstatit   = header['ENSTATIT']
+        self.rin        = header['RIN']
+        return
+    
+    @property
+    def extcorr(self):
+        """
+        The self-extinction correction. In lazy mode it is read from the file the first time it is used.
+        """
+        if self._extcorr is None and getattr(self, '_extLoader', None) is not None:
+            self._extcorr   = self._extLoader()
+            self._extLoader = None
+        return self._extcorr
+    
+    @extcorr.setter
+    def extcorr(self, value):
+        self._extcorr   = value
+        self._extLoader = None
+    
+    def _jobData(self):
+        """
+        Returns the header and data array of this model, reusing the ones opened by __init__ in lazy mode.
+        """
+        
+        if self.lazy:
+            return self._job
+        return self._loadJob(self.name, self.jobn)
+    
+    def _components(self, header, data, wallkey='iwall'):
+        """
+        Makes the functions that read each component of a (new collate) model out of its data array, warning about the
+        components that are missing.
+        
+        INPUTS
+        header: The header of the model.
+        data: The data array of the model.
+        wallkey: The data key to use for the wall in this model.
+        
+        OUTPUT
+        loaders: Dictionary of data key -> function returning that component.
+        extLoader: Function returning the self-extinction correction, or None if there is none.
+        """
+        
+        def row(axis):
+            return lambda: data[header[axis],:]
+        
+        def scattRow():
+            scatt       = data[header['SCATAXIS'],:]
+            negScatt    = np.where(scatt < 0.0)[0]
+            if len(negScatt) > 0:
+                print('DATAINIT: WARNING: Some of your scattered light values are negative!')
+            return scatt
+        
+        # The wavelength array is always present:
+        loaders         = {'wl': row('WLAXIS')}
+        
+        # Now we can loop through the remaining possibilities:
+        if 'PHOTAXIS' in header.keys():
+            loaders['phot'] = row('PHOTAXIS')
+        else:
+            print('DATAINIT: Warning: No photosphere data found for ' + self.name)
+        if 'WALLAXIS' in header.keys():
+            loaders[wallkey] = row('WALLAXIS')
+        else:
+            print('DATAINIT: Warning: No outer wall data found for ' + self.name)
+        if 'ANGAXIS' in header.keys():
+            loaders['disk'] = row('ANGAXIS')
+        else:
+            print('DATAINIT: Warning: No outer disk data found for ' + self.name)
+        # Remaining components are not always (or almost always) present, so no warning given if missing!
+        if 'SCATAXIS' in header.keys():
+            loaders['scatt'] = scattRow
+        extLoader       = None
+        if 'EXTAXIS' in header.keys():
+            extLoader   = row('EXTAXIS')
+        
+        return loaders, extLoader
+    
+    def _setData(self, loaders, extLoader=None):
+        """
+        Fills the data dictionary (and extcorr, if there is an extLoader) from the functions that read each component.
+        In lazy mode, they are only called when the component is first used.
+        """
+        
+        if self.lazy:
+            self.data   = LazyData(loaders)
+            if extLoader is not None:
+                self.extcorr    = None
+                self._extLoader = extLoader
+        else:
+            # The scattered light is read last, like before, so that any warning about it comes last:
+            self.data   = {}
+            for key in sorted(loaders.keys(), key=lambda key: key == 'scatt'):
+                self.data[key] = loaders[key]()
+            if extLoader is not None:
+                self.extcorr = extLoader()
+        return
+    
+    def _jobString(self, jobn, high=None):
         """
-        Initializes instances of this class and loads the relevant data into attributes.
+        Returns the 'XXX'/'XXXX' string of a job number given either as an integer or as a string, including the numpy
+        strings that searchJobs and ModelGrid hand out. An integer is a 4-digit job if high (by default, the high
+        attribute) is set.
+        """
+        
+        if isinstance(jobn, basestring):
+            return str(jobn)
+        if high is None:
+            high        = self.high
+        return numCheck(jobn, high=high)
+    
+    def _loadJob(self, name, jobn, high=None, headerOnly=0):
+        """
+        Reads in the header and data array of a collated model, either from its fits file or from the grid container.
         
         INPUTS
-        name: Name of the object being modeled. Must match naming convention used for models.
-        jobn: Job number corresponding to the model being loaded into the object. Again, must match convention.
-        full_trans: BOOLEAN -- if 1 (True) will load data as a full or transitional disk. If 0 (False), as a pre-trans. disk.
-        high: BOOLEAN -- if 1 (True), the model file being read in has a 4-digit number string rather than 3-digit string.
+        name: Name of the object the model belongs to.
+        jobn: Job number of the model, either as an integer or as the 'XXX'/'XXXX' string.
+        high: BOOLEAN -- if 1 (True), an integer jobn is a 4-digit job. Defaults to the high attribute.
+        headerOnly: BOOLEAN -- if 1 (True), the data of the model's fits file is not read. The grid container row is
+                    always read whole.
+        
+        OUTPUT
+        header: The fits header of the model.
+        data: The data array of the model, or None if only the header was read.
         """
         
-        # Read in the fits file:
-        if high:
-            stringnum   = numCheck(jobn, high=1)
-        else:
-            stringnum   = numCheck(jobn)                                # Convert jobn to the proper string format
-        fitsname        = dpath + name + '_' + stringnum + '.fits'      # Fits filename, preceeded by the path from paths section
+        stringnum       = self._jobString(jobn, high=high)
+        
+        if self.grid:
+            return gridRead(gridName(self.dpath, name), stringnum)
+        
+        fitsname        = self.dpath + name + '_' + stringnum + '.fits' # Fits filename, preceeded by the path from paths section
         HDUlist         = fits.open(fitsname)                           # Opens the fits file for use
         header          = HDUlist[0].header                             # Stores the header in this variable
+        data            = None
+        if not headerOnly:
+            data        = HDUlist[0].data
+        HDUlist.close()
+        return header, data
+    
+    def _dustData(self, dust, dust_high=0):
+        """
+        Returns the flux of an optically thin dust model, which is read from its file only once and then shared
+        through componentCache.
         
-        # Initialize meta-data attributes for this object:
-        self.name       = name
-        self.jobn       = jobn
-        self.mstar      = header['MSTAR']
-        self.tstar      = header['TSTAR']
-        self.rstar      = header['RSTAR']
-        self.dist       = header['DISTANCE']
-        self.mdot       = header['MDOT']
-        self.alpha      = header['ALPHA']
-        self.mui        = header['MUI']
-        self.rdisk      = header['RDISK']
-        self.amax       = header['AMAXS']
-        self.eps        = header['EPS']
-        self.tshock     = header['TSHOCK']
-        self.temp       = header['TEMP']
-        self.altinh     = header['ALTINH']
-        self.wlcut_an   = header['WLCUT_AN']
-        self.wlcut_sc   = header['WLCUT_SC']
-        self.nsilcomp   = header['NSILCOMP']
-        self.siltotab   = header['SILTOTAB']
-        self.amorf_ol   = header['AMORF_OL']
-        self.amorf_py   = header['AMORF_PY']
-        self.forsteri   = header['FORSTERI']
-        self.enstatit   = header['ENSTATIT']
-        self.rin        = header['RIN']
-        self.dpath      = dpath
-        self.high       = high
-        self.extcorr    = None
+        INPUTS
+        dust: The job number of the optically thin dust model.
+        dust_high: BOOLEAN -- if 1 (True), will look for a 4 digit valued dust file.
+        """
         
-        HDUlist.close()
-        return
+        try:
+            dustNum     = numCheck(dust, high=dust_high)
+        except:
+            raise ValueError('CALC_TOTAL: Error! Dust input not a valid integer')
+        dustfile        = self.dpath + self.name + '_OTD_' + dustNum + '.fits'
+        axis            = 'DUST' if self.new else 'DUST_OLD'
+        
+        def reader():
+            data        = fits.getdata(dustfile)
+            return {axis: data[1,:] if self.new else data[:,1]}
+        
+        return componentCache.fetch(dustfile, dustNum, [axis], reader)[axis]
     
     def dataInit(self):
         """
@@ -1263,10 +2357,7 @@ class TTS_Model(object):
         light emission. Loads in self-extinction array if available.
         """
         
-        stringnum    = numCheck(self.jobn, high=self.high)
-        fitsname     = self.dpath + self.name + '_' + stringnum + '.fits'
-        HDUdata      = fits.open(fitsname)
-        header       = HDUdata[0].header
+        header, data = self._jobData()
         
         # The new Python version of collate flips array indices, so must identify which collate.py was used:
         if 'EXTAXIS' in header.keys() or 'NOEXT' in header.keys():
@@ -1275,36 +2366,14 @@ class TTS_Model(object):
             self.new = 0
 
         if self.new:
-            # We will load in the components piecemeal based on the axes present in the header.
-            # First though, we initialize with the wavelength array, since it's always present:
-            self.data = {'wl': HDUdata[0].data[header['WLAXIS'],:]}
-            
-            # Now we can loop through the remaining possibilities:
-            if 'PHOTAXIS' in header.keys():
-                self.data['phot'] = HDUdata[0].data[header['PHOTAXIS'],:]
-            else:
-                print('DATAINIT: Warning: No photosphere data found for ' + self.name)
-            if 'WALLAXIS' in header.keys():
-                self.data['iwall'] = HDUdata[0].data[header['WALLAXIS'],:]
-            else:
-                print('DATAINIT: Warning: No outer wall data found for ' + self.name)
-            if 'ANGAXIS' in header.keys():
-                self.data['disk'] = HDUdata[0].data[header['ANGAXIS'],:]
-            else:
-                print('DATAINIT: Warning: No outer disk data found for ' + self.name)
-            # Remaining components are not always (or almost always) present, so no warning given if missing!
-            if 'SCATAXIS' in header.keys():
-                self.data['scatt'] = HDUdata[0].data[header['SCATAXIS'],:]
-                negScatt = np.where(self.data['scatt'] < 0.0)[0]
-                if len(negScatt) > 0:
-                    print('DATAINIT: WARNING: Some of your scattered light values are negative!')
-            if 'EXTAXIS' in header.keys():
-                self.extcorr       = HDUdata[0].data[header['EXTAXIS'],:]
+            # We will load in the components piecemeal based on the axes present in the header:
+            loaders, extLoader = self._components(header, data)
         else:
-            self.data = {'wl': HDUdata[0].data[:,0], 'phot': HDUdata[0].data[:,1], 'iwall': HDUdata[0].data[:,2], \
-                         'disk': HDUdata[0].data[:,3]}
+            loaders   = {'wl': lambda: data[:,0], 'phot': lambda: data[:,1], 'iwall': lambda: data[:,2], \
+                         'disk': lambda: data[:,3]}
+            extLoader = None
+        self._setData(loaders, extLoader)
         
-        HDUdata.close()
         return
     
     @keyErrHandle
@@ -1329,22 +2398,22 @@ class TTS_Model(object):
         componentNumber = 1
         scatt           = 0     # For tracking if scattered light component exists
         
-        if self.extcorr != None:
+        if self.extcorr is not None:
             componentNumber += 1
         if phot:
             if verbose:
                 print 'CALC_TOTAL: Adding photosphere component to the total flux.'
-            totFlux     = totFlux + self.data['phot']
+            totFlux    += self.data['phot']
             componentNumber += 1
         if wall:
             if verbose:
                 print 'CALC_TOTAL: Adding inner wall component to the total flux.'
             if altinh != None:
                 self.newIWall = self.data['iwall'] * altinh
-                totFlux       = totFlux + self.newIWall     # Note: if save=1, will save iwall w/ the original altinh.
+                totFlux      += self.newIWall         # Note: if save=1, will save iwall w/ the original altinh.
                 self.wallH    = self.altinh * altinh
             else:
-                totFlux       = totFlux + self.data['iwall']
+                totFlux      += self.data['iwall']
                 self.wallH    = self.altinh                 # Redundancy for plotting purposes.
                 # If we tried changing altinh but want to now plot original, deleting the "newIWall" attribute from before.
                 try:
@@ -1355,21 +2424,14 @@ class TTS_Model(object):
         if disk:
             if verbose:
                 print 'CALC_TOTAL: Adding disk component to the total flux.'
-            totFlux     = totFlux + self.data['disk']
+            totFlux    += self.data['disk']
             componentNumber += 1
         if dust != 0:
-            try:
-                dustNum = numCheck(dust, high=dust_high)
-            except:
-                raise ValueError('CALC_TOTAL: Error! Dust input not a valid integer')
-            dustHDU     = fits.open(self.dpath+self.name+'_OTD_'+dustNum+'.fits')
+            dustFlux    = self._dustData(dust, dust_high)
             if verbose:
                 print 'CALC_TOTAL: Adding optically thin dust component to total flux.'
-            if self.new:
-                self.data['dust']   = dustHDU[0].data[1,:]
-            else:
-                self.data['dust']   = dustHDU[0].data[:,1]
-            totFlux     = totFlux + self.data['dust']
+            self.data['dust'] = dustFlux
+            totFlux    += self.data['dust']
             componentNumber += 1
         
         # If scattered emission is in the dictionary, add it:
@@ -1377,7 +2439,7 @@ class TTS_Model(object):
             scatt       = 1
             if verbose:
                 print('CALC_TOTAL: Adding scattered light component to the total flux.')
-            totFlux     = totFlux + self.data['scatt']
+            totFlux    += self.data['scatt']
             componentNumber += 1
         
         # Add the total flux array to the data dictionary attribute:
@@ -1415,13 +2477,13 @@ class TTS_Model(object):
                 headerStr += 'Scattered Light, '
                 outputTable[:, colNum] = self.data['scatt']
                 colNum += 1
-            if self.extcorr != None:
+            if self.extcorr is not None:
                 headerStr += 'Tau, '
                 outputTable[:, colNum] = self.extcorr
             
             # Trim the header and save:
             headerStr  = headerStr[0:-2]
-            filestring = '%s%s_%s.dat' % (self.dpath, self.name, numCheck(self.jobn, high=self.high))
+            filestring = '%s%s_%s.dat' % (self.dpath, self.name, self._jobString(self.jobn))
             np.savetxt(filestring, outputTable, fmt='%.3e', delimiter=', ', header=headerStr, comments='#')
         
         return
@@ -1459,6 +2521,8 @@ class PTD_Model(TTS_Model):
     rin: The inner radius in AU.
     dpath: Path where the data files are located.
     high: Whether or not the data was part of a 1000+ grid.
+    grid: Whether or not the data is loaded from the grid container made by collate.py.
+    lazy: Whether or not the components are only read from the file when they are first used (see LazyData).
     data: The data for each component inside the model.
     extcorr: The self-extinction correction. If not carried out, saved as None.
     new: Whether or not the model was made with the newer version of collate.py.
@@ -1474,6 +2538,42 @@ class PTD_Model(TTS_Model):
                 the data attribute under the key 'total'. This also differs from TTS_Model.
     """
     
+    def _wallData(self, wallname, jobw, high=None):
+        """
+        Returns the header and wall flux of an inner wall model. Since the same wall is usually paired with many disks,
+        these are read from the file only once and then shared through componentCache.
+        
+        INPUTS
+        wallname: Name of the object the inner wall model belongs to.
+        jobw: Job number of the wall, either as an integer or as the 'XXX'/'XXXX' string.
+        high: BOOLEAN -- if 1 (True), an integer jobw is a 4-digit job. Defaults to the high attribute.
+        
+        OUTPUT
+        header: The fits header of the wall model.
+        wall: The wall flux, or None if the model has no wall component.
+        """
+        
+        if high is None:
+            high        = self.high
+        if isinstance(jobw, basestring):
+            stringnum   = str(jobw)
+        else:
+            stringnum   = numCheck(jobw, high=high)
+        if self.grid:
+            wallfile    = gridName(self.dpath, wallname)
+        else:
+            wallfile    = self.dpath + wallname + '_' + stringnum + '.fits'
+        
+        def reader():
+            header, data = self._loadJob(wallname, stringnum)
+            components  = {'HEADER': header}
+            if 'WALLAXIS' in header.keys():
+                components['WALLAXIS'] = data[header['WALLAXIS'],:]
+            return components
+        
+        components      = componentCache.fetch(wallfile, stringnum, ['HEADER', 'WALLAXIS'], reader)
+        return components['HEADER'], components.get('WALLAXIS')
+    
     def dataInit(self, altname=None, jobw=None, highWall=0, **searchKwargs):
         """
         Initialize data attributes for this object using nested dictionaries:
@@ -1495,142 +2595,56 @@ class PTD_Model(TTS_Model):
         if jobw == None and len(searchKwargs) == 0:
             raise IOError('DATAINIT: You must enter either a job number or kwargs to match or search for an inner wall.')
         
+        if altname == None:
+            wallname      = self.name
+        else:
+            wallname      = altname
+        
         if jobw != None:
-            # If jobw is an integer, make into a string:
-            if type(jobw) == int:
-                jobw = numCheck(jobw, high=highWall)
-            
             # The case in which you supplied the job number of the inner wall:
-            if altname == None:
-                fitsname  = self.dpath + self.name + '_' + jobw + '.fits'
-                HDUwall   = fits.open(fitsname)
-            else:
-                fitsname  = self.dpath + altname + '_' + jobw + '.fits'
-                HDUwall   = fits.open(fitsname)
+            header_w, wall_w = self._wallData(wallname, jobw, high=highWall)
             
             # Make sure the inner wall job you supplied is, in fact, an inner wall.
-            if 'NOEXT' not in HDUwall[0].header.keys():
+            if 'NOEXT' not in header_w.keys():
                 raise IOError('DATAINIT: Job you supplied is not an inner wall or needs to be collated again!')
-            
-            # Now, load in the disk data:
-            stringNum     = numCheck(self.jobn, high=self.high)
-            HDUdata       = fits.open(self.dpath + self.name + '_' + stringNum + '.fits')
-            header        = HDUdata[0].header
-            
-            # Check if it's an old version or a new version:
-            if 'EXTAXIS' in header.keys() or 'NOEXT' in header.keys():
-                self.new  = 1
-            else:
-                self.new  = 0
-            
-            # Define the inner wall height.
-            self.iwallH   = HDUwall[0].header['ALTINH']
-            self.itemp   = HDUwall[0].header['TEMP']
-            
-            # Depending on old or new version is how we will load in the data. We require the wall be "new":
-            if self.new:
-                # Correct for self extinction:
-                iwallFcorr= HDUwall[0].data[HDUwall[0].header['WALLAXIS'],:]*np.exp(-1*HDUdata[0].data[header['EXTAXIS'],:])
-                
-                # We will load in the components piecemeal based on the axes present in the header.
-                # First though, we initialize with the wavelength and wall, since they're always present.
-                self.data = {'wl': HDUdata[0].data[header['WLAXIS'],:], 'iwall': iwallFcorr}
-                
-                # Now we can loop through the remaining possibilities:
-                if 'PHOTAXIS' in header.keys():
-                    self.data['phot'] = HDUdata[0].data[header['PHOTAXIS'],:]
-                else:
-                    print('DATAINIT: Warning: No photosphere data found for ' + self.name)
-                if 'WALLAXIS' in header.keys():
-                    self.data['owall']= HDUdata[0].data[header['WALLAXIS'],:]
-                else:
-                    print('DATAINIT: Warning: No outer wall data found for ' + self.name)
-                if 'ANGAXIS' in header.keys():
-                    self.data['disk'] = HDUdata[0].data[header['ANGAXIS'],:]
-                else:
-                    print('DATAINIT: Warning: No outer disk data found for ' + self.name)
-                # Remaining components are not always (or almost always) present, so no warning given if missing!
-                if 'SCATAXIS' in header.keys():
-                    self.data['scatt']= HDUdata[0].data[header['SCATAXIS'],:]
-                    negScatt = np.where(self.data['scatt'] < 0.0)[0]
-                    if len(negScatt) > 0:
-                        print('DATAINIT: WARNING: Some of your scattered light values are negative!')
-                if 'EXTAXIS' in header.keys():
-                    self.extcorr      = HDUdata[0].data[header['EXTAXIS'],:]
-            else:
-                self.data = ({'wl': HDUdata[0].data[:,0], 'phot': HDUdata[0].data[:,1], 'owall': HDUdata[0].data[:,2],
-                              'disk': HDUdata[0].data[:,3], 'iwall': HDUwall[0].data[HDUwall[0].header['WALLAXIS'],:]})
         
         else:
             # When doing the searchJobs() call, use **searchKwargs to pass that as the keyword arguments to searchJobs!
-            if altname == None:
-                match = searchJobs(self.name, dpath=self.dpath, **searchKwargs)
-            else:
-                match = searchJobs(altname, dpath=self.dpath, **searchKwargs)
+            match = searchJobs(wallname, dpath=self.dpath, **searchKwargs)
             if len(match) == 0:
                 raise IOError('DATAINIT: No inner wall model matches these parameters!')
             elif len(match) > 1:
                 raise IOError('DATAINIT: Multiple inner wall models match. Do not know which one to pick.')
-            else:
-                if altname == None:
-                    fitsname = self.dpath + self.name + '_' + match[0] + '.fits'
-                else:
-                    fitsname = self.dpath + altname + '_' + match[0] + '.fits'
-                HDUwall  = fits.open(fitsname)
-                
-                # Make sure the inner wall job you supplied is, in fact, an inner wall.
-                if 'NOEXT' not in HDUwall[0].header.keys():
-                    raise IOError('DATAINIT: Job found is not an inner wall or needs to be collated again!')
-            
-                # Now, load in the disk data:
-                stringNum    = numCheck(self.jobn, high=self.high)
-                HDUdata      = fits.open(self.dpath + self.name + '_' + stringNum + '.fits')
-                header       = HDUdata[0].header
+            header_w, wall_w = self._wallData(wallname, match[0])
             
-                # Check if it's an old version or a new version:
-                if 'EXTAXIS' in header.keys() or 'NOEXT' in header.keys():
-                    self.new = 1
-                else:
-                    self.new = 0
-                
-                # Define the inner wall height:
-                self.iwallH  = HDUwall[0].header['ALTINH']
-                self.itemp   = HDUwall[0].header['TEMP']
-                
-                # Depending on old or new version is how we will load in the data. We require the wall be "new":
-                if self.new:
-                    # Correct for self extinction:
-                    iwallFcorr = HDUwall[0].data[HDUwall[0].header['WALLAXIS'],:]*np.exp(-1*HDUdata[0].data[header['EXTAXIS'],:])
-                    
-                    # We will load in the components piecemeal based on the axes present in the header.
-                    # First though, we initialize with the wavelength and wall, since they're always present:
-                    self.data  = {'wl': HDUdata[0].data[header['WLAXIS'],:], 'iwall': iwallFcorr}
-                
-                    # Now we can loop through the remaining possibilities:
-                    if 'PHOTAXIS' in header.keys():
-                        self.data['phot'] = HDUdata[0].data[header['PHOTAXIS'],:]
-                    else:
-                        print('DATAINIT: Warning: No photosphere data found for ' + self.name)
-                    if 'WALLAXIS' in header.keys():
-                        self.data['owall']= HDUdata[0].data[header['WALLAXIS'],:]
-                    else:
-                        print('DATAINIT: Warning: No outer wall data found for ' + self.name)
-                    if 'ANGAXIS' in header.keys():
-                        self.data['disk'] = HDUdata[0].data[header['ANGAXIS'],:]
-                    else:
-                        print('DATAINIT: Warning: No outer disk data found for ' + self.name)
-                    # Remaining components are not always (or almost always) present, so no warning given if missing!
-                    if 'SCATAXIS' in header.keys():
-                        self.data['scatt']= HDUdata[0].data[header['SCATAXIS'],:]
-                        negScatt = np.where(self.data['scatt'] < 0.0)[0]
-                        if len(negScatt) > 0:
-                            print('DATAINIT: WARNING: Some of your scattered light values are negative!')
-                    if 'EXTAXIS' in header.keys():
-                        self.extcorr      = HDUdata[0].data[header['EXTAXIS'],:]
-                else:
-                    self.data = ({'wl': HDUdata[0].data[:,0], 'phot': HDUdata[0].data[:,1], 'owall': HDUdata[0].data[:,2],
-                                  'disk': HDUdata[0].data[:,3], 'iwall': HDUwall[0].data[HDUwall[0].header['WALLAXIS'],:]})
-        HDUdata.close()
+            # Make sure the inner wall job you supplied is, in fact, an inner wall.
+            if 'NOEXT' not in header_w.keys():
+                raise IOError('DATAINIT: Job found is not an inner wall or needs to be collated again!')
+        
+        # Now, load in the disk data:
+        header, data      = self._jobData()
+        
+        # Check if it's an old version or a new version:
+        if 'EXTAXIS' in header.keys() or 'NOEXT' in header.keys():
+            self.new      = 1
+        else:
+            self.new      = 0
+        
+        # Define the inner wall height.
+        self.iwallH       = header_w['ALTINH']
+        self.itemp        = header_w['TEMP']
+        
+        # Depending on old or new version is how we will load in the data. We require the wall be "new":
+        if self.new:
+            # We will load in the components piecemeal based on the axes present in the header.
+            # The disk's own wall is the outer wall, and the inner wall is corrected for self extinction:
+            loaders, extLoader = self._components(header, data, wallkey='owall')
+            loaders['iwall'] = lambda: wall_w*np.exp(-1*data[header['EXTAXIS'],:])
+        else:
+            loaders       = ({'wl': lambda: data[:,0], 'phot': lambda: data[:,1], 'owall': lambda: data[:,2],
+                              'disk': lambda: data[:,3], 'iwall': lambda: wall_w})
+            extLoader     = None
+        self._setData(loaders, extLoader)
         return
     
     def calc_total(self, phot=1, wall=1, disk=1, owall=1, dust=0, verbose=1, dust_high=0, altInner=None, altOuter=None, save=0):
@@ -1657,17 +2671,17 @@ class PTD_Model(TTS_Model):
         if phot:
             if verbose:
                 print 'CALC_TOTAL: Adding photosphere component to the total flux.'
-            totFlux     = totFlux + self.data['phot']
+            totFlux    += self.data['phot']
             componentNumber += 1
         if wall:
             if verbose:
                 print 'CALC_TOTAL: Adding inner wall component to the total flux.'
             if altInner != None:
                 self.newIWall = self.data['iwall'] * altInner
-                totFlux       = totFlux + self.newIWall     # Note: if save=1, will save iwall w/ the original altinh.
+                totFlux      += self.newIWall         # Note: if save=1, will save iwall w/ the original altinh.
                 self.wallH    = self.iwallH * altInner
             else:
-                totFlux = totFlux + self.data['iwall']
+                totFlux += self.data['iwall']
                 self.wallH    = self.iwallH                 # Redundancy for plotting purposes.
                 # If we tried changing altinh but want to now plot original, deleting the "newIWall" attribute from before.
                 try:
@@ -1678,17 +2692,17 @@ class PTD_Model(TTS_Model):
         if disk:
             if verbose:
                 print 'CALC_TOTAL: Adding disk component to the total flux.'
-            totFlux     = totFlux + self.data['disk']
+            totFlux    += self.data['disk']
             componentNumber += 1
         if owall:
             if verbose:
                 print 'CALC_TOTAL: Adding outer wall component to the total flux.'
             if altOuter != None:
                 self.newOWall = self.data['owall'] * altOuter
-                totFlux = totFlux + self.newOWall           # Note: if save=1, will save owall w/ the original altinh.
+                totFlux += self.newOWall                     # Note: if save=1, will save owall w/ the original altinh.
                 self.owallH   = self.altinh * altOuter
             else:
-                totFlux       = totFlux + self.data['owall']
+                totFlux      += self.data['owall']
                 self.owallH   = self.altinh
                 # If we tried changing altinh but want to now plot original, deleting the "newOWall" attribute from before.
                 try:
@@ -1697,18 +2711,11 @@ class PTD_Model(TTS_Model):
                     pass
             componentNumber += 1
         if dust != 0:
-            try:
-                dustNum = numCheck(dust, high=dust_high)
-            except:
-                raise ValueError('CALC_TOTAL: Error! Dust input not a valid integer')
-            dustHDU     = fits.open(self.dpath+self.name+'_OTD_'+dustNum+'.fits')
+            dustFlux    = self._dustData(dust, dust_high)
             if verbose:
                 print 'CALC_TOTAL: Adding optically thin dust component to total flux.'
-            if self.new:
-                self.data['dust'] = dustHDU[0].data[1,:]
-            else:    
-                self.data['dust'] = dustHDU[0].data[:,1]
-            totFlux     = totFlux + self.data['dust']
+            self.data['dust'] = dustFlux
+            totFlux    += self.data['dust']
             componentNumber += 1
         
         # If scattered emission is in the dictionary, add it:
@@ -1716,7 +2723,7 @@ class PTD_Model(TTS_Model):
             scatt       = 1
             if verbose:
                 print('CALC_TOTAL: Adding scattered light component to the total flux.')
-            totFlux     = totFlux + self.data['scatt']
+            totFlux    += self.data['scatt']
             componentNumber += 1
         
         # Add the total flux array to the data dictionary attribute:
@@ -1761,11 +2768,616 @@ class PTD_Model(TTS_Model):
             
             # Trim the header and save:
             headerStr  = headerStr[0:-2]
-            filestring = '%s%s_%s.dat' % (self.dpath, self.name, numCheck(self.jobn, high=self.high))
+            filestring = '%s%s_%s.dat' % (self.dpath, self.name, self._jobString(self.jobn))
             np.savetxt(filestring, outputTable, fmt='%.3e', delimiter=', ', header=headerStr, comments='#')
         
         return
 
+class ModelGrid(object):
+    """
+    Holds every collated disk model of an object in one contiguous array, so that grid-wide operations can work on
+    whole NumPy slabs instead of on thousands of TTS_Model objects. The models can come from the individual fits
+    files in a directory (optionally cached in a .npy file that is memory mapped on later loads) or from the grid
+    container made by collate.py.
+    
+    ATTRIBUTES
+    name: Name of the object.
+    dpath: Path where the data files are located.
+    jobs: Array of the job number strings, in the order of the models in flux.
+    comps: List of the data keys of the components, in the order of the component axis of flux. 'extcorr' is the
+           self-extinction correction.
+    flux: Array of models x components x wavelengths. Components a model does not have, and the end of models with
+          fewer wavelengths than the longest one, are NaN.
+    present: Boolean array of models x components, True where the model has the component.
+    nwl: Array of the number of wavelengths in each model.
+    params: Record array of the header parameters of each model, with the header keywords as field names.
+    
+    METHODS
+    __init__: Loads the grid.
+    share: Moves the flux array into shared memory for worker processes.
+    index: Returns the position of a job in the grid.
+    component: Returns the slab of one component for all models.
+    model: Returns a TTS_Model for one job whose data are views into flux.
+    """
+    
+    # Data keys of the collate.py axis tags, in the order of the component axis:
+    axisKeys            = {'WLAXIS': 'wl', 'PHOTAXIS': 'phot', 'WALLAXIS': 'iwall', 'ANGAXIS': 'disk',
+                           'SCATAXIS': 'scatt', 'EXTAXIS': 'extcorr'}
+    
+    def __init__(self, name, dpath=datapath, grid=0, cache=None, rebuild=0):
+        """
+        Loads every model of the object into the flux array.
+        
+        INPUTS
+        name: Name of the object being modeled. Must match naming convention used for models.
+        dpath: The directory containing the collated files (or the grid container).
+        grid: BOOLEAN -- if 1 (True), load from the grid container (name_grid.fits) in dpath. The flux array is then
+              memory mapped straight from the container.
+        cache: A filename (.npy) to save the flux array in. The job numbers of its rows are saved next to it, in
+               cache + '.jobs'. If it exists, is newer than all of the model files and has the same jobs, it is memory
+               mapped instead of reading the model files again.
+        rebuild: BOOLEAN -- if 1 (True), ignore an existing cache file and read the model files again.
+        """
+        
+        self.name       = name
+        self.dpath      = dpath
+        self.comps      = [self.axisKeys[axis] for axis in GRIDAXES]
+        
+        if grid:
+            # The grid container already has the array we want:
+            self._hdulist   = fits.open(gridName(dpath, name), memmap=True)
+            axes            = [self._hdulist[0].header['COMP'+str(i)] for i in range(self._hdulist[0].header['NCOMP'])]
+            if axes != GRIDAXES:
+                raise IOError('MODELGRID: ' + gridName(dpath, name) + ' is not a grid of disk models!')
+            self.flux       = self._hdulist['FLUX'].data
+            self.params     = np.array(self._hdulist['PARAMS'].data).view(np.recarray)
+            self.jobs       = np.array(self.params['JOBNUM'], dtype='string')
+            self.nwl        = np.array(self.params['NWL'], dtype=int)
+            # A component no job has gets no column in the container:
+            self.present    = np.array([self.params[axis] >= 0 if axis in self.params.dtype.names else
+                                        np.zeros(len(self.jobs), dtype=bool) for axis in GRIDAXES]).T
+            return
+        
+        # Otherwise, the header parameters come from the header index:
+        index           = headerIndex(name, dpath=dpath)
+        keys            = sorted([key for key in index if key.isupper()])
+        self.jobs       = index['jobnum']
+        self.params     = np.rec.fromarrays([index[key] for key in keys], names=','.join(keys))
+        
+        # Files from the old version of collate have no axis tags, and always have wl, phot, iwall and disk:
+        if 'WLAXIS' in index:
+            old         = np.isnan(index['WLAXIS'])
+        else:
+            old         = np.ones(len(self.jobs), dtype=bool)
+        self.present    = np.array([~np.isnan(index[axis]) if axis in index else np.zeros(len(self.jobs), dtype=bool)
+                                    for axis in GRIDAXES]).T
+        self.present[old, :4] = True
+        
+        if (cache is not None and not rebuild and os.path.exists(cache) and os.path.exists(cache + '.jobs') and
+            len(self.jobs) != 0 and os.path.getmtime(cache) >= index['mtime'].max()):
+            f           = open(cache + '.jobs', 'r')
+            cachedJobs  = f.read().split()
+            f.close()
+            if cachedJobs == list(self.jobs):
+                self.flux   = np.load(cache, mmap_mode='r')
+                self.nwl    = np.sum(~np.isnan(self.flux[:, 0, :]), axis=1)
+                return
+        
+        # Read in every model file:
+        self.flux       = np.zeros((len(self.jobs), len(GRIDAXES), 0)) * np.nan
+        self.nwl        = np.zeros(len(self.jobs), dtype=int)
+        for i, filename in enumerate(index['filename']):
+            data        = fits.getdata(dpath + filename)
+            if old[i]:
+                data    = data.T
+            self.nwl[i] = data.shape[1]
+            if self.nwl[i] > self.flux.shape[2]:
+                pad     = np.zeros((len(self.jobs), len(GRIDAXES), self.nwl[i] - self.flux.shape[2])) * np.nan
+                self.flux = np.concatenate((self.flux, pad), axis=2)
+            for c, axis in enumerate(GRIDAXES):
+                if old[i] and c < 4:
+                    self.flux[i, c, :self.nwl[i]] = data[c]
+                elif not old[i] and self.present[i, c]:
+                    self.flux[i, c, :self.nwl[i]] = data[int(index[axis][i])]
+        
+        if cache is not None:
+            np.save(cache, self.flux)
+            f           = open(cache + '.jobs', 'w')
+            f.write('\n'.join(self.jobs))
+            f.close()
+        
+        return
+    
+    def __len__(self):
+        return len(self.jobs)
+    
+    def share(self):
+        """
+        Moves the flux array into shared memory, so that worker processes forked afterwards use it without copying or
+        pickling it. Does nothing if it is already there. fit_grid does this with more than one worker, so only the
+        first parallel fit of a grid pays for the copy (and reads a memory-mapped container grid into memory).
+        """
+        
+        if getattr(self, '_shared', None) is not None:
+            return
+        shape           = self.flux.shape
+        self._shared    = RawArray('d', int(np.prod(shape)))
+        flux            = np.frombuffer(self._shared, dtype=float).reshape(shape)
+        flux[:]         = self.flux
+        self.flux       = flux
+        return
+    
+    def index(self, jobn, high=0):
+        """
+        Returns the position of a job in the grid.
+        
+        INPUTS
+        jobn: The job number, either as an integer or as the 'XXX'/'XXXX' string.
+        high: BOOLEAN -- if 1 (True), an integer jobn is a 4-digit job.
+        """
+        
+        if not isinstance(jobn, str):
+            jobn        = numCheck(jobn, high=high)
+        where           = np.where(self.jobs == jobn)[0]
+        if len(where) == 0:
+            raise KeyError('MODELGRID: Job ' + jobn + ' is not in the grid of ' + self.name)
+        return where[0]
+    
+    def component(self, key):
+        """
+        Returns the (models x wavelengths) slab of one component, e.g. grid.component('disk'). This is a view.
+        """
+        
+        return self.flux[:, self.comps.index(key), :]
+    
+    def model(self, jobn, high=0):
+        """
+        Returns a TTS_Model for one job of the grid, with its parameters set and its data already initialized. The data
+        entries (and extcorr) are views into the flux array, so no data is copied.
+        
+        INPUTS
+        jobn: The job number, either as an integer or as the 'XXX'/'XXXX' string.
+        high: BOOLEAN -- if 1 (True), the job number is a 4-digit job.
+        """
+        
+        i               = self.index(jobn, high=high)
+        row             = self.params[i]
+        model           = TTS_Model.__new__(TTS_Model)
+        model.name      = self.name
+        model.jobn      = int(self.jobs[i])                             # An integer, like TTS_Model's, for calc_total
+        model.dpath     = self.dpath
+        model.high      = int(len(self.jobs[i]) == 4)
+        model.grid      = 0
+        model.lazy      = 0
+        model._metaInit(dict((key, row[key]) for key in self.params.dtype.names))
+        model.extcorr   = None
+        model.new       = 1
+        
+        model.data      = {}
+        for c, key in enumerate(self.comps):
+            if not self.present[i, c]:
+                continue
+            if key == 'extcorr':
+                model.extcorr   = self.flux[i, c, :self.nwl[i]]
+            else:
+                model.data[key] = self.flux[i, c, :self.nwl[i]]
+        return model
+
+def _gridWavelength(grid, rows, caller):
+    """
+    Returns the wavelength array shared by some models of a ModelGrid. Raises a ValueError if they don't all have the
+    same wavelengths.
+    
+    INPUTS
+    grid: The ModelGrid.
+    rows: The positions in the grid of the models.
+    caller: The name of the calling function or class, for the error message.
+    """
+    
+    nwl             = grid.nwl[rows]
+    if np.any(nwl != nwl[0]):
+        raise ValueError(caller + ': The models do not all have the same number of wavelengths.')
+    wl              = grid.component('wl')[rows, :nwl[0]]
+    if np.any(wl != wl[0]):
+        raise ValueError(caller + ': The models do not all have the same wavelengths.')
+    return np.array(wl[0], dtype=float)
+
+class SEDEmulator(object):
+    """
+    Predicts the SED of a disk model between the points of a regular grid of collated models, by multilinear
+    interpolation in log-flux over the parameter axes (and in log of the parameters that cover more than a factor of
+    100, like MDOT). This is meant for screening where a grid should be refined before submitting any new jobs.
+    
+    ATTRIBUTES
+    grid: The ModelGrid the emulator is built on.
+    params: The header keywords of the parameter axes that are interpolated over.
+    axes: The values along each parameter axis (log10 of them for a log axis).
+    logaxis: Whether each parameter axis is interpolated in log space.
+    fixed: Dictionary of the header keywords in params that have a single value in the grid -> that value.
+    lookup: Array with one dimension per parameter axis, holding the position in rows of the model at each grid point
+            (-1 where there is no model).
+    wl: The wavelengths shared by all of the models.
+    comps: The data keys of the flux components predicted.
+    
+    METHODS
+    __init__: Works out the parameter axes of the grid.
+    predict: Returns the predicted data dictionary for a set of parameters.
+    """
+    
+    def __init__(self, grid, params=['MDOT', 'ALPHA', 'AMAXS', 'EPS', 'ALTINH', 'TEMP'], rows=None):
+        """
+        Works out the regular parameter axes of a grid of models, and precomputes the log of the model fluxes.
+        
+        INPUTS
+        grid: The ModelGrid to emulate.
+        params: The header keywords to interpolate over.
+        rows: The positions in the grid of the models to use. If None, uses all of them. Any parameter not in params
+              must have a single value among these models, and they must all have the same wavelengths.
+        """
+        
+        if rows is None:
+            rows        = np.arange(len(grid))
+        rows            = np.asarray(rows)
+        self.grid       = grid
+        self.wl         = _gridWavelength(grid, rows, 'SEDEMULATOR')
+        self.params     = []
+        self.axes       = []
+        self.logaxis    = []
+        self.fixed      = {}
+        
+        where           = []
+        for key in params:
+            if key not in grid.params.dtype.names:
+                raise KeyError('SEDEMULATOR: ' + key + ' is not a header keyword of the grid.')
+            column      = np.asarray(grid.params[key][rows], dtype=float)
+            values      = np.unique(column)
+            if np.any(np.isnan(values)):
+                raise ValueError('SEDEMULATOR: Some of the models have no ' + key + '.')
+            if len(values) == 1:
+                self.fixed[key] = values[0]
+                continue
+            logaxis     = values[0] > 0 and values[-1] > 100*values[0]
+            self.params.append(key)
+            self.logaxis.append(logaxis)
+            self.axes.append(np.log10(values) if logaxis else values)
+            where.append(np.searchsorted(values, column))
+        
+        # Fill in which model sits at each point of the grid:
+        self.lookup     = -1 * np.ones([len(axis) for axis in self.axes], dtype=int)
+        if len(where) != 0:
+            points      = tuple(where)
+            if len(set(zip(*where))) != len(rows):
+                raise ValueError('SEDEMULATOR: Several models share the same ' + ', '.join(self.params) + '. Use rows ' +
+                                 'to pick models that only differ in those parameters.')
+            self.lookup[points] = np.arange(len(rows))
+        elif len(rows) != 1:
+            raise ValueError('SEDEMULATOR: None of the parameters vary between the models!')
+        else:
+            self.lookup = np.array(0)
+        self._rows      = rows
+        
+        # The flux components every model has are predicted:
+        keep            = np.all(grid.present[rows], axis=0)
+        self.comps      = [key for c, key in enumerate(grid.comps) if keep[c] and key not in ['wl', 'extcorr']]
+        index           = [grid.comps.index(key) for key in self.comps]
+        
+        # Precompute the log of the fluxes of these models (NaN where they are not positive):
+        self._flux      = np.array(grid.flux[rows][:, index, :len(self.wl)], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._logflux = np.where(self._flux > 0, np.log10(self._flux), np.nan)
+        
+        return
+    
+    def predict(self, **kwargs):
+        """
+        Predicts the SED of a model with the given parameters.
+        
+        INPUTS
+        **kwargs: The value of each parameter, with the lowercase header keyword as the keyword (e.g. mdot=3e-9).
+                  Parameters that have a single value in the grid may be left out.
+        
+        OUTPUT
+        data: Dictionary with the same component keys as TTS_Model.data ('wl', 'phot', 'iwall', 'disk', 'scatt').
+        """
+        
+        values          = dict((key.upper(), value) for key, value in kwargs.items())
+        for key in values:
+            if key not in self.params and key not in self.fixed:
+                raise KeyError('SEDEMULATOR: ' + key + ' is not one of the parameters of the emulator.')
+        for key, value in self.fixed.items():
+            if key in values and not np.isclose(values[key], value):
+                raise ValueError('SEDEMULATOR: ' + key + ' only has the value ' + str(value) + ' in the grid.')
+        for key in self.params:
+            if key not in values:
+                raise ValueError('SEDEMULATOR: A value is needed for ' + key + '.')
+        rows, weights   = self._corners([values[key] for key in self.params])
+        
+        flux            = 10**np.tensordot(weights, self._logflux[rows], axes=1)
+        # Where the flux is not positive in some corner, fall back on linear interpolation:
+        bad             = np.isnan(flux)
+        if np.any(bad):
+            flux[bad]   = np.tensordot(weights, self._flux[rows], axes=1)[bad]
+        
+        data            = {'wl': self.wl.copy()}
+        for c, key in enumerate(self.comps):
+            data[key]   = flux[c]
+        return data
+    
+    def _corners(self, point):
+        """
+        Finds the models at the corners of the grid cell around a point, and their interpolation weights.
+        
+        INPUTS
+        point: The value of each of the parameters, in the order of params.
+        
+        OUTPUT
+        rows: The positions of the corner models, leaving out the ones with no weight.
+        weights: The weight of each corner model.
+        """
+        
+        # Find the bracketing points and weights along each axis:
+        brackets        = []
+        for key, value, axis, logaxis in zip(self.params, point, self.axes, self.logaxis):
+            value       = np.log10(value) if logaxis else float(value)
+            if not axis[0] <= value <= axis[-1]:
+                raise ValueError('SEDEMULATOR: ' + key + ' = ' + str(point[len(brackets)]) + ' is outside of the grid.')
+            hi          = min(np.searchsorted(axis, value, side='right'), len(axis)-1)
+            lo          = hi - 1
+            frac        = (value - axis[lo]) / (axis[hi] - axis[lo])
+            # Points with no weight are left out:
+            brackets.append([(i, w) for i, w in [(lo, 1-frac), (hi, frac)] if w > 0])
+        
+        # Every corner of the cell around the point:
+        rows            = []
+        weights         = []
+        for corner in itertools.product(*brackets):
+            index       = tuple(i for i, w in corner)
+            row         = self.lookup[index]
+            if row < 0:
+                raise ValueError('SEDEMULATOR: The grid is missing the model at ' +
+                                 ', '.join('%s = %g' % (key, self._value(k, i)) for k, (key, i) in
+                                           enumerate(zip(self.params, index))))
+            rows.append(row)
+            weights.append(np.prod([w for i, w in corner]))
+        
+        return rows, np.array(weights)
+    
+    def _value(self, k, i):
+        return 10**self.axes[k][i] if self.logaxis[k] else self.axes[k][i]
+
+class Likelihood(object):
+    """
+    A log-likelihood of the observations of an object, meant to be called millions of times (e.g. by an MCMC sampler).
+    Everything that doesn't depend on the model is worked out once: the observed vectors and weights (as in
+    model_rchi2), the interpolation onto the observed wavelengths, and the model points it needs. Each call then
+    only fills preallocated buffers. With an SEDEmulator, a call also blends the (up to 2^k) corner models of the grid
+    cell, so it is slower than picking a row of a ModelGrid.
+    
+    The log-likelihood is -chi^2/2, where chi^2 is the (not reduced) chi-squared of model_rchi2. Calls with parameters
+    outside of the grid, or negative scales, return -inf.
+    
+    ATTRIBUTES
+    obs: The TTS_Obs() instance of the observations.
+    source: The SEDEmulator (or ModelGrid) the models come from.
+    names: The names of the parameters the likelihood is called with, in order. These are the lowercase parameters of
+           an SEDEmulator (or 'row', the position of a model in a ModelGrid), followed by 'scale_<component>' for each
+           of the scales. The row is a discrete index: it must be a whole number, and anything else raises a
+           ValueError.
+    wavelength, flux, weights: The observations, as returned by obsPrep().
+    comps: The components added up to make the total flux of a model.
+    
+    METHODS
+    __init__: Works out everything that doesn't depend on the model.
+    __call__: Returns the log-likelihood of a model.
+    """
+    
+    def __init__(self, obs, source, components=None, scales=None, obspath=datapath):
+        """
+        INPUTS
+        obs: The observations. Either a TTS_Obs() instance, or the name of the object to load the pickle of.
+        source: An SEDEmulator to predict the models from, or a ModelGrid to pick them from. The models must all have
+                the same wavelengths.
+        components: The components to add up into the total flux. If None, uses all of the flux components.
+        scales: List of the components whose amplitudes are extra parameters of the likelihood (e.g. ['iwall'] to
+                explore the inner wall height, like calc_total's altinh).
+        obspath: The path containing the observations pickle, if obs is a name.
+        """
+        
+        if not isinstance(obs, TTS_Obs):
+            obs         = loadPickle(obs, picklepath=obspath)
+        self.obs        = obs
+        self.source     = source
+        self.wavelength, self.flux, self.weights = obsPrep(obs)
+        
+        if isinstance(source, SEDEmulator):
+            grid        = source.grid
+            rows        = source._rows
+            self.names  = [key.lower() for key in source.params]
+        else:
+            grid        = source
+            rows        = np.arange(len(grid))
+            self.names  = ['row']
+        if components is None:
+            components  = [key for key in grid.comps if key not in ['wl', 'extcorr']]
+        if scales is None:
+            scales      = []
+        for key in components:
+            if not np.all(grid.present[rows, grid.comps.index(key)]):
+                raise ValueError('LIKELIHOOD: Not every model has the ' + key + ' component.')
+        for key in scales:
+            if key not in components:
+                raise ValueError('LIKELIHOOD: The scaled component ' + key + ' is not one of the components.')
+        self.comps      = list(components)
+        self.names     += ['scale_' + key for key in scales]
+        self._scaled    = [self.comps.index(key) for key in scales]
+        self._nparams   = len(self.names) - len(scales)
+        
+        # Only the model points bracketing the observations are needed:
+        if isinstance(source, SEDEmulator):
+            wl          = source.wl
+        else:
+            wl          = _gridWavelength(grid, rows, 'LIKELIHOOD')
+        lo, hi, frac    = interpWeights(wl, self.wavelength)
+        cols, where     = np.unique(np.concatenate((lo, hi)), return_inverse=True)
+        self._lo        = where[:len(lo)]
+        self._hi        = where[len(lo):]
+        self._frac      = frac
+        self._unfrac    = 1 - frac
+        self._scale     = self.weights / self.flux
+        index           = [grid.comps.index(key) for key in self.comps]
+        self._models    = np.ascontiguousarray(grid.flux[rows][:, index][:, :, cols], dtype=float)
+        if isinstance(source, SEDEmulator):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self._logmodels = np.where(self._models > 0, np.log(self._models), np.nan)
+            
+            # The corners of a grid cell, as (upper or lower point along each axis, offset in the flattened lookup):
+            naxes       = len(source.params)
+            self._axes  = [list(axis) for axis in source.axes]
+            self._logaxis = list(source.logaxis)
+            self._lookup = source.lookup.ravel()
+            self._strides = [stride // source.lookup.itemsize for stride in source.lookup.strides]
+            self._corners = [(bits, sum(bit*stride for bit, stride in zip(bits, self._strides)))
+                             for bits in itertools.product([0, 1], repeat=naxes)]
+            self._cornerFrac = [0.0] * naxes
+            self._weights = np.zeros(len(self._corners))
+            self._rows  = np.zeros(len(self._corners), dtype=int)
+        
+        # The buffers every call fills in:
+        shape           = (len(self.comps), len(cols))
+        self._log       = np.zeros(shape)
+        self._linear    = np.zeros(shape)
+        self._temp      = np.zeros(shape)
+        self._bad       = np.zeros(shape, dtype=bool)
+        self._amps      = np.ones(len(self.comps))
+        self._total     = np.zeros(len(cols))
+        self._model     = np.zeros(len(frac))
+        self._upper     = np.zeros(len(frac))
+        
+        return
+    
+    def __call__(self, theta):
+        """
+        Returns the log-likelihood of the model with the parameters theta (in the order of names).
+        """
+        
+        if len(theta) != len(self.names):
+            raise ValueError('LIKELIHOOD: Expected the parameters ' + ', '.join(self.names))
+        for k, c in enumerate(self._scaled):
+            self._amps[c] = theta[self._nparams + k]
+            if self._amps[c] < 0:
+                return -np.inf
+        
+        if isinstance(self.source, SEDEmulator):
+            # Find the bracketing points and weights along each axis (as in SEDEmulator._corners):
+            base        = 0
+            for k, axis in enumerate(self._axes):
+                value   = theta[k]
+                if self._logaxis[k]:
+                    if not value > 0:
+                        return -np.inf
+                    value = math.log10(value)
+                if not axis[0] <= value <= axis[-1]:
+                    return -np.inf
+                hi      = min(bisect.bisect_right(axis, value), len(axis)-1)
+                base   += (hi - 1) * self._strides[k]
+                self._cornerFrac[k] = (value - axis[hi-1]) / (axis[hi] - axis[hi-1])
+            
+            # Interpolate in log-flux, like SEDEmulator.predict (corners with no weight are left out). With at most a
+            # few corners, their weights are quickest to work out one number at a time:
+            self._log[:] = 0.0
+            for j, (bits, offset) in enumerate(self._corners):
+                weight  = 1.0
+                for frac, bit in zip(self._cornerFrac, bits):
+                    weight *= frac if bit else 1.0 - frac
+                self._weights[j] = weight
+                if weight <= 0:
+                    continue
+                row     = self._lookup[base + offset]
+                if row < 0:
+                    return -np.inf
+                self._rows[j] = row
+                np.multiply(self._logmodels[row], weight, out=self._temp)
+                self._log += self._temp
+            np.exp(self._log, out=self._log)
+            # Where the flux is not positive in some corner, fall back on linear interpolation:
+            np.isnan(self._log, out=self._bad)
+            if self._bad.any():
+                self._linear[:] = 0.0
+                for j in range(len(self._rows)):
+                    if self._weights[j] > 0:
+                        np.multiply(self._models[self._rows[j]], self._weights[j], out=self._temp)
+                        self._linear += self._temp
+                np.copyto(self._log, self._linear, where=self._bad)
+            components = self._log
+        else:
+            row         = int(theta[0])
+            if row != theta[0]:
+                raise ValueError('LIKELIHOOD: The row of a ModelGrid is the integer position of a model, not ' +
+                                 str(theta[0]) + '.')
+            if not 0 <= row < len(self._models):
+                return -np.inf
+            components  = self._models[row]
+        np.dot(self._amps, components, out=self._total)
+        
+        # Interpolate onto the observations and add up the chi-squared:
+        np.take(self._total, self._lo, out=self._model)
+        self._model *= self._unfrac
+        np.take(self._total, self._hi, out=self._upper)
+        self._upper *= self._frac
+        self._model += self._upper
+        np.subtract(self.flux, self._model, out=self._model)
+        self._model *= self._scale
+        
+        return -0.5 * np.dot(self._model, self._model)
+
+def benchmark_likelihood(like=None, ncalls=20000):
+    """
+    Measures how many times per second a Likelihood can be called, and checks it against model_rchi2.
+    
+    INPUTS
+    like: The Likelihood to time. If None (default), one is made for a fake SED and an SEDEmulator over a fake grid.
+    ncalls: The number of calls to time.
+    
+    OUTPUT
+    Prints and returns the number of calls per second.
+    """
+    
+    random      = np.random.RandomState(0)
+    if like is None:
+        like    = Likelihood(_benchmarkObs(random), SEDEmulator(_benchmarkGrid(400, 1200, random), params=['MDOT', 'ALPHA']),
+                             scales=['iwall'])
+    
+    # Random points inside the grid to call it with:
+    if isinstance(like.source, SEDEmulator):
+        low     = [(10**axis[0] if log else axis[0]) for axis, log in zip(like.source.axes, like.source.logaxis)]
+        high    = [(10**axis[-1] if log else axis[-1]) for axis, log in zip(like.source.axes, like.source.logaxis)]
+        points  = random.uniform(low, high, (min(ncalls, 1000), len(low)))
+    else:
+        points  = random.randint(0, len(like.source), (min(ncalls, 1000), 1))
+    points      = np.column_stack((points, random.uniform(0.5, 2, (len(points), len(like.names) - points.shape[1]))))
+    
+    # Check one call against the chi-squared of model_rchi2:
+    theta       = points[0]
+    if isinstance(like.source, SEDEmulator):
+        data    = like.source.predict(**dict(zip(like.names[:like._nparams], theta)))
+    else:
+        data    = like.source.model(like.source.jobs[int(theta[0])]).data
+    total       = np.zeros(len(data['wl']))
+    for k, key in enumerate(like.comps):
+        scale   = theta[len(like.names) - len(like._scaled) + like._scaled.index(k)] if k in like._scaled else 1.0
+        total  += scale * data[key]
+    chi_arr     = (like.flux - np.interp(like.wavelength, data['wl'], total)) * like.weights / like.flux
+    if not np.isclose(like(theta), -0.5*np.sum(chi_arr*chi_arr)):
+        print('WARNING: THE LIKELIHOOD DOES NOT AGREE WITH MODEL_RCHI2')
+    
+    start       = time.time()
+    for i in range(ncalls):
+        like(points[i % len(points)])
+    rate        = ncalls / (time.time() - start)
+    print('LIKELIHOOD: %.0f calls per second' % rate)
+    
+    return rate
+
 class TTS_Obs(object):
     """
     Contains all the observational data for a given target system. Allows you to create a pickle with the data, so it can
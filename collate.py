@@ -1,11 +1,35 @@
 import numpy as np
 from astropy.io import fits
 from astropy.io import ascii
+from astropy.table import Table
 from glob import glob
 #import pdb
 import os
-
-def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinct = 0, noangle = 0, nowall = 0, nophot = 0, noscatt = 1):
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import tempfile
+import shutil
+import time
+import re
+import json
+import hashlib
+import gzip
+import tarfile
+import struct
+import io
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinct = 0, noangle = 0, nowall = 0, nophot = 0, noscatt = 1, fortran = 0, index = None, grid = 0):
     """
      collate.py                                                                          
                                                                                            
@@ -54,6 +78,22 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                      Set this value to 1 (or True) if you do NOT want to include the scattered light file.
                      Set this value to 0 (or False) if you DO want to include the scattered light file
 
+            fortran: Set this value to 1 (or True) to recover Fortran style exponents that are
+                     missing the E (e.g., 1.234-310 is read as 1.234E-310) instead of setting
+                     them to NaN.
+
+            index: Dictionary of job number -> output files, as made by jobIndex(path, name). If given,
+                   the output files are looked up there instead of searching the path directory
+                   for every file. Use this when collating many jobs from the same directory.
+
+            grid: Set this value to 1 (or True) to also add the model to the grid container of the
+                  object in the destination directory (see gridAppend and gridName). When collating
+                  many jobs, use the grid keyword of collate_grid instead.
+
+     OUTPUT:
+            Returns the name of the fits file that was written. If the job file is missing or
+            the labelend does not match, nothing is written and None is returned.
+
      EXAMPLES:                                                                                
             To collate a single model run for the object 'myobject' under the
             job number '001', use the following commands:
@@ -68,16 +108,16 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
             Note that:
             modelnum = '001' will also work.
 
-            collate.py cannot handle multiple models at once, and currently needs to be
-            run in a loop. An example run with 100 optically thin dust models would
-            look something like this:
+            collate.py handles one model per call. To collate a whole grid at once, use
+            collate_grid, which spreads the jobs over several processes. An example run 
+            with 100 disk models and 100 optically thin dust models would look something 
+            like this:
 
-            from collate import collate
+            from collate import collate_grid
             path = 'Some/path/on/the/cluster/where/your/model/files/are/located/'
             name = 'myobject'
             dest = 'where/I/want/my/collated/files/to/go/'
-            for i in range(100):
-                collate(path, i+1, name, dest, optthin = 1)
+            summary = collate_grid(path, name, dest, range(1,101), otdnums = range(1,101), workers = 8)
                                     
                
      NOTES:
@@ -124,13 +164,14 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         job = 'job_optthin'+jobnum
 
         try:
-            f = open(path+job, 'r')
-        except IOError:
+            f = _openFile(_locate(index, jobnum, 'otdjob', path+job)[0])
+        except (IndexError, IOError):
             print('MISSING JOB NUMBER '+jobnum+', RETURNING...')
             return
 
         jobf  = f.read()
         f.close()
+        jobp  = jobParse(jobf)[0]
         
         #Define what variables to record
         sdparam = (['TSTAR', 'RSTAR', 'DISTANCIA', 'MUI', 'ROUT', 'RIN', 'TAUMIN', 'POWER',
@@ -140,12 +181,12 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         
         #Read in the data associated with this model
         dataarr = np.array([])
-        file = glob(path+'fort16*'+name+'*'+jobnum)
+        file = _locate(index, jobnum, 'fort16', path+'fort16*'+name+'*'+jobnum)
         failed = 0
         size = 0
         miss = 0
         try:
-            size = os.path.getsize(file[0])
+            size = _fileSize(file[0])
         except IndexError:
             print("WARNING: JOB "+jobnum+" MISSING FORT16 FILE (OPTICALLY THIN DUST MODEL), ADDED 'FAILED' TAG TO HEADER")
             failed = True
@@ -155,34 +196,24 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
             failed = True
 
         if failed == False:
-            data = ascii.read(file[0])
+            data, floaterr = readFort16(file[0], fortran = fortran)
         #Combine data into a single array to be consistant with previous version of collate
             if size !=0:
-                dataarr = np.concatenate((dataarr, data['col1']))
-                dataarr = np.concatenate((dataarr, data['col3']))
+                dataarr = np.concatenate((dataarr, data[0]))
+                dataarr = np.concatenate((dataarr, data[1]))
 
         #If the file is missing/empty, add an empty array to collated file
         if failed != 0:
             dataarr = np.array([])
 
-        #Convert anything that can't be read as a float into a nan
-        tempdata = np.zeros(len(dataarr))
-        floaterr = 0
-
+        #Anything that couldn't be read as a float was already turned into a nan by the reader
         if failed == 0:
-            for i, value in enumerate(dataarr):
-                try:
-                    tempdata[i] = float(dataarr[i]) #dataarr[i].astype(float)
-                except ValueError:
-                    floaterr = 1
-                    tempdata[i] = float('nan')
-                    
             if floaterr == 1:
                 print('WARNING: JOB '+jobnum+' FILES CONTAIN FLOAT OVERFLOW/UNDERFLOW ERRORS, THESE VALUES HAVE BEEN SET TO NAN')
 
             axis_count = 2; #One axis for flux, one for wavelength
 
-            dataarr = np.reshape(tempdata, (axis_count, len(tempdata)/axis_count))
+            dataarr = np.reshape(dataarr, (axis_count, len(dataarr)/axis_count))
 
         #Make an HDU object to contain header/data
         hdu = fits.PrimaryHDU(dataarr)
@@ -192,13 +223,12 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
             
             #Handles the case of AMAXS which is formatted slightly differently
             if param  == 'AMAXS':
-                for num in range(10):
-                    if jobf.split("lamax='amax")[num].split("\n")[-1][0] == 's':
-                        samax = jobf.split("lamax='amax")[num+1].split("'")[0]
-                        if samax == '1mm':
-                            hdu.header.set(param, 1000.)
-                        else:
-                            hdu.header.set(param, float(samax.replace('p', '.')))
+                if 'lamax' in jobp:
+                    samax = jobp['lamax'].replace('amax', '', 1)
+                    if samax == '1mm':
+                        hdu.header.set(param, 1000.)
+                    else:
+                        hdu.header.set(param, float(samax.replace('p', '.')))
                             
                             
             #Handle the rest of the variables
@@ -210,18 +240,25 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                     param = 'FUDGETRO'
                 elif param == 'FRACFORST':
                     param = 'FRACFORS'
-                hdu.header.set(param, float(jobf.split("set "+paramold+"='")[1].split("'")[0]))
+                hdu.header.set(param, float(jobp[paramold]))
                 
         hdu.header.set('OBJNAME', name)
         hdu.header.set('JOBNUM', jobnum)
         hdu.header.set('OPTTHIN', 1)
         hdu.header.set('WLAXIS', 0)
         hdu.header.set('LFLAXIS',1)
+
+        #Record how many values could not be read, so healthCheck does not need to load the data
+        hdu.header.set('NNAN', int(np.isnan(dataarr).sum()))
         
         if failed == 1:
             hdu.header.set('Failed', 1)
         
-        hdu.writeto(destination+name+'_OTD_'+jobnum+'.fits', clobber = clob)
+        outfile = destination+name+'_OTD_'+jobnum+'.fits'
+        hdu.writeto(outfile, clobber = clob)
+
+        if grid:
+            gridAppend(gridName(destination, name, optthin = 1), [hdu])
 
         if nowall == 1 or noangle == 1 or nophot == 1:
             print("WARNING: KEYWORDS THAT HAVE NO AFFECT ON OPTICALLY THIN DUST HAVE BEEN USED (NOPHOT, NOWALL, NOANGLE)")
@@ -233,17 +270,18 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         job = 'job'+jobnum
 
         try: 
-            f = open(path+job, 'r')
-        except IOError:
+            f = _openFile(_locate(index, jobnum, 'job', path+job)[0])
+        except (IndexError, IOError):
             print('MISSING JOB FILE '+jobnum+', RETURNING...')
             return
 
         jobf = f.read()
         f.close()
+        jobp = jobParse(jobf)[0]
 
 
         #Check to see if the name + jobnum matches up with the labelend, if it doens't, return
-        labelend = jobf.split("set labelend='")[1].split("'")[0]
+        labelend = jobp['labelend']
 
         if labelend != name+'_'+jobnum:
             print('NAME IS NOT THE SAME AS THE NAME IN JOB '+jobnum+' LABELEND, RETURNING...')
@@ -259,38 +297,32 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         #Parse variables according to convention in the job file
         for ind, param in enumerate(sparam):
             if param == 'AMAXS':
-                num_amax = 10 #Number of choices for AMAX, including the case where amax can be 1mm (1000 microns)
-                for num in range(num_amax):
-                    if jobf.split("AMAXS='")[num+1].split("\n")[1][0] == '#':
-                        continue
-                    elif jobf.split("AMAXS='")[num+1].split("\n")[1][0] == 's':
-                        dparam[ind] = float(jobf.split(param+"='")[num+1].split("'")[0])
-                    elif dparam[ind] == 0. and num == num_amax-1:
-                        dparam[ind] = 1000. #HANDLES THE CASE THAT MM SIZED DUST GRAINS EXIST IN JOBFILE
+                if param in jobp:
+                    dparam[ind] = float(jobp[param])
+                else:
+                    dparam[ind] = 1000. #HANDLES THE CASE THAT MM SIZED DUST GRAINS EXIST IN JOBFILE
             
             elif param == 'EPS':
-                for num in range(7):
-                    if jobf.split("EPS='")[num+1].split("\n")[1][0] == '#' and num != 7:
-                        continue
-                    elif jobf.split("EPS='")[num+1].split("\n")[1][0] == 's':
-                        dparam[ind] = float(jobf.split(param+"='")[num+1].split("'")[0])
-                    else: 
-                        raise IOError('COLLATE FAILED ON EPSILON VALUE. FIX JOB FILE '+jobnum)
+                if param not in jobp:
+                    raise IOError('COLLATE FAILED ON EPSILON VALUE. FIX JOB FILE '+jobnum)
+                dparam[ind] = float(jobp[param])
             
             elif param == 'TEMP' or param == 'TSHOCK':
                 try:
-                    dparam[ind] = float(jobf.split(param+"=")[1].split(".")[0])
+                    if '.' not in jobp[param]:
+                        raise ValueError
+                    dparam[ind] = float(jobp[param].split(".")[0])
                 except ValueError:
                     raise ValueError('COLLATE: MISSING . AFTER '+param+' VALUE, GO FIX IN JOB FILE ' +jobnum)
             
             elif param == 'ALTINH':
                 try:
-                    dparam[ind] = float(jobf.split(param+"=")[1].split(" ")[0])
+                    dparam[ind] = float(jobp[param])
                 except ValueError:
                     raise ValueError('COLLATE MISSING SPACE [ ] AFTER ALTINH VALUE, GO FIX IN JOB FILE '+jobnum)
             
             else:
-                dparam[ind] = float(jobf.split(param+"='")[1].split("'")[0])
+                dparam[ind] = float(jobp[param])
 
         #Rename header labels that are too long
         sparam[sparam.index('AMORPFRAC_OLIVINE')]  = 'AMORF_OL'
@@ -316,13 +348,14 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         #Also handles errors for missing/empty files
 
         failed = False;
+        floaterr = 0
         size = 0
         miss = 0
 
         if nophot == 0:
-            photfile = glob(path+'Phot*'+jobnum)
+            photfile = _locate(index, jobnum, 'phot', path+'Phot*'+jobnum)
             try:
-                size = os.path.getsize(photfile[0])
+                size = _fileSize(photfile[0])
             except IndexError:
                 print("WARNING: JOB "+jobnum+" MISSING PHOTOSPHERE FILE, ADDED 'FAILED' TAG TO HEADER. NOPHOT SET TO 1") 
                 nophot = 1
@@ -330,10 +363,11 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                 miss = 1
 
             if miss != 1 and size != 0:
-                phot  = ascii.read(photfile[0])
+                phot, err = readPhot(photfile[0], fortran = fortran)
+                floaterr = floaterr | err
                 axis['PHOTAXIS'] = axis_count
-                dataarr = np.concatenate((dataarr, phot['col1']))
-                dataarr = np.concatenate((dataarr, phot['col2']))
+                dataarr = np.concatenate((dataarr, phot[0]))
+                dataarr = np.concatenate((dataarr, phot[1]))
                 axis_count += 1
             elif miss != 1 and size == 0:
                 print("WARNING: JOB "+jobnum+" PHOT FILE EMPTY, ADDED 'FAILED' TAG TO HEADER. NOPHOT SET TO 1")
@@ -347,9 +381,9 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         miss = 0
 
         if nowall == 0:
-            wallfile = glob(path+'fort17*'+name+'_'+jobnum)
+            wallfile = _locate(index, jobnum, 'wall', path+'fort17*'+name+'_'+jobnum)
             try:
-                size = os.path.getsize(wallfile[0])
+                size = _fileSize(wallfile[0])
             except IndexError:
                 print("WARNING: JOB "+jobnum+" MISSING FORT17 (WALL) FILE, ADDED 'FAILED' TAG TO HEADER. NOWALL SET TO 1")
                 nowall = 1
@@ -357,13 +391,14 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                 miss = 1
             
             if miss != 1 and size != 0:
-                wall  =  ascii.read(wallfile[0], data_start = 9)
+                wall, err = readWall(wallfile[0], fortran = fortran)
+                floaterr = floaterr | err
                 axis['WALLAXIS'] = axis_count
                 #If the photosphere was not run, then grab wavelength information from wall file
                 if nophot != 0: 
-                    dataarr = np.concatenate((dataarr, wall['col1']))
+                    dataarr = np.concatenate((dataarr, wall[0]))
 
-                dataarr = np.concatenate((dataarr, wall['col2']))
+                dataarr = np.concatenate((dataarr, wall[1]))
                 axis_count += 1
             
             elif miss != 1 and size == 0:
@@ -378,9 +413,9 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         size = 0
 
         if noangle == 0:
-            anglefile = glob(path+'angle*'+name+'_'+jobnum+'*')
+            anglefile = _locate(index, jobnum, 'angle', path+'angle*'+name+'_'+jobnum+'*')
             try:
-                size = os.path.getsize(anglefile[0])
+                size = _fileSize(anglefile[0])
             except IndexError:
                 print("WARNING: JOB "+jobnum+" MISSING ANGLE (DISK) FILE, ADDED 'FAILED' TAG TO HEADER. NOANGLE SET TO 1")
                 noangle = 1
@@ -388,13 +423,14 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                 miss = 1
  
             if miss != 1 and size != 0:
-                angle = ascii.read(anglefile[0], data_start = 1)
+                angle, err = readAngle(anglefile[0], fortran = fortran)
+                floaterr = floaterr | err
                 axis['ANGAXIS'] = axis_count
                     #If the photosphere was not run, and the wall was not run then grab wavelength information from angle file
                 if nophot != 0 and nowall != 0:
-                    dataarr = np.concatenate((dataarr, angle['col1']))
+                    dataarr = np.concatenate((dataarr, angle[0]))
 
-                dataarr = np.concatenate((dataarr, angle['col4']))
+                dataarr = np.concatenate((dataarr, angle[1]))
                 axis_count += 1
                
             elif miss != 1 and size == 0:
@@ -409,9 +445,9 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         size = 0
 
         if noscatt == 0:
-            scattfile = glob(path+'scatt*'+name+'_'+jobnum+'*')
+            scattfile = _locate(index, jobnum, 'scatt', path+'scatt*'+name+'_'+jobnum+'*')
             try:
-                size = os.path.getsize(scattfile[0])
+                size = _fileSize(scattfile[0])
             except IndexError:
                 print("WARNING: JOB "+jobnum+" MISSING SCATT FILE, ADDED 'FAILED' TAG TO HEADER. NOSCATT SET TO 1")
                 noscatt = 1
@@ -419,13 +455,14 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                 miss = 1
  
             if miss != 1 and size > 100:
-                scatt = ascii.read(scattfile[0], data_start = 1)
+                scatt, err = readScatt(scattfile[0], fortran = fortran)
+                floaterr = floaterr | err
                 axis['SCATAXIS'] = axis_count
                     #If the photosphere, wall and disk were not run, then grab wavelength information from scatt file
                 if nophot != 0 and nowall != 0 and noangle != 0:
-                    dataarr = np.concatenate((dataarr, scatt['col1']))
+                    dataarr = np.concatenate((dataarr, scatt[0]))
 
-                dataarr = np.concatenate((dataarr, scatt['col4']))
+                dataarr = np.concatenate((dataarr, scatt[1]))
                 axis_count += 1
                 
             elif miss != 1 and size == 0 or miss != 1 and size < 100:
@@ -442,7 +479,7 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
                 failed = 1
                 noextinct = 1
             else:
-                dataarr = np.concatenate((dataarr, angle['col6']))
+                dataarr = np.concatenate((dataarr, angle[2]))
                 axis['EXTAXIS'] = axis_count
                 axis_count += 1
 
@@ -451,24 +488,10 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
 
 
 
-        #if data has values that overflow/underflow float type, replace them with NaN dataarr = tempdata
-
-        tempdata = np.zeros(len(dataarr))
-        floaterr = 0 
-
-
-        for i, value in enumerate(dataarr):
-            try:
-                tempdata[i] = float(dataarr[i]) #dataarr[i].astype(float)
-            except ValueError:
-                floaterr = 1
-                tempdata[i] = float('nan')
-
+        #if data has values that overflow/underflow float type, the readers replaced them with NaN
         if floaterr == 1:
             print('WARNING: JOB '+jobnum+' FILES CONTAIN FLOAT OVERFLOW/UNDERFLOW ERRORS, THESE VALUES HAVE BEEN SET TO NAN')
 
-        dataarr = tempdata
-
         #Put data array into the standard form for EDGE
         dataarr = np.reshape(dataarr, (axis_count, len(dataarr)/axis_count))
 
@@ -489,12 +512,20 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
         for i, param in enumerate(sparam):
             hdu.header.set(param, dparam[i])
 
-        hdu.header.set('RIN', float(np.loadtxt(glob(path+'rin*'+name+'_'+jobnum)[0])))
+        f = _openFile(_locate(index, jobnum, 'rin', path+'rin*'+name+'_'+jobnum)[0])
+        hdu.header.set('RIN', float(np.loadtxt(f)))
+        f.close()
         
         #Create tags in the header that match up each column to the data enclosed]
         for naxis in axis:
             hdu.header.set(naxis, axis[naxis])
 
+        #Record how many values could not be read and how many scattered light values are negative,
+        #so healthCheck does not need to load the data
+        hdu.header.set('NNAN', int(np.isnan(dataarr).sum()))
+        if 'SCATAXIS' in axis:
+            hdu.header.set('NSCATNEG', int((dataarr[axis['SCATAXIS'],:] < 0).sum()))
+
         #Add a tag to the header if the noextinct flag is on
         if noextinct == 1:
             hdu.header.set('NOEXT', 1)
@@ -505,13 +536,1357 @@ def collate(path, jobnum, name, destination, optthin=0, clob=0, high=0, noextinc
             hdu.header.set('FAILED', 1)
 
         #Write header to fits file
-        hdu.writeto(destination+name+'_'+jobnum+'.fits', clobber = clob)
+        outfile = destination+name+'_'+jobnum+'.fits'
+        hdu.writeto(outfile, clobber = clob)
+
+        if grid:
+            gridAppend(gridName(destination, name), [hdu])
         
 
     # If you don't give a valid input for the optthin keyword, raise an error
     else:
         raise IOError('COLLATE: INVALID INPUT FOR OPTTHIN KEYWORD, SHOULD BE 1 OR 0')
     
+    return outfile
+
+def collate_grid(path, name, destination, jobnums, otdnums = None, workers = None, high = 0, incremental = 0, hashes = 0, grid = 0, **kwargs):
+    """
+     PURPOSE:
+            Collates a whole grid of disk and optically thin dust models by spreading the
+            jobs over a pool of processes. Each job is collated independently, so a job that
+            raises an error is recorded in the summary and does not stop the rest of the grid.
+
+            Every run keeps a manifest (destination/name_manifest.json) of the size and
+            modification time of each job's input files. With incremental = 1, only the jobs
+            that are new, or whose inputs changed since they were last collated, are collated again.
+
+     CALLING SEQUENCE:
+            summary = collate_grid(path, name, destination, jobnums, [otdnums = [...]], [workers = 8], [incremental = 1])
+
+     INPUTS:
+            path: String with path to location of jobfiles and model result files.
+
+            name: String of the name of the object
+
+            destination: String with where you want the fits files to be sent
+
+            jobnums: List of job numbers (strings or integers) of the disk models to collate.
+                     Can be empty if you only want to collate optically thin dust models.
+
+     OPTIONAL KEYWORDS:
+            otdnums: List of job numbers (strings or integers) of the optically thin dust models
+                     to collate. Default is None (no optically thin dust models).
+
+            workers: Number of processes to use. Default is the number of cpus on the machine.
+                     If set to 1, the jobs are collated one after another in this process.
+
+            high: Set this value to 1 (or True) if your job numbers are 4 digits long.
+
+            incremental: Set this value to 1 (or True) to skip the jobs whose input files and collate
+                         keywords are the same as in the manifest, and whose fits file still exists.
+                         Jobs that do get collated again overwrite their old fits file.
+
+            hashes: Set this value to 1 (or True) to also record an md5 hash of every input file in
+                    the manifest. This catches files that were rewritten with the same size within
+                    the same second, but means every input file has to be read on every run.
+
+            grid: Set this value to 1 (or True) to also add the collated models to the grid containers
+                  destination/name_grid.fits and destination/name_OTD_grid.fits (see gridAppend).
+
+            **kwargs: Any other keywords (clob, noextinct, noscatt, etc.) are passed on to collate
+                      for every job.
+
+     OUTPUT:
+            A dictionary summarising the run:
+            'collated':  List of the fits files that were written.
+            'failed':    Dictionary of job label -> error message for the jobs that raised an error.
+            'skipped':   List of job labels for which collate returned without writing a file
+                         (e.g., missing job file or mismatched labelend).
+            'unchanged': List of job labels that were not collated again because of incremental.
+
+            Job labels are the job number strings used in the file names, e.g. '012' for a disk
+            model and 'OTD_012' for an optically thin dust model.
+    """
+
+    if otdnums is None:
+        otdnums = []
+
+    #List the model directory once, each worker only gets the entry of its own job
+    index = jobIndex(path, name)
+
+    manfile = destination+name+'_manifest.json'
+    manifest = _loadManifest(manfile)
+    options = repr(sorted(kwargs.items()))
+
+    summary = {'collated':[], 'failed':{}, 'skipped':[], 'unchanged':[]}
+
+    #Build one task per job, converting the job numbers into strings here so the labels are consistent
+    tasks = []
+    signatures = {}
+    for optthin, nums in ((0, jobnums), (1, otdnums)):
+        for jobnum in nums:
+            if type(jobnum) == int:
+                jobnum = numCheck(jobnum, high=high)
+
+            label = jobnum
+            if optthin:
+                label = 'OTD_'+jobnum
+
+            files = index.get(jobnum, {})
+            signatures[label] = _jobSignature(path, jobnum, files, options, optthin = optthin, hashes = hashes)
+
+            taskargs = dict(kwargs)
+            taskargs['index'] = {jobnum:files}
+            if incremental and os.path.exists(destination+name+'_'+label+'.fits'):
+                if manifest.get(label) == signatures[label]:
+                    summary['unchanged'].append(label)
+                    continue
+                taskargs['clob'] = 1
+
+            tasks.append((path, jobnum, name, destination, optthin, high, taskargs))
+
+    for label, outfile, error in _runTasks(tasks, workers):
+        if error is not None:
+            summary['failed'][label] = error
+        elif outfile is None:
+            summary['skipped'].append(label)
+        else:
+            summary['collated'].append(outfile)
+            manifest[label] = signatures[label]
+            continue
+        manifest.pop(label, None)
+
+    _saveManifest(manfile, manifest)
+
+    #The workers only write their own fits files, the containers are updated once here
+    if grid:
+        _appendGrids(destination, name, summary['collated'])
+
+    summary['collated'].sort()
+    summary['skipped'].sort()
+    summary['unchanged'].sort()
+
+    print('COLLATE_GRID: '+str(len(summary['collated']))+' COLLATED, '+str(len(summary['failed']))+' FAILED, '
+          +str(len(summary['skipped']))+' SKIPPED, '+str(len(summary['unchanged']))+' UNCHANGED')
+
+    return summary
+
+def _runTasks(tasks, workers):
+    """
+    Runs _collateTask on every task, in a pool of processes if workers is not 1.
+    Returns the list of results, in no particular order.
+    """
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    if workers == 1 or len(tasks) <= 1:
+        return [_collateTask(task) for task in tasks]
+
+    pool = multiprocessing.Pool(processes = min(workers, len(tasks)))
+    try:
+        chunksize = max(1, len(tasks) // (4*workers))
+        results = list(pool.imap_unordered(_collateTask, tasks, chunksize))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return results
+
+def collate_archives(archives, name, destination, workers = None, grid = 0, **kwargs):
+    """
+     PURPOSE:
+            Collates the models stored in tar archives (.tar.gz, .tgz, .tar.bz2 or plain .tar)
+            without extracting them. Each archive is read as a stream, member by member, and
+            each job is collated as soon as all of its files have been read, so only the jobs
+            that are still incomplete are held in memory. The files inside the archive may
+            themselves be gzip compressed (.gz). Archives are spread over a pool of processes.
+
+     CALLING SEQUENCE:
+            summary = collate_archives(archives, name, destination, [workers = 8])
+
+     INPUTS:
+            archives: List of archive filenames. Each job should be entirely within one archive.
+
+            name: String of the name of the object
+
+            destination: String with where you want the fits files to be sent
+
+     OPTIONAL KEYWORDS:
+            workers: Number of processes to use. Default is the number of cpus on the machine.
+                     If set to 1, the archives are read one after another in this process.
+
+            grid: Set this value to 1 (or True) to also add the collated models to the grid containers
+                  (see collate_grid).
+
+            **kwargs: Any other keywords (clob, noextinct, noscatt, etc.) are passed on to collate
+                      for every job.
+
+     OUTPUT:
+            A dictionary summarising the run, with the same 'collated', 'failed' and 'skipped'
+            entries as collate_grid. Every job (disk or optically thin dust) found in the
+            archives is collated.
+    """
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    tasks = [(archive, name, destination, kwargs) for archive in archives]
+
+    if workers == 1 or len(tasks) <= 1:
+        results = [_archiveTask(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes = min(workers, len(tasks)))
+        try:
+            results = list(pool.imap_unordered(_archiveTask, tasks))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    summary = {'collated':[], 'failed':{}, 'skipped':[]}
+    for archive, jobs in results:
+        for label, outfile, error in jobs:
+            if error is not None:
+                summary['failed'][label] = error
+            elif outfile is None:
+                summary['skipped'].append(label)
+            else:
+                summary['collated'].append(outfile)
+
+    if grid:
+        _appendGrids(destination, name, summary['collated'])
+
+    summary['collated'].sort()
+    summary['skipped'].sort()
+
+    print('COLLATE_ARCHIVES: '+str(len(summary['collated']))+' COLLATED, '+str(len(summary['failed']))+' FAILED, '
+          +str(len(summary['skipped']))+' SKIPPED')
+
+    return summary
+
+def _archiveTask(task):
+    """
+    Collates every job in one archive for collate_archives. Returns (archive, list of the
+    (label, outfile, error) results of _collateTask). An archive that can't be read is
+    returned as a single failed entry labelled with the archive name.
+    """
+    archive, name, destination, kwargs = task
+
+    needed = _neededKinds(kwargs)
+    otdkinds = ['otdjob', 'fort16']
+
+    patterns = _jobPatterns(name)
+    pending = {}
+    results = []
+
+    def collateJob(optthin, jobnum):
+        files = pending.pop((optthin, jobnum))
+        taskargs = dict(kwargs)
+        taskargs['index'] = {jobnum:files}
+        results.append(_collateTask(('', jobnum, name, destination, optthin, 0, taskargs)))
+
+    try:
+        tar = tarfile.open(archive, 'r|*')
+        for member in tar:
+            if not member.isfile():
+                continue
+            kind, jobnum = _matchFile(patterns, os.path.basename(member.name))
+            if kind is None or kind == 'fits' or kind == 'otd':
+                continue
+
+            optthin = int(kind in otdkinds)
+            files = pending.setdefault((optthin, jobnum), {})
+            if kind in files:
+                continue
+            f = tar.extractfile(member)
+            files[kind] = _Member(archive+':'+member.name, f.read())
+            f.close()
+
+            if all(need in files for need in needed[optthin]):
+                collateJob(optthin, jobnum)
+        tar.close()
+    except (IOError, tarfile.TarError) as err:
+        results.append((archive, None, type(err).__name__+': '+str(err)))
+        return archive, results
+
+    #Whatever is left is missing some of its files
+    for optthin, jobnum in sorted(pending.keys()):
+        collateJob(optthin, jobnum)
+
+    return archive, results
+
+def collate_watch(path, name, destination, interval = 30, settle = 60, idle = None, workers = None,
+                  grid = 0, backend = 'poll', **kwargs):
+    """
+     PURPOSE:
+            Follows a model grid while it is still running, collating each job once all of its
+            output files (job file, Phot, fort17, angle and rin, plus scatt if noscatt = 0, or the
+            job_optthin and fort16 files) exist and have stopped changing. Runs until no job has
+            changed for idle seconds, or until it is interrupted with Ctrl-C.
+
+            The jobs are collated by a pool of processes, and the same manifest as collate_grid
+            is kept (destination/name_manifest.json), so a job is only collated again if its
+            files change, and a watcher that is stopped and started again picks up where it was.
+
+     CALLING SEQUENCE:
+            summary = collate_watch(path, name, destination, [interval = 30], [idle = 3600], [grid = 1])
+
+     INPUTS:
+            path: String with path to location of jobfiles and model result files.
+
+            name: String of the name of the object
+
+            destination: String with where you want the fits files to be sent
+
+     OPTIONAL KEYWORDS:
+            interval: Seconds between two looks at the path directory. Default is 30.
+
+            settle: Seconds a job's files must go without being modified before it is collated.
+                    Default is 60. A job also has to look the same on two looks in a row.
+
+            idle: Stop once no job has appeared or changed for this many seconds. Default is
+                  None, which means watch until interrupted.
+
+            workers: Number of processes to use. Default is the number of cpus on the machine.
+                     At most twice this many jobs are waiting to be collated at any time.
+
+            grid: Set this value to 1 (or True) to also add the collated models to the grid
+                  containers (see collate_grid). They are updated after every look.
+
+            backend: 'poll' to look at the directory every interval seconds, or 'inotify' to look
+                     as soon as a file in it is written (but at least every interval seconds). The
+                     inotify backend needs the inotify_simple package, and Linux.
+
+            **kwargs: Any other keywords (noextinct, noscatt, etc.) are passed on to collate
+                      for every job. Jobs are always collated with clob = 1.
+
+     OUTPUT:
+            A dictionary summarising the run, with the same 'collated', 'failed' and 'skipped'
+            entries as collate_grid.
+    """
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    needed = _neededKinds(kwargs)
+
+    manfile = destination+name+'_manifest.json'
+    manifest = _loadManifest(manfile)
+    options = repr(sorted(kwargs.items()))
+
+    #Wake up as soon as something is written in the directory if we can
+    watcher = None
+    if backend == 'inotify':
+        if inotify_simple is None:
+            print('COLLATE_WATCH: INOTIFY_SIMPLE IS NOT INSTALLED, POLLING EVERY '+str(interval)+' SECONDS INSTEAD')
+        else:
+            watcher = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            watcher.add_watch(path or '.', flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+    elif backend != 'poll':
+        raise ValueError("COLLATE_WATCH: BACKEND SHOULD BE 'poll' OR 'inotify'")
+
+    summary = {'collated':[], 'failed':{}, 'skipped':[]}
+    skipped = set() #labels of the jobs collate skipped, each only once however often it was tried
+    seen = {}       #label -> signature on the last look
+    tried = {}      #label -> signature that was last collated (or failed)
+    running = {}    #label -> (AsyncResult, signature)
+    lastchange = time.time()
+
+    pool = multiprocessing.Pool(processes = workers)
+    try:
+        while True:
+            #Collect the jobs that are done
+            collated = []
+            for label in [label for label in running if running[label][0].ready()]:
+                result, signature = running.pop(label)
+                label, outfile, error = result.get()
+                tried[label] = signature
+                if error is not None:
+                    summary['failed'][label] = error
+                elif outfile is None:
+                    skipped.add(label)
+                else:
+                    collated.append(outfile)
+                    manifest[label] = signature
+                    summary['failed'].pop(label, None)
+                    skipped.discard(label)
+            if len(collated) != 0:
+                summary['collated'].extend(collated)
+                _saveManifest(manfile, manifest)
+                if grid:
+                    _appendGrids(destination, name, collated)
+
+            #Look for jobs that are complete and have stopped changing
+            index = jobIndex(path, name)
+            now = time.time()
+            for jobnum in sorted(index):
+                files = index[jobnum]
+                for optthin in (0, 1):
+                    if not all(kind in files for kind in needed[optthin]):
+                        continue
+
+                    label = jobnum
+                    outfile = destination+name+'_'+jobnum+'.fits'
+                    if optthin:
+                        label = 'OTD_'+jobnum
+                        outfile = destination+name+'_OTD_'+jobnum+'.fits'
+                    if label in running:
+                        continue
+
+                    signature = _jobSignature(path, jobnum, files, options, optthin = optthin)
+                    if tried.get(label) == signature:
+                        continue
+                    if manifest.get(label) == signature and os.path.exists(outfile):
+                        continue
+                    if seen.get(label) != signature:
+                        seen[label] = signature
+                        lastchange = now
+                        continue
+                    newest = max([entry[2] for key, entry in signature.items() if key != 'options'])
+                    if now - newest < settle or len(running) >= 2*workers:
+                        continue
+
+                    taskargs = dict(kwargs)
+                    taskargs['index'] = {jobnum:files}
+                    taskargs['clob'] = 1
+                    task = (path, jobnum, name, destination, optthin, 0, taskargs)
+                    running[label] = (pool.apply_async(_collateTask, (task,)), signature)
+                    lastchange = now
+
+            if idle is not None and len(running) == 0 and now - lastchange > idle:
+                break
+
+            if watcher is not None:
+                watcher.read(timeout = int(interval*1000))
+            else:
+                time.sleep(interval)
+
+        pool.close()
+    except KeyboardInterrupt:
+        #Jobs that were still running are not in the manifest, so they are collated next time
+        print('COLLATE_WATCH: INTERRUPTED, '+str(len(running))+' RUNNING JOBS WERE STOPPED')
+        pool.terminate()
+    finally:
+        pool.join()
+        if watcher is not None:
+            watcher.close()
+        _saveManifest(manfile, manifest)
+
+    summary['collated'].sort()
+    summary['skipped'] = sorted(skipped)
+
+    print('COLLATE_WATCH: '+str(len(summary['collated']))+' COLLATED, '+str(len(summary['failed']))+' FAILED, '
+          +str(len(summary['skipped']))+' SKIPPED')
+
+    return summary
+
+def _neededKinds(kwargs):
+    """
+    Returns the files ({0:disk kinds, 1:optically thin dust kinds}, as named by jobIndex) that must all
+    be there before a job is collated. Any other missing file gets a FAILED tag from collate as usual.
+    """
+
+    needed = {0:['job', 'phot', 'wall', 'angle', 'rin'], 1:['otdjob', 'fort16']}
+    if kwargs.get('noscatt', 1) == 0:
+        needed[0].append('scatt')
+
+    return needed
+
+def _appendGrids(destination, name, outfiles):
+    """
+    Adds collated fits files to the grid containers of the object, disk and optically thin dust
+    models each to their own container.
+    """
+
+    for optthin in (0, 1):
+        files = [f for f in outfiles if f.startswith(destination+name+'_OTD_') == optthin]
+        if len(files) != 0:
+            gridAppend(gridName(destination, name, optthin = optthin), files)
+
+    return
+
+def _collateTask(task):
+    """
+    Collates a single job for collate_grid. Lives at the module level so it can be sent to the
+    worker processes. Any error is caught and returned as a string instead of being raised.
+
+    INPUT
+    task: Tuple of (path, jobnum, name, destination, optthin, high, kwargs)
+
+    OUTPUT
+    label: The job label ('XXX' for disk models, 'OTD_XXX' for optically thin dust)
+    outfile: The fits file written by collate, or None if nothing was written.
+    error: None if the job succeeded, otherwise a string describing the error.
+    """
+    path, jobnum, name, destination, optthin, high, kwargs = task
+
+    label = jobnum
+    if optthin:
+        label = 'OTD_'+jobnum
+
+    try:
+        outfile = collate(path, jobnum, name, destination, optthin = optthin, high = high, **kwargs)
+    except Exception as err:
+        return label, None, type(err).__name__+': '+str(err)
+
+    return label, outfile, None
+
+#Matches a csh set line, e.g. "set AMAXS='0.25'  #comment" or "#set TEMP=1400."
+_SETLINE = re.compile(r"^(#?)(\s*set\s+)(\w+)(\s*=\s*)('[^'\n]*'|[^\s']*)")
+
+def jobParse(jobtext):
+    """
+    Reads every csh set line of a job file in a single pass.
+
+    INPUTS
+    jobtext: String with the full text of a job file.
+
+    OUTPUT
+    params: Dictionary of variable name -> value string for the active (uncommented) set lines.
+            Quotes are removed. If a variable is set more than once, the first value is kept.
+    alts: List of (name, value, lineno, active) tuples for every set line in the file, commented
+          out or not, in the order they appear. This is how the commented alternatives for
+          e.g. AMAXS and EPS are found.
+    lines: List of the lines of the file (with their line endings), which lineno refers to.
+    """
+
+    lines = jobtext.splitlines(True)
+
+    params = {}
+    alts = []
+    for lineno, line in enumerate(lines):
+        match = _SETLINE.match(line)
+        if match is None:
+            continue
+        comment, setword, var, equals, value = match.groups()
+        value = value.strip("'")
+        active = comment == ''
+        alts.append((var, value, lineno, active))
+        if active and var not in params:
+            params[var] = value
+
+    return params, alts, lines
+
+def jobSub(line, value):
+    """
+    Replaces the value of a csh set line, keeping its quotes, comment mark and trailing comment.
+
+    INPUTS
+    line: A line of a job file that matches a set command.
+    value: The new value, converted with str().
+
+    OUTPUT
+    The new line.
+    """
+
+    match = _SETLINE.match(line)
+    if match is None:
+        raise ValueError('JOBSUB: NOT A SET LINE: '+line.strip())
+
+    value = str(value)
+    if match.group(5).startswith("'"):
+        value = "'"+value+"'"
+
+    return line[:match.start(5)]+value+line[match.end(5):]
+
+def jobIndex(path, name):
+    """
+    Lists a directory once and sorts the model outputs and collated files in it by job number,
+    so a whole grid can be collated (or checked) without searching the directory for every file.
+
+    INPUTS
+    path: Path to the directory with the model outputs and/or collated fits files.
+    name: String of the name of the object, as used in the labelend of the jobs.
+
+    OUTPUT
+    index: Dictionary of job number string -> dictionary of the files for that job, with the keys
+           'job', 'otdjob' (job_optthin), 'phot', 'wall' (fort17), 'angle', 'scatt', 'rin', 'fort16',
+           'fits' (collated disk model) and 'otd' (collated optically thin dust model). Only the files
+           that exist get a key, and the model outputs may be gzip compressed (.gz). If more than one
+           file matches, the first one in alphabetical order is used.
+    """
+
+    patterns = _jobPatterns(name)
+
+    #scandir (os.scandir, or the scandir backport on Python 2) knows which entries are directories
+    #without a stat for every file. Without it, the job file patterns are enough to skip directories
+    if scandir is not None:
+        names = [entry.name for entry in scandir(path or '.') if not entry.is_dir()]
+    else:
+        names = os.listdir(path or '.')
+
+    index = {}
+    for f in sorted(names):
+        kind, jobnum = _matchFile(patterns, f)
+        if kind is not None:
+            files = index.setdefault(jobnum, {})
+            if kind not in files:
+                files[kind] = path+f
+
+    return index
+
+def _jobPatterns(name):
+    """
+    Returns the list of (kind, regular expression) used to recognise the files of a job by their name.
+    The job number is the first group of each expression. Model outputs may also be gzip compressed (.gz).
+    """
+
+    label = re.escape(name)
+    gz = '(?:\\.gz)?$'
+
+    return [('otdjob', re.compile('^job_optthin([0-9]+)'+gz)),
+            ('job',    re.compile('^job([0-9]+)'+gz)),
+            ('phot',   re.compile('^Phot.*'+label+'_([0-9]+)'+gz)),
+            ('wall',   re.compile('^fort17.*'+label+'_([0-9]+)'+gz)),
+            ('angle',  re.compile('^angle.*'+label+'_([0-9]+)')),
+            ('scatt',  re.compile('^scatt.*'+label+'_([0-9]+)')),
+            ('rin',    re.compile('^rin.*'+label+'_([0-9]+)'+gz)),
+            ('fort16', re.compile('^fort16.*'+label+'(?:.*[^0-9])?([0-9]+)'+gz)),
+            ('fits',   re.compile('^'+label+'_([0-9]+)\\.fits$')),
+            ('otd',    re.compile('^'+label+'_OTD_([0-9]+)\\.fits$'))]
+
+def _matchFile(patterns, f):
+    """
+    Returns the (kind, job number) of a file name, or (None, None) if it isn't part of a job.
+    """
+
+    for kind, pattern in patterns:
+        match = pattern.match(f)
+        if match is not None:
+            return kind, match.group(1)
+
+    return None, None
+
+class _Member(object):
+    """
+    A file read into memory out of an archive. Used in place of a filename in a job index.
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def __str__(self):
+        return self.name
+
+def _openFile(file):
+    """
+    Opens a model file for reading, whether it is a plain file, a gzip compressed file (.gz) or
+    an archive member (_Member) that is already in memory.
+    """
+
+    if isinstance(file, _Member):
+        f = io.BytesIO(file.data)
+        if file.name.endswith('.gz'):
+            f = gzip.GzipFile(fileobj = f, mode = 'rb')
+        return f
+
+    if file.endswith('.gz'):
+        return gzip.open(file, 'rb')
+
+    return open(file, 'r')
+
+def _fileSize(file):
+    """
+    Returns the (uncompressed) size in bytes of a file that _openFile can open. For gzip files this is
+    taken from the size stored at the end of the file, so nothing needs to be decompressed.
+    """
+
+    if isinstance(file, _Member):
+        data = file.data
+        if file.name.endswith('.gz'):
+            if len(data) < 4:
+                return 0
+            return struct.unpack('<I', data[-4:])[0]
+        return len(data)
+
+    if file.endswith('.gz'):
+        f = open(file, 'rb')
+        f.seek(-4, os.SEEK_END)
+        size = struct.unpack('<I', f.read(4))[0]
+        f.close()
+        return size
+
+    return os.path.getsize(file)
+
+def _locate(index, jobnum, kind, pattern):
+    """
+    Finds a file of a job. Uses the index from jobIndex if there is one, otherwise uses glob on pattern
+    (or on pattern+'.gz' if nothing matches it).
+    Returns a list of matching files like glob does.
+    """
+
+    if index is None:
+        return glob(pattern) or glob(pattern+'.gz')
+
+    try:
+        return [index[jobnum][kind]]
+    except KeyError:
+        return []
+
+def _jobSignature(path, jobnum, files, options, optthin = 0, hashes = 0):
+    """
+    Describes the inputs of a job for the collate_grid manifest: the collate keywords, and the
+    size, modification time (and md5 hash if hashes is set) of the job file and every output
+    file of the job. Any change to these means the job needs to be collated again.
+
+    INPUTS
+    path: Path to the job files.
+    jobnum: Job number string.
+    files: Dictionary of the job's output files, i.e. one entry of jobIndex.
+    options: String describing the collate keywords used.
+    optthin: BOOLEAN -- if True (1), this is an optically thin dust job.
+    hashes: BOOLEAN -- if True (1), include an md5 hash of each file.
+
+    OUTPUT
+    signature: Dictionary that can be saved with json and compared with ==.
+    """
+
+    if optthin:
+        inputs = {'job':files.get('otdjob', path+'job_optthin'+jobnum)}
+        kinds = ['fort16']
+    else:
+        inputs = {'job':files.get('job', path+'job'+jobnum)}
+        kinds = ['phot', 'wall', 'angle', 'scatt', 'rin']
+    for kind in kinds:
+        if kind in files:
+            inputs[kind] = files[kind]
+
+    signature = {'options':options}
+    for kind, file in inputs.items():
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+        entry = [os.path.basename(file), stat.st_size, stat.st_mtime]
+        if hashes:
+            md5 = hashlib.md5()
+            f = open(file, 'rb')
+            for block in iter(lambda: f.read(1 << 20), b''):
+                md5.update(block)
+            f.close()
+            entry.append(md5.hexdigest())
+        signature[kind] = entry
+
+    return signature
+
+def _loadManifest(manfile):
+    """
+    Loads the collate_grid manifest. Returns an empty dictionary if there is none yet.
+    """
+
+    if not os.path.exists(manfile):
+        return {}
+
+    f = open(manfile, 'r')
+    manifest = json.load(f)
+    f.close()
+
+    return manifest
+
+def _saveManifest(manfile, manifest):
+    """
+    Saves the collate_grid manifest. Writes to a temporary file first, so a run that gets
+    killed part way through can't leave a broken manifest behind.
+    """
+
+    f = open(manfile+'.tmp', 'w')
+    json.dump(manifest, f, sort_keys = True)
+    f.close()
+    os.rename(manfile+'.tmp', manfile)
+
+    return
+
+#Canonical order of the components in the flux cube of a grid container
+GRIDAXES = ['WLAXIS', 'PHOTAXIS', 'WALLAXIS', 'ANGAXIS', 'SCATAXIS', 'EXTAXIS']
+OTDAXES  = ['WLAXIS', 'LFLAXIS']
+
+#Header tags that are only written when they are set, stored as 0/1 in the parameter table
+GRIDFLAGS = ['FAILED', 'NOEXT', 'OPTTHIN']
+
+#Integer header tags, stored as integers in the parameter table with -1 when they are not set
+GRIDCOUNTS = ['NNAN', 'NSCATNEG']
+
+#Header cards that describe the data array rather than the model
+_GRIDSKIP = ['SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'EXTEND', 'COMMENT', 'HISTORY', '']
+
+#Open grid containers, gridfile -> (stamp, hdulist, params, rows, axes)
+_gridCache = {}
+
+def gridName(destination, name, optthin = 0):
+    """
+    Returns the filename of the grid container for an object, e.g. destination/name_grid.fits,
+    or destination/name_OTD_grid.fits for optically thin dust models.
+    """
+
+    if optthin:
+        return destination+name+'_OTD_grid.fits'
+    return destination+name+'_grid.fits'
+
+def gridAppend(gridfile, hdus):
+    """
+     PURPOSE:
+            Adds collated models to a grid container, a single fits file holding a whole grid
+            so that it can be loaded without opening thousands of small files.
+
+            The container has two extensions. 'FLUX' is a cube of job x component x wavelength,
+            with the components in a fixed order (GRIDAXES for disk models, OTDAXES for optically
+            thin dust models, listed in the COMPn tags of the primary header) and NaN for any
+            component a job does not have. 'PARAMS' is a table with one row per job holding the
+            header of the job's collated fits file.
+
+            Jobs that are already in the container are replaced. When the new models fit in the
+            wavelength axis of the cube, they are written into the container in place: the cube
+            grows by the new jobs and only the parameter table is written again, so adding jobs
+            one at a time (e.g. with the grid keyword of collate) does not copy the whole grid
+            every time. Otherwise the container is written to a temporary file and renamed.
+
+     CALLING SEQUENCE:
+            gridAppend(gridfile, hdus)
+
+     INPUTS:
+            gridfile: String with the path and filename of the container, see gridName.
+
+            hdus: List of collated models, either as filenames of collated fits files or as
+                  HDU objects (e.g., the PrimaryHDU made by collate).
+
+     EXAMPLE:
+            gridAppend(gridName(destination, 'ZZ_Tau'), glob(destination+'ZZ_Tau_[0-9]*.fits'))
+
+     NOTES:
+            A container that is grown in place is not written atomically. If the run is killed
+            while it is being written, make it again from the collated fits files.
+    """
+
+    axes = None
+    keys = []
+    jobnums = []
+    headers = []
+    nwl = []
+
+    #Read in the parameters of what is already in the container. The cube is only read if it has to be written again
+    if os.path.exists(gridfile):
+        hdulist = fits.open(gridfile)
+        axes = [hdulist[0].header['COMP'+str(i)] for i in range(hdulist[0].header['NCOMP'])]
+        params = hdulist['PARAMS'].data
+        keys = [key for key in params.names if key != 'NWL']
+        columns = [np.array(params[key]) for key in keys]
+        for i, jobnum in enumerate(params['JOBNUM']):
+            jobnums.append(jobnum)
+            headers.append(dict((key, column[i]) for key, column in zip(keys, columns)))
+        nwl = list(params['NWL'])
+        hdulist.close()
+
+    added = {}
+    for hdu in hdus:
+        if type(hdu) == str:
+            header = fits.getheader(hdu)
+            data = fits.getdata(hdu)
+        elif isinstance(hdu, fits.HDUList):
+            header, data = hdu[0].header, hdu[0].data
+        else:
+            header, data = hdu.header, hdu.data
+
+        if axes is None:
+            if header.get('OPTTHIN', 0):
+                axes = OTDAXES
+            else:
+                axes = GRIDAXES
+
+        #Put the components into the canonical order
+        row = {}
+        if data is None or data.size == 0:
+            spectrum = np.zeros((len(axes), 0))
+        else:
+            spectrum = np.zeros((len(axes), data.shape[1]))*np.nan
+        for key in header.keys():
+            if key in _GRIDSKIP:
+                continue
+            if key.endswith('AXIS'):
+                if key not in axes:
+                    raise ValueError('GRIDAPPEND: '+key+' OF JOB '+str(header['JOBNUM'])+' DOES NOT BELONG IN '+gridfile)
+                spectrum[axes.index(key)] = data[header[key]]
+            if key not in keys:
+                keys.append(key)
+            row[key] = header[key]
+
+        added[row['JOBNUM']] = (row, spectrum)
+
+    if len(jobnums) != 0 and _gridGrow(gridfile, axes, keys, jobnums, headers, nwl, added):
+        return
+
+    #Otherwise write the whole container again
+    jobs = {}
+    if len(jobnums) != 0:
+        hdulist = fits.open(gridfile)
+        cube = hdulist['FLUX'].data
+        for i, jobnum in enumerate(jobnums):
+            if jobnum not in added:
+                jobs[jobnum] = (headers[i], np.array(cube[i,:,:nwl[i]]))
+        hdulist.close()
+    jobs.update(added)
+
+    _gridWrite(gridfile, axes, keys, jobs)
+
+    return
+
+def _gridTable(axes, keys, headers, nwl):
+    """
+    Builds the parameter table of a grid container from the header dictionaries of its jobs, with
+    the axis tags, flags and counts as integers and missing values as -1/0/NaN/''.
+    """
+
+    columns = [fits.Column(name = 'NWL', format = 'J', array = np.array(nwl, dtype = int))]
+    for key in keys:
+        values = [header.get(key) for header in headers]
+        if key in axes:
+            array = np.array([-1 if value is None else value for value in values], dtype = np.int16)
+            columns.append(fits.Column(name = key, format = 'I', array = array))
+        elif key in GRIDFLAGS:
+            array = np.array([0 if value is None else value for value in values], dtype = np.int16)
+            columns.append(fits.Column(name = key, format = 'I', array = array))
+        elif key in GRIDCOUNTS:
+            array = np.array([-1 if value is None or value != value else value for value in values], dtype = np.int32)
+            columns.append(fits.Column(name = key, format = 'J', array = array))
+        elif any(isinstance(value, str) for value in values):
+            array = np.array(['' if value is None else str(value) for value in values])
+            columns.append(fits.Column(name = key, format = 'A'+str(max(array.itemsize, 1)), array = array))
+        else:
+            array = np.array([np.nan if value is None else value for value in values], dtype = float)
+            columns.append(fits.Column(name = key, format = 'D', array = array))
+
+    return fits.BinTableHDU.from_columns(columns, name = 'PARAMS')
+
+def _gridWrite(gridfile, axes, keys, jobs):
+    """
+    Writes a grid container from a dictionary of jobnum -> (header dictionary, spectrum).
+    """
+
+    jobnums = sorted(jobs.keys())
+    nwl = np.array([jobs[jobnum][1].shape[1] for jobnum in jobnums], dtype = int)
+
+    cube = np.zeros((len(jobnums), len(axes), max(nwl.max(), 1)))*np.nan
+    for i, jobnum in enumerate(jobnums):
+        cube[i,:,:nwl[i]] = jobs[jobnum][1]
+
+    primary = fits.PrimaryHDU()
+    primary.header.set('NJOBS', len(jobnums))
+    primary.header.set('NCOMP', len(axes))
+    for i, axis in enumerate(axes):
+        primary.header.set('COMP'+str(i), axis)
+
+    hdulist = fits.HDUList([primary, fits.ImageHDU(cube, name = 'FLUX'),
+                            _gridTable(axes, keys, [jobs[jobnum][0] for jobnum in jobnums], nwl)])
+
+    if os.path.exists(gridfile+'.tmp'):
+        os.remove(gridfile+'.tmp')
+    hdulist.writeto(gridfile+'.tmp')
+    os.rename(gridfile+'.tmp', gridfile)
+
+    #Close the cached container of the old file, so its handle (and memory map) is not leaked
+    if gridfile in _gridCache:
+        _gridCache.pop(gridfile)[1].close()
+
+    return
+
+def _gridGrow(gridfile, axes, keys, jobnums, headers, nwl, added):
+    """
+    Adds jobs to a grid container in place: replaced jobs are written over their rows of the cube,
+    new jobs are written after its end, and the parameter table after them. Returns False (without
+    touching the file) if the new models do not fit in the cube, so it has to be written again.
+    """
+
+    hdulist = fits.open(gridfile)
+    flux = hdulist['FLUX']
+    shape = (flux.header['NAXIS3'], flux.header['NAXIS2'], flux.header['NAXIS1'])
+    plain = flux.header['BITPIX'] == -64 and 'BSCALE' not in flux.header and 'BZERO' not in flux.header
+    fluxinfo = hdulist.fileinfo(hdulist.index_of('FLUX'))
+    hdulist.close()
+
+    if not plain or shape[0] != len(jobnums) or shape[1] != len(axes) or \
+       any(spectrum.shape[1] > shape[2] for row, spectrum in added.values()):
+        return False
+
+    #The rows of the cube, in the order they are in the file
+    jobnums = list(jobnums)
+    headers = list(headers)
+    nwl = list(nwl)
+    positions = dict((jobnum, i) for i, jobnum in enumerate(jobnums))
+    for jobnum in sorted(added):
+        if jobnum in positions:
+            headers[positions[jobnum]] = added[jobnum][0]
+            nwl[positions[jobnum]] = added[jobnum][1].shape[1]
+        else:
+            positions[jobnum] = len(jobnums)
+            jobnums.append(jobnum)
+            headers.append(added[jobnum][0])
+            nwl.append(added[jobnum][1].shape[1])
+
+    #The table is written to memory first, after an empty primary header (a single block) that is cut off
+    buf = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), _gridTable(axes, keys, headers, nwl)]).writeto(buf)
+    table = buf.getvalue()[2880:]
+
+    #Close the cached container first, so no memory map of the file is open while it changes
+    if gridfile in _gridCache:
+        _gridCache.pop(gridfile)[1].close()
+
+    rowsize = shape[1]*shape[2]*8
+    f = open(gridfile, 'r+b')
+    try:
+        for jobnum in added:
+            row = np.zeros((shape[1], shape[2]))*np.nan
+            row[:,:added[jobnum][1].shape[1]] = added[jobnum][1]
+            f.seek(fluxinfo['datLoc'] + positions[jobnum]*rowsize)
+            f.write(row.astype('>f8').tostring())
+        end = fluxinfo['datLoc'] + len(jobnums)*rowsize
+        f.seek(end)
+        f.write(b'\0'*(-end % 2880))
+        f.write(table)
+        f.truncate()
+
+        #The number of jobs is in the cube and primary headers, which keep their size
+        _gridCard(f, fluxinfo['hdrLoc'], 'NAXIS3', len(jobnums))
+        _gridCard(f, 0, 'NJOBS', len(jobnums))
+    finally:
+        f.close()
+
+    return True
+
+def _gridCard(f, offset, key, value):
+    """
+    Writes over the value of a header card of the fits header that starts at offset in the open file f.
+    """
+
+    f.seek(offset)
+    while True:
+        block = f.read(2880)
+        if len(block) < 2880:
+            raise IOError('_GRIDCARD: '+key+' IS NOT IN THE HEADER')
+        for i in range(0, 2880, 80):
+            name = block[i:i+8].decode('ascii').strip()
+            if name == key:
+                f.seek(offset + i)
+                f.write(fits.Card(key, value).image.encode('ascii'))
+                return
+            if name == 'END':
+                raise IOError('_GRIDCARD: '+key+' IS NOT IN THE HEADER')
+        offset += 2880
+
+def gridRead(gridfile, jobnum):
+    """
+     PURPOSE:
+            Reads one model out of a grid container made by gridAppend, returning the same header
+            and data array that are in the model's own collated fits file. The container is kept
+            open between calls, so loading many models from one grid only parses it once.
+
+     CALLING SEQUENCE:
+            header, data = gridRead(gridfile, jobnum)
+
+     INPUTS:
+            gridfile: String with the path and filename of the container.
+
+            jobnum: The job number string, e.g. '012'.
+
+     OUTPUT:
+            header: A fits header with the model parameters and axis tags. The model parameters are
+                    returned as floats, the axis tags, flags and counts (NNAN, NSCATNEG) as integers.
+            data: The (components x wavelength) array of the model, in the order given by the axis tags.
+    """
+
+    stat = os.stat(gridfile)
+    stamp = (stat.st_mtime, stat.st_size)
+
+    #Reopen the container if it changed since it was cached
+    if gridfile not in _gridCache or _gridCache[gridfile][0] != stamp:
+        if gridfile in _gridCache:
+            _gridCache[gridfile][1].close()
+        hdulist = fits.open(gridfile, memmap = True)
+        params = hdulist['PARAMS'].data
+        rows = dict((job, i) for i, job in enumerate(params['JOBNUM']))
+        axes = [hdulist[0].header['COMP'+str(i)] for i in range(hdulist[0].header['NCOMP'])]
+        _gridCache[gridfile] = (stamp, hdulist, params, rows, axes)
+
+    stamp, hdulist, params, rows, axes = _gridCache[gridfile]
+
+    try:
+        row = rows[jobnum]
+    except KeyError:
+        raise IOError('GRIDREAD: JOB '+str(jobnum)+' IS NOT IN '+gridfile)
+
+    header = fits.Header()
+    present = []
+    for key in params.names:
+        if key == 'NWL':
+            continue
+        value = params[key][row]
+        if key in axes:
+            if value >= 0:
+                present.append((value, axes.index(key)))
+                header.set(key, int(value))
+        elif key in GRIDFLAGS:
+            if value:
+                header.set(key, int(value))
+        elif key in GRIDCOUNTS:
+            if value >= 0:
+                header.set(key, int(value))
+        elif isinstance(value, str):
+            if value != '':
+                header.set(key, value)
+        elif not np.isnan(value):
+            header.set(key, float(value))
+
+    present.sort()
+    spectrum = hdulist['FLUX'].section[row]
+    data = np.array([spectrum[comp][:params['NWL'][row]] for index, comp in present])
+
+    return header, data
+
+def floatConvert(dataarr, fortran = 0):
+    """
+    Converts an array of model output values into floats. Anything that can't be read as a float
+    (e.g., the Fortran exponents without an E like 1.234-310 that the models write on underflow)
+    becomes a NaN, just like calling float() on each value would.
+
+    The whole array is converted at once when possible. Only when that fails are the values
+    checked, again with array operations, to find the ones that need to become NaN.
+
+    INPUT
+    dataarr: Array (or list) of values to convert. Can be numbers or strings.
+    fortran: BOOLEAN -- if True (1), Fortran style exponents (1.234-310, 1.234+05, 1.234D-05)
+             are recovered instead of being set to NaN.
+
+    OUTPUT
+    tempdata: Array of floats with the same length as dataarr.
+    floaterr: 1 if any value was set to NaN, 0 otherwise.
+    """
+
+    dataarr = np.asarray(dataarr)
+
+    #Fast path, everything was already read in as numbers (or as strings that are valid floats)
+    try:
+        return dataarr.astype(float), 0
+    except ValueError:
+        pass
+
+    tokens = np.char.lower(np.char.strip(dataarr.astype(str)))
+    if fortran:
+        tokens = _fortranExp(tokens)
+
+    #Split each value into mantissa and exponent and check that both are made of digits
+    body = np.char.lstrip(tokens, '+-')
+    parts = np.char.partition(body, 'e')
+    mantissa = np.char.isdigit(np.char.replace(parts[:,0], '.', '', 1))
+    exponent = (parts[:,1] == '') | np.char.isdigit(np.char.lstrip(parts[:,2], '+-'))
+    special = np.in1d(body, ['nan', 'inf', 'infinity'])
+    good = (mantissa & exponent) | special
+
+    tempdata = np.empty(len(tokens), dtype=float)
+    tempdata[~good] = np.nan
+    try:
+        tempdata[good] = tokens[good].astype(float)
+    except ValueError:
+        #Something slipped through the checks above (e.g., '--1'), so fall back on float()
+        for i in np.where(good)[0]:
+            try:
+                tempdata[i] = float(tokens[i])
+            except ValueError:
+                tempdata[i] = np.nan
+                good[i] = False
+
+    floaterr = int(not good.all())
+
+    return tempdata, floaterr
+
+def _fortranExp(tokens):
+    """
+    Adds the missing E to Fortran style exponents in an array of lower case strings,
+    e.g. '1.234-310' --> '1.234e-310'. D exponents are changed into E exponents.
+    Values that already have an exponent are left alone.
+    """
+
+    tokens = np.char.replace(tokens, 'd', 'e')
+    lead = np.where(np.char.startswith(tokens, '-'), '-', '')
+    body = np.char.lstrip(tokens, '+-')
+    #Only values with at most one leading sign are candidates
+    noexp = (np.char.find(body, 'e') < 0) & (np.char.str_len(tokens) - np.char.str_len(body) <= 1)
+
+    #A sign after the first character of the mantissa can only be an exponent
+    fixed = np.zeros(len(tokens), dtype=bool)
+    for sign in ('-', '+'):
+        parts = np.char.rpartition(body, sign)
+        fix = noexp & ~fixed & (parts[:,1] != '') & (parts[:,0] != '')
+        if fix.any():
+            body = np.where(fix, np.char.add(np.char.add(parts[:,0], 'e'+sign), parts[:,2]), body)
+            fixed = fixed | fix
+
+    return np.where(fixed, np.char.add(lead, body), tokens)
+
+def readColumns(file, cols, data_start = 0, fortran = 0):
+    """
+    Reads selected columns of a whitespace separated model output file into a float array. This
+    replaces ascii.read for the D'Alessio output files, whose layouts are known ahead of time, so
+    there is no format guessing and no Table is built for the columns we don't keep.
+
+    Like ascii.read, blank lines and lines starting with # are ignored, and data_start counts the
+    remaining lines. Values that can't be read as floats become NaN (see floatConvert).
+
+    INPUTS
+    file: Name of the file to read. Can be gzip compressed (.gz) or an archive member.
+    cols: List of the column numbers to keep, counting from 1 like the col1, col2... names from ascii.read.
+    data_start: Number of lines to skip at the top of the file before the data starts.
+    fortran: BOOLEAN -- if True (1), Fortran style exponents are recovered instead of set to NaN.
+
+    OUTPUT
+    data: A float array of shape (len(cols), number of rows), one row per requested column.
+    floaterr: 1 if any value was set to NaN, 0 otherwise.
+    """
+
+    f = _openFile(file)
+    lines = [line for line in f.read().splitlines() if line.strip() != '' and line.lstrip()[0] != '#']
+    f.close()
+    lines = lines[data_start:]
+
+    if len(lines) == 0:
+        return np.zeros((len(cols), 0)), 0
+
+    #Split everything in one go, then check the table is rectangular
+    ncols = len(lines[0].split())
+    tokens = ' '.join(lines).split()
+    if len(tokens) != ncols*len(lines):
+        raise IOError('READCOLUMNS: '+str(file)+' DOES NOT HAVE THE SAME NUMBER OF COLUMNS ON EVERY LINE')
+    if max(cols) > ncols:
+        raise IOError('READCOLUMNS: '+str(file)+' ONLY HAS '+str(ncols)+' COLUMNS')
+
+    table = np.array(tokens).reshape(len(lines), ncols)
+    data, floaterr = floatConvert(table[:, [col-1 for col in cols]].T.ravel(), fortran = fortran)
+
+    return data.reshape(len(cols), len(lines)), floaterr
+
+def readPhot(file, cols = (1, 2), fortran = 0):
+    """
+    Reads a Phot (photosphere) file. Default columns are wavelength and flux.
+    Returns the same outputs as readColumns.
+    """
+    return readColumns(file, cols, data_start = 0, fortran = fortran)
+
+def readWall(file, cols = (1, 2), fortran = 0):
+    """
+    Reads a fort17 (inner wall) file, skipping its 9 header lines. Default columns are wavelength and flux.
+    Returns the same outputs as readColumns.
+    """
+    return readColumns(file, cols, data_start = 9, fortran = fortran)
+
+def readAngle(file, cols = (1, 4, 6), fortran = 0):
+    """
+    Reads an angle (disk) file, skipping its header line. Default columns are wavelength, flux
+    and the optical depth used for the self-extinction correction.
+    Returns the same outputs as readColumns.
+    """
+    return readColumns(file, cols, data_start = 1, fortran = fortran)
+
+def readScatt(file, cols = (1, 4), fortran = 0):
+    """
+    Reads a scatt (scattered light) file, skipping its header line. Default columns are wavelength and flux.
+    Returns the same outputs as readColumns.
+    """
+    return readColumns(file, cols, data_start = 1, fortran = fortran)
+
+def readFort16(file, cols = (1, 3), fortran = 0):
+    """
+    Reads a fort16 (optically thin dust) file. Default columns are wavelength and flux.
+    Returns the same outputs as readColumns.
+    """
+    return readColumns(file, cols, data_start = 0, fortran = fortran)
+
+def benchmark_readers(path = None, name = None, jobnum = None, nwl = 2000, repeat = 5):
+    """
+    Times the dedicated readers against the ascii.read path that collate used before, and
+    checks that both give the same numbers.
+
+    INPUTS
+    path: Path to a directory of model outputs to use. If None (default), files with the same
+          layouts as the model outputs are written to a temporary directory.
+    name: Name of the object in the model outputs. Only used if path is given.
+    jobnum: Job number string (e.g. '001') of the model to read. Only used if path is given.
+    nwl: Number of wavelengths in the temporary files. Only used if path is None.
+    repeat: Number of times each file is read. The best time is kept.
+
+    OUTPUT
+    Prints a table of timings, and returns a dictionary of file type -> (astropy time, fast time, speedup).
+    """
+
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.mkdtemp()
+        path = tmpdir + '/'
+        name = 'bench'
+        jobnum = '001'
+        _benchmarkFiles(path, name, jobnum, nwl)
+
+    #File pattern, ascii.read keywords, columns, reader
+    layouts = [('Phot', path+'Phot*'+jobnum, {}, (1, 2), readPhot),
+               ('fort17', path+'fort17*'+name+'_'+jobnum, {'data_start':9}, (1, 2), readWall),
+               ('angle', path+'angle*'+name+'_'+jobnum+'*', {'data_start':1}, (1, 4, 6), readAngle),
+               ('scatt', path+'scatt*'+name+'_'+jobnum+'*', {'data_start':1}, (1, 4), readScatt),
+               ('fort16', path+'fort16*'+name+'*'+jobnum, {}, (1, 3), readFort16)]
+
+    results = {}
+    print('READER      ASTROPY [s]     FAST [s]     SPEEDUP')
+    try:
+        for label, pattern, kwargs, cols, reader in layouts:
+            files = glob(pattern)
+            if len(files) == 0:
+                print(label.ljust(12)+'NO FILE FOUND, SKIPPING')
+                continue
+
+            slow = fast = np.inf
+            for i in range(repeat):
+                start = time.time()
+                table = ascii.read(files[0], **kwargs)
+                old, err = floatConvert(np.concatenate([table['col'+str(col)] for col in cols]))
+                slow = min(slow, time.time() - start)
+
+                start = time.time()
+                new, err = reader(files[0])
+                fast = min(fast, time.time() - start)
+
+            if not np.allclose(old, new.ravel(), equal_nan = True):
+                print('WARNING: '+label+' READERS DO NOT AGREE')
+
+            results[label] = (slow, fast, slow/fast)
+            print(label.ljust(12)+('%.5f' % slow).ljust(16)+('%.5f' % fast).ljust(13)+('%.1f' % (slow/fast)))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    return results
+
+def _benchmarkFiles(path, name, jobnum, nwl):
+    """
+    Writes a set of files with the same layouts as the model outputs for benchmark_readers.
+    """
+
+    wl = np.logspace(-1, 4, nwl)
+    flux = np.random.uniform(1e-14, 1e-9, (5, nwl))
+    label = name+'_'+jobnum
+
+    np.savetxt(path+'Phot4000.'+label, np.column_stack((wl, flux[0])), fmt = '%12.5E')
+    np.savetxt(path+'fort17.'+label, np.column_stack((wl, flux[1], flux[2])), fmt = '%12.5E',
+               header = '\n'.join([' '+str(i)+' 1.0' for i in range(9)]), comments = '')
+    np.savetxt(path+'angle.'+label+'_a', np.column_stack((wl, flux[1], flux[2], flux[3], flux[4], flux[0])),
+               fmt = '%12.5E', header = ' 0.5 '+str(nwl), comments = '')
+    np.savetxt(path+'scatt.'+label+'_a', np.column_stack((wl, flux[1], flux[2], flux[3])), fmt = '%12.5E',
+               header = ' 0.5 '+str(nwl), comments = '')
+    np.savetxt(path+'fort16.'+label, np.column_stack((wl, flux[0], flux[1])), fmt = '%12.5E')
+
     return
 
 def numCheck(num, high=0):
@@ -534,9 +1909,10 @@ def numCheck(num, high=0):
         numstr          = '%03d' % num
     return numstr
 
-def failCheck(name, path = '', jobnum = 'all', high = 0, optthin = 0):
+def failCheck(name, path = '', jobnum = 'all', high = 0, optthin = 0, index = None, workers = 8):
     """
-    Opens up each header, checks if 'FAILED' tag = 1 and records the job number in a list if it is
+    Reads each header, checks if 'FAILED' tag = 1 and records the job number in a list if it is.
+    Only the headers are read, see healthCheck for more details about each job.
 
     INPUTS:
            name: String of the name of object
@@ -553,8 +1929,14 @@ def failCheck(name, path = '', jobnum = 'all', high = 0, optthin = 0):
 
            high: Set this to 1 if the jobnum has 4 digits.
 
+           index: Dictionary made by jobIndex(path, name). If given, the collated files are taken from
+                  it instead of searching the path directory again.
+
+           workers: Number of threads used to read the headers when checking all the jobs.
+
     OUTPUT
-           Returns a list of failed jobs. If none are found, array will be empty.
+           Returns a list of failed jobs. If none are found, array will be empty. Files that can not
+           be read (e.g. truncated ones) are counted as failed.
     """
 
     opt = ''
@@ -567,23 +1949,31 @@ def failCheck(name, path = '', jobnum = 'all', high = 0, optthin = 0):
     if high == 1:
         wildhigh = '????'
 
+    #Key of the collated files in the index
+    kind = 'fits'
+    if optthin == 1:
+        kind = 'otd'
+
     if jobnum == 'all':
-        if optthin == 1:
+        if index is not None:
+            files = [index[num][kind] for num in sorted(index) if kind in index[num] and 
+                     (optthin == 1 or len(num) == len(wildhigh))]
+        elif optthin == 1:
             files = glob(path+name+'_'+opt+'*.fits')
-        if optthin == 0:
+        elif optthin == 0:
             files = glob(path+name+'_'+wildhigh+'.fits')
-                
-        failed = []
 
-        for file in files:
-            HDU = fits.open(file)
-            nofail = 0
-            try:
-                HDU[0].header['Failed'] == 1
-            except KeyError:
-                nofail = 1
-            if nofail != 1:
-                failed.append(file)
+        #The grid containers (name_grid.fits, name_OTD_grid.fits) also match the wildcards
+        if index is None:
+            pattern = re.compile('^'+re.escape(name)+'_'+opt+'[0-9]+\\.fits$')
+            files = [file for file in files if pattern.match(os.path.basename(file))]
+                
+        #Only the headers are read, several files at a time. Files that can't be read are bad too
+        headers = _scanHeaders(files, ['FAILED'], workers)
+        failed = [file for file, header in zip(files, headers) if 'FAILED' in header or 'UNREADABLE' in header]
+        for file, header in zip(files, headers):
+            if 'UNREADABLE' in header:
+                print('FAILCHECK: COULD NOT READ '+file+', COUNTING IT AS FAILED')
 
     if jobnum != 'all':   
 
@@ -591,24 +1981,217 @@ def failCheck(name, path = '', jobnum = 'all', high = 0, optthin = 0):
             jobnum = numCheck(jobnum, high = high)
         
         failed = []
-        nofail = 0
         
-        file = glob(path+name+'_'+opt+jobnum+'.fits')
+        file = _locate(index, jobnum, kind, path+name+'_'+opt+jobnum+'.fits')
 
         try:
-            HDU = fits.open(file[0])       
+            header = fits.getheader(file[0])
         except IndexError:
             print('NO FILE MATCHING THOSE CRITERIA COULD BE FOUND, RETURNING...')
             return
-        try:
-            HDU[0].header['Failed'] == 1
-        except KeyError:
-            nofail = 1
-        if nofail != 1:
+        if 'FAILED' in header:
             failed = [file[0]]
 
     return failed
 
+def healthCheck(name, path = '', high = 0, optthin = 0, index = None, workers = 8):
+    """
+    Checks every collated file of an object in a directory, reading only the headers. Like
+    failCheck, but also reports what is wrong with each job.
+
+    INPUTS:
+           name: String of the name of object
+
+    OPTIONAL INPUTS:
+           path: Path to the collated files. Default is the current directory
+
+    KEYWORDS:
+
+           optthin: Set this to 1 to check the optically thin dust files instead of the disk models
+
+           high: Set this to 1 if the job numbers have 4 digits.
+
+           index: Dictionary made by jobIndex(path, name). If given, the collated files are taken from
+                  it instead of searching the path directory again.
+
+           workers: Number of threads used to read the headers.
+
+    OUTPUT
+           failed: List of the files with a FAILED tag (or that can not be read), like failCheck.
+
+           report: Table with one row per job and the columns
+                   JOBNUM   -- job number string
+                   FAILED   -- 1 if the file has a FAILED tag
+                   MISSING  -- components that are missing, e.g. 'PHOT,EXT' (EXT is only expected
+                               when the extinction correction was not turned off), or UNREADABLE
+                               if the file is truncated or can not be read
+                   NNAN     -- number of values that could not be read and were set to NaN
+                   NSCATNEG -- number of negative scattered light values
+
+           Files made by older versions of collate do not have the NNAN and NSCATNEG tags, so the
+           data of those files is read (memory mapped) to count them.
+    """
+
+    kind = 'fits'
+    if optthin == 1:
+        kind = 'otd'
+
+    wildhigh = '???'
+    if high == 1:
+        wildhigh = '????'
+
+    if index is None:
+        index = jobIndex(path, name)
+    nums = [num for num in sorted(index) if kind in index[num] and (optthin == 1 or len(num) == len(wildhigh))]
+    files = [index[num][kind] for num in nums]
+
+    keys = ['JOBNUM', 'FAILED', 'NAXIS', 'NOEXT', 'NNAN', 'NSCATNEG'] + GRIDAXES + OTDAXES
+    headers = _scanHeaders(files, keys, workers)
+
+    if optthin == 1:
+        expected = ['LFLAXIS']
+    else:
+        expected = ['PHOTAXIS', 'WALLAXIS', 'ANGAXIS', 'EXTAXIS']
+
+    rows = []
+    failed = []
+    for num, file, header in zip(nums, files, headers):
+        if 'UNREADABLE' in header:
+            failed.append(file)
+            rows.append((num, 1, 'UNREADABLE', 0, 0))
+            continue
+        if 'FAILED' in header:
+            failed.append(file)
+
+        missing = [axis for axis in expected if axis not in header]
+        if header.get('NOEXT') == 1 and 'EXTAXIS' in missing:
+            missing.remove('EXTAXIS')
+        if optthin == 1 and header.get('NAXIS', 0) == 0:
+            missing = ['LFLAXIS']
+
+        if 'NNAN' not in header:
+            header.update(_countBad(file, header))
+
+        rows.append((str(header.get('JOBNUM', '')), int('FAILED' in header),
+                     ','.join([axis.replace('AXIS', '') for axis in missing]),
+                     int(header.get('NNAN', 0)), int(header.get('NSCATNEG', 0))))
+
+    if len(rows) == 0:
+        report = Table(names = ('JOBNUM', 'FAILED', 'MISSING', 'NNAN', 'NSCATNEG'), dtype = ('S4', int, 'S32', int, int))
+    else:
+        report = Table(rows = rows, names = ('JOBNUM', 'FAILED', 'MISSING', 'NNAN', 'NSCATNEG'))
+
+    return failed, report
+
+def _scanHeaders(files, keys, workers = 8):
+    """
+    Reads the given keys out of the primary header of every file, using a pool of threads.
+    Returns a list with a dictionary of the keys that were found for each file. A file that can
+    not be read (e.g. truncated or still being written) does not stop the scan: its dictionary
+    only has the key 'UNREADABLE', with the reason.
+    """
+
+    if len(files) == 0:
+        return []
+
+    def scan(file):
+        try:
+            return _quickHeader(file, keys)
+        except (IOError, OSError, ValueError) as err:
+            return {'UNREADABLE': str(err)}
+
+    pool = ThreadPool(min(workers, len(files)))
+    try:
+        headers = pool.map(scan, files)
+    finally:
+        pool.close()
+        pool.join()
+
+    return headers
+
+def _quickHeader(file, keys):
+    """
+    Reads some keys from the primary header of a fits file, without parsing the whole header or
+    touching the data. Only works for simple values (numbers, logicals, strings without quotes).
+
+    INPUTS
+    file: Name of the fits file.
+    keys: List of the header keys to read.
+
+    OUTPUT
+    header: Dictionary of key -> value for the keys that are in the header.
+
+    Raises IOError if the header has no end, or if the file is shorter than the data the header
+    describes (i.e. it was truncated or is still being written).
+    """
+
+    header = {}
+    shape = {}
+    f = open(file, 'rb')
+    try:
+        nblocks = 0
+        while True:
+            block = f.read(2880)
+            nblocks += 1
+            if len(block) < 2880:
+                raise IOError('_QUICKHEADER: '+file+' HAS NO END TO ITS HEADER')
+            block = block.decode('ascii', 'replace')
+            for i in range(0, 2880, 80):
+                card = block[i:i+80]
+                key = card[:8].strip()
+                if key == 'END':
+                    _checkSize(file, nblocks*2880, shape)
+                    return header
+                if card[8:10] == '= ' and (key == 'BITPIX' or key.startswith('NAXIS')):
+                    shape[key] = int(card[10:].split('/')[0])
+                if key not in keys or card[8:10] != '= ':
+                    continue
+                value = card[10:]
+                if value.lstrip().startswith("'"):
+                    header[key] = str(value.split("'")[1].rstrip())
+                    continue
+                value = value.split('/')[0].strip()
+                if value == 'T' or value == 'F':
+                    header[key] = int(value == 'T')
+                else:
+                    try:
+                        header[key] = int(value)
+                    except ValueError:
+                        header[key] = float(value)
+    finally:
+        f.close()
+
+def _checkSize(file, headersize, shape):
+    """
+    Raises IOError if a fits file is shorter than its primary header and the data it describes.
+    """
+
+    size = abs(shape.get('BITPIX', 8))//8
+    for i in range(1, shape.get('NAXIS', 0)+1):
+        size *= shape.get('NAXIS'+str(i), 0)
+    if shape.get('NAXIS', 0) == 0:
+        size = 0
+    if os.path.getsize(file) < headersize + size:
+        raise IOError('_QUICKHEADER: '+file+' IS TRUNCATED')
+
+def _countBad(file, header):
+    """
+    Counts the NaN and negative scattered light values in the data of a collated file that was made
+    before collate recorded them in the header. The data is memory mapped and the file closed after.
+    """
+
+    counts = {'NNAN':0, 'NSCATNEG':0}
+
+    hdulist = fits.open(file, memmap = True)
+    data = hdulist[0].data
+    if data is not None:
+        counts['NNAN'] = int(np.isnan(data).sum())
+        if 'SCATAXIS' in header:
+            counts['NSCATNEG'] = int((data[header['SCATAXIS'],:] < 0).sum())
+    del data
+    hdulist.close()
+
+    return counts
 
 def head(name, jobnum, path='', optthin = 0, high = 0):
     """
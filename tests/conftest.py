@@ -0,0 +1,195 @@
+"""
+Fixtures shared by the tests: writers for small, fake model outputs laid out the way the D'Alessio code leaves them
+(job file, Phot, fort17, angle and rin files, or job_optthin and fort16 files for optically thin dust), so collate can
+be run on them in a temporary directory, for collated models, as read by TTS_Model and PTD_Model, and for a small grid
+of them with fake observations to fit it to.
+"""
+
+import gzip
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import matplotlib
+matplotlib.use('Agg')
+from astropy.io import fits
+import collate
+import EDGE
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..') + '/'
+NWL = 30
+
+# The header of a collated disk model:
+HEADER = {'OBJNAME': 'test', 'MSTAR': 0.5, 'TSTAR': 4060., 'RSTAR': 1.8, 'DISTANCE': 140., 'MUI': 0.5, 'RDISK': 300.,
+          'AMAXS': 0.25, 'EPS': 0.01, 'TSHOCK': 8000., 'TEMP': 1400., 'ALTINH': 1., 'WLCUT_AN': 0., 'WLCUT_SC': 0.,
+          'NSILCOMP': 1., 'SILTOTAB': 0.0034, 'AMORF_OL': 0.5, 'AMORF_PY': 0.5, 'FORSTERI': 0., 'ENSTATIT': 0.,
+          'RIN': 0.1, 'MDOT': 1e-8, 'ALPHA': 0.01}
+
+
+def _setLines(text, values):
+    """
+    Changes the active set lines of a job file text. A value of None comments the variable out instead.
+    """
+    params, alts, lines = collate.jobParse(text)
+    for name, value, lineno, active in alts:
+        if active and name in values:
+            if values[name] is None:
+                lines[lineno] = '#' + lines[lineno]
+            else:
+                lines[lineno] = collate.jobSub(lines[lineno], values[name])
+    return ''.join(lines)
+
+
+def _write(filename, text, gz):
+    if gz:
+        f = gzip.open(filename + '.gz', 'wb')
+        filename += '.gz'
+    else:
+        f = open(filename, 'w')
+    f.write(text)
+    f.close()
+    return filename
+
+
+def writeJob(path, jobnum, name='test', optthin=0, gz=0, seed=0, **values):
+    """
+    Writes the job file and outputs of one model into path. Keyword arguments change the active set lines of the job
+    file (None comments the variable out). With gz=1, the outputs (not the job file) are gzip compressed.
+
+    Returns a dictionary of kind (as named by collate.jobIndex) -> filename, and the (wavelength, flux...) columns
+    that were written, as 'columns'.
+    """
+    random = np.random.RandomState(seed)
+    wl = np.logspace(-1, 3, NWL)
+    values.setdefault('labelend', name + '_' + jobnum)
+    files = {}
+    if optthin:
+        text = open(SAMPLES + 'job_optthin_sample').read()
+        files['otdjob'] = _write(path + 'job_optthin' + jobnum, _setLines(text, values), 0)
+        flux = random.uniform(1e-12, 1e-10, NWL)
+        rows = ['%.6e  %.6e  %.6e' % (w, 1.0, f) for w, f in zip(wl, flux)]
+        files['fort16'] = _write(path + 'fort16.' + name + '_' + jobnum, '\n'.join(rows) + '\n', gz)
+        files['columns'] = (wl, flux)
+        return files
+
+    text = open(SAMPLES + 'job_sample').read()
+    files['job'] = _write(path + 'job' + jobnum, _setLines(text, values), 0)
+    phot, wall, disk = random.uniform(1e-11, 1e-9, (3, NWL))
+    tau = random.uniform(0, 0.1, NWL)
+    rows = ['%.6e %.6e' % (w, f) for w, f in zip(wl, phot)]
+    files['phot'] = _write(path + 'Phot' + name + '_' + jobnum, '\n'.join(rows) + '\n', gz)
+    rows = ['header line %d' % i for i in range(9)] + ['%.6e %.6e' % (w, f) for w, f in zip(wl, wall)]
+    files['wall'] = _write(path + 'fort17.' + name + '_' + jobnum, '\n'.join(rows) + '\n', gz)
+    rows = ['wl a b flux c tau'] + ['%.6e 1.0 2.0 %.6e 3.0 %.6e' % (w, f, t) for w, f, t in zip(wl, disk, tau)]
+    files['angle'] = _write(path + 'angle.' + name + '_' + jobnum, '\n'.join(rows) + '\n', gz)
+    files['rin'] = _write(path + 'rin.' + name + '_' + jobnum, '0.125\n', gz)
+    files['columns'] = (wl, phot, wall, disk, tau)
+    return files
+
+
+@pytest.fixture
+def makeJob():
+    """
+    The writeJob function, for tests that need fake model outputs.
+    """
+    return writeJob
+
+
+def writeModel(path, jobnum, wall=0, seed=0, **keys):
+    """
+    Writes a collated disk model (with scattered light and self-extinction), or an inner wall model if wall is set,
+    as path/test_jobnum.fits. Keyword arguments are added to (or replace values in) the header.
+
+    Returns the data array that was written.
+    """
+    random = np.random.RandomState(seed)
+    header = fits.Header()
+    for key, value in sorted(HEADER.items()):
+        header[key] = value
+    header['JOBNUM'] = jobnum
+    axes = ['WLAXIS', 'PHOTAXIS', 'WALLAXIS']
+    if wall:
+        header['NOEXT'] = 1
+        header['TEMP'] = 1200.
+    else:
+        axes += ['ANGAXIS', 'SCATAXIS', 'EXTAXIS']
+    for i, axis in enumerate(axes):
+        header[axis] = i
+    for key, value in sorted(keys.items()):
+        header[key.upper()] = value
+    data = np.array([np.logspace(-1, 3, NWL)] + [random.uniform(1e-11, 1e-9, NWL) for axis in axes[1:]])
+    fits.writeto(path + 'test_' + jobnum + '.fits', data, header)
+    return data
+
+
+@pytest.fixture
+def makeModel():
+    """
+    The writeModel function, for tests that need collated models.
+    """
+    return writeModel
+
+
+# The parameters of the models written by writeGrid, which vary MDOT fastest:
+GRID_MDOTS = [1e-9, 1e-8, 1e-7]
+GRID_ALPHAS = [1e-3, 1e-2]
+GRID_NWL = 200
+
+
+def writeGrid(path):
+    """
+    Writes a small grid of collated disk models (without self-extinction) over GRID_MDOTS x GRID_ALPHAS into path, as
+    test_001.fits to test_006.fits, and appends them to the grid container, as ModelGrid and the fitting tools read it.
+
+    Returns the filenames of the models.
+    """
+    random = np.random.RandomState(0)
+    wl = np.logspace(-1, 3, GRID_NWL)
+    files = []
+    for i, (mdot, alpha) in enumerate([(mdot, alpha) for mdot in GRID_MDOTS for alpha in GRID_ALPHAS]):
+        header = fits.Header()
+        for key, value in sorted(HEADER.items()):
+            header[key] = value
+        for j, axis in enumerate(['WLAXIS', 'PHOTAXIS', 'WALLAXIS', 'ANGAXIS', 'SCATAXIS']):
+            header[axis] = j
+        header['NOEXT'] = 1
+        header['JOBNUM'] = '%03d' % (i+1)
+        header['MDOT'] = mdot
+        header['ALPHA'] = alpha
+        data = [wl] + [10**random.uniform(-11, -9) * random.uniform(0.5, 1.5, GRID_NWL) for axis in range(4)]
+        files.append(path + 'test_%03d.fits' % (i+1))
+        fits.writeto(files[-1], np.array(data), header)
+    collate.gridAppend(collate.gridName(path, 'test'), files)
+    return files
+
+
+@pytest.fixture
+def gridModels(tmpdir):
+    """
+    The path to a grid written by writeGrid, for the fitting tests.
+    """
+    path = str(tmpdir) + '/'
+    writeGrid(path)
+    return path
+
+
+def fakeObs(seed):
+    """
+    Returns a fake TTS_Obs to fit: 8 photometry points and a 60 point IRS-like spectrum, drawn with the given seed.
+    """
+    random = np.random.RandomState(seed)
+    obs = EDGE.TTS_Obs('test')
+    obs.add_photometry('B', np.sort(random.uniform(0.3, 100, 8)), random.uniform(1e-10, 2e-10, 8))
+    obs.add_spectra('IRS', np.linspace(5., 35., 60), random.uniform(1e-10, 2e-10, 60))
+    return obs
+
+
+@pytest.fixture
+def makeObs():
+    """
+    The fakeObs function, for tests that fit observations.
+    """
+    return fakeObs
@@ -0,0 +1,79 @@
+"""
+Checks that calc_totals gives the same total fluxes as calc_total on one model at a time, for a ModelGrid (all of it
+or some rows) and for a list of models, with a different inner wall scale (calc_total's altinh) for each model and a
+mask leaving out components, and that it writes into the buffer given as out.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+COMPONENTS = ['phot', 'iwall', 'disk', 'scatt']
+ALTINH = np.array([0.5, 1.0, 2.0, 1.5, 0.0, 3.0])
+# Which models get their disk component (calc_total's disk keyword):
+DISK = np.array([1, 0, 1, 1, 0, 1], dtype=bool)
+
+
+def _expected(path, jobs):
+    totals = []
+    for jobn in jobs:
+        model = EDGE.TTS_Model('test', jobn, dpath=path)
+        model.dataInit()
+        model.calc_total(disk=DISK[jobn-1], altinh=ALTINH[jobn-1], verbose=0)
+        totals.append(model.data['total'])
+    return np.array(totals)
+
+
+def _mask(rows):
+    mask = np.ones((len(rows), len(COMPONENTS)), dtype=bool)
+    mask[:, COMPONENTS.index('disk')] = DISK[rows]
+    return mask
+
+
+def test_calc_totals_ModelGrid(gridModels):
+    grid = EDGE.ModelGrid('test', gridModels)
+    rows = np.arange(len(grid))
+    totals = EDGE.calc_totals(grid, components=COMPONENTS, mask=_mask(rows), scales={'iwall': ALTINH})
+    assert np.allclose(totals, _expected(gridModels, [int(job) for job in grid.jobs]), rtol=1e-12)
+
+    # Some rows, written into a buffer that already holds something:
+    rows = np.array([5, 0, 3])
+    out = np.ones((len(rows), grid.flux.shape[2]))
+    totals = EDGE.calc_totals(grid, components=COMPONENTS, mask=_mask(rows), scales={'iwall': ALTINH[rows]}, out=out,
+                              rows=rows)
+    assert totals is out
+    assert np.allclose(out, _expected(gridModels, [int(grid.jobs[row]) for row in rows]), rtol=1e-12)
+
+    # Without components, every flux component is added:
+    assert np.allclose(EDGE.calc_totals(grid), EDGE.calc_totals(grid, components=COMPONENTS), rtol=1e-15)
+
+    with pytest.raises(ValueError):
+        EDGE.calc_totals(grid, out=np.zeros((2, grid.flux.shape[2])))
+    with pytest.raises(KeyError):
+        EDGE.calc_totals(grid, components=['owall'])
+
+
+def test_calc_totals_models(gridModels):
+    jobs = [3, 1, 6, 2]
+    models = []
+    for jobn in jobs:
+        models.append(EDGE.TTS_Model('test', jobn, dpath=gridModels))
+        models[-1].dataInit()
+    rows = np.array(jobs) - 1
+    expected = _expected(gridModels, jobs)
+    totals = EDGE.calc_totals(models, components=COMPONENTS, mask=_mask(rows), scales={'iwall': ALTINH[rows]})
+    assert np.allclose(totals, expected, rtol=1e-12)
+
+    out = np.ones(expected.shape)
+    assert EDGE.calc_totals(models, components=COMPONENTS, mask=_mask(rows), scales={'iwall': ALTINH[rows]},
+                            out=out) is out
+    assert np.allclose(out, expected, rtol=1e-12)
+
+    # The default components include the ones (like owall and dust) these models don't have:
+    models[0].calc_total(verbose=0)
+    assert np.allclose(EDGE.calc_totals(models[:1])[0], models[0].data['total'], rtol=1e-12)
+
+    models[1].data['wl'] = models[1].data['wl'][:-1]
+    with pytest.raises(ValueError):
+        EDGE.calc_totals(models)
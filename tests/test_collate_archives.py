@@ -0,0 +1,79 @@
+"""
+Checks collating straight from compressed model outputs: a job read out of a .tar.gz archive, or from individually
+gzipped output files, gives the same fits file as the plain outputs.
+"""
+
+import os
+import tarfile
+
+import numpy as np
+from astropy.io import fits
+
+import collate
+
+
+def _assertSame(file1, file2):
+    header1, header2 = fits.getheader(file1), fits.getheader(file2)
+    assert dict(header1) == dict(header2)
+    assert np.array_equal(fits.getdata(file1), fits.getdata(file2))
+
+
+def _plain(tmpdir, makeJob):
+    path = str(tmpdir.mkdir('plain')) + '/'
+    makeJob(path, '001')
+    makeJob(path, '001', optthin=1)
+    collate.collate(path, '001', 'test', path)
+    collate.collate(path, '001', 'test', path, optthin=1)
+    return path
+
+
+def test_collate_archives_tar_gz(tmpdir, makeJob):
+    plain = _plain(tmpdir, makeJob)
+    dest = str(tmpdir.mkdir('collated')) + '/'
+    for gz in [0, 1]:
+        models = str(tmpdir.mkdir('models%d' % gz)) + '/'
+        files = makeJob(models, '001', gz=gz)
+        files.update(makeJob(models, '001', optthin=1, gz=gz))
+        archive = str(tmpdir) + '/models%d.tar.gz' % gz
+        tar = tarfile.open(archive, 'w:gz')
+        for kind, filename in sorted(files.items()):
+            if kind != 'columns':
+                tar.add(filename, arcname='run/' + os.path.basename(filename))
+        tar.close()
+
+        summary = collate.collate_archives([archive], 'test', dest, workers=1, clob=1)
+        assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+        assert summary['failed'] == {} and summary['skipped'] == []
+        _assertSame(dest + 'test_001.fits', plain + 'test_001.fits')
+        _assertSame(dest + 'test_OTD_001.fits', plain + 'test_OTD_001.fits')
+
+
+def test_collate_archives_bad_archive(tmpdir):
+    archive = str(tmpdir) + '/broken.tar.gz'
+    f = open(archive, 'wb')
+    f.write(b'not an archive')
+    f.close()
+    summary = collate.collate_archives([archive], 'test', str(tmpdir) + '/', workers=1)
+    assert list(summary['failed'].keys()) == [archive]
+
+
+def test_collate_gzipped_outputs(tmpdir, makeJob):
+    plain = _plain(tmpdir, makeJob)
+    path = str(tmpdir.mkdir('gzipped')) + '/'
+    files = makeJob(path, '001', gz=1)
+    files.update(makeJob(path, '001', optthin=1, gz=1))
+    for kind in ['phot', 'wall', 'angle', 'rin', 'fort16']:
+        assert files[kind].endswith('.gz')
+        assert collate._fileSize(files[kind]) == os.path.getsize(plain + os.path.basename(files[kind])[:-3])
+
+    # Found by searching the directory, and through the index used by collate_grid:
+    collate.collate(path, '001', 'test', path)
+    collate.collate(path, '001', 'test', path, optthin=1)
+    _assertSame(path + 'test_001.fits', plain + 'test_001.fits')
+    _assertSame(path + 'test_OTD_001.fits', plain + 'test_OTD_001.fits')
+
+    dest = str(tmpdir.mkdir('collated')) + '/'
+    summary = collate.collate_grid(path, 'test', dest, ['001'], otdnums=['001'], workers=1)
+    assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+    _assertSame(dest + 'test_001.fits', plain + 'test_001.fits')
+    _assertSame(dest + 'test_OTD_001.fits', plain + 'test_OTD_001.fits')
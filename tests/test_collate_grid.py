@@ -0,0 +1,105 @@
+"""
+Checks collate_grid on a tiny directory of fake jobs: every job ends up in the right bucket of the summary, the fits
+files it writes are the ones collate writes for a single job, and incremental runs only collate the jobs whose inputs
+or collate keywords changed.
+"""
+
+import os
+
+import numpy as np
+from astropy.io import fits
+
+import collate
+
+
+def _makeGrid(tmpdir, makeJob):
+    path = str(tmpdir.mkdir('models')) + '/'
+    dest = str(tmpdir.mkdir('collated')) + '/'
+    makeJob(path, '001')
+    makeJob(path, '002', EPS=None)              # No active EPS line, collate raises an IOError
+    makeJob(path, '001', optthin=1)
+    return path, dest
+
+
+def test_collate_grid_summary(tmpdir, makeJob):
+    path, dest = _makeGrid(tmpdir, makeJob)
+    # Job 3 has no files at all, so collate returns without writing anything:
+    summary = collate.collate_grid(path, 'test', dest, [1, 2, 3], otdnums=[1], workers=1)
+    assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+    assert list(summary['failed'].keys()) == ['002']
+    assert summary['failed']['002'].startswith('IOError')
+    assert summary['skipped'] == ['003']
+    assert summary['unchanged'] == []
+    assert not os.path.exists(dest + 'test_002.fits')
+
+    # The same files as collating each job on its own:
+    single = str(tmpdir.mkdir('single')) + '/'
+    collate.collate(path, '001', 'test', single)
+    collate.collate(path, '001', 'test', single, optthin=1)
+    for filename in ['test_001.fits', 'test_OTD_001.fits']:
+        assert dict(fits.getheader(dest + filename)) == dict(fits.getheader(single + filename))
+        assert np.array_equal(fits.getdata(dest + filename), fits.getdata(single + filename))
+
+
+def test_collate_grid_incremental(tmpdir, makeJob):
+    path, dest = _makeGrid(tmpdir, makeJob)
+    run = lambda **kwargs: collate.collate_grid(path, 'test', dest, ['001', '002'], otdnums=['001'], workers=1,
+                                                incremental=1, **kwargs)
+    files = collate.jobIndex(path, 'test')['001']
+    os.utime(files['fort16'], (1e9, 1e9))
+    summary = run()
+    assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+    assert os.path.exists(dest + 'test_manifest.json')
+    manifest = collate._loadManifest(dest + 'test_manifest.json')
+    assert sorted(manifest.keys()) == ['001', 'OTD_001']
+
+    # Nothing changed, and failed jobs are always tried again:
+    summary = run()
+    assert summary['collated'] == []
+    assert summary['unchanged'] == ['001', 'OTD_001']
+    assert list(summary['failed'].keys()) == ['002']
+
+    # A newer input file:
+    stat = os.stat(files['phot'])
+    os.utime(files['phot'], (stat.st_atime, stat.st_mtime + 10))
+    summary = run()
+    assert summary['collated'] == [dest + 'test_001.fits']
+    assert summary['unchanged'] == ['OTD_001']
+
+    # An input file that changed size but kept its modification time:
+    f = open(files['fort16'], 'a')
+    f.write('1.000000e+04  1.000000e+00  1.000000e-12\n')
+    f.close()
+    os.utime(files['fort16'], (1e9, 1e9))
+    summary = run()
+    assert summary['collated'] == [dest + 'test_OTD_001.fits']
+    assert fits.getdata(dest + 'test_OTD_001.fits').shape[1] == 31
+
+    # A fits file that was removed since:
+    os.remove(dest + 'test_001.fits')
+    summary = run()
+    assert summary['collated'] == [dest + 'test_001.fits']
+
+    # Different collate keywords:
+    summary = run(noextinct=1)
+    assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+    assert fits.getheader(dest + 'test_001.fits')['NOEXT'] == 1
+    assert run(noextinct=1)['unchanged'] == ['001', 'OTD_001']
+
+
+def test_jobSignature_hashes(tmpdir, makeJob):
+    path = str(tmpdir) + '/'
+    makeJob(path, '001')
+    files = collate.jobIndex(path, 'test')['001']
+    os.utime(files['rin'], (1e9, 1e9))
+    plain = collate._jobSignature(path, '001', files, 'options')
+    signature = collate._jobSignature(path, '001', files, 'options', hashes=1)
+    assert sorted(signature.keys()) == ['angle', 'job', 'options', 'phot', 'rin', 'wall']
+
+    # Same size and modification time, different contents:
+    f = open(files['rin'], 'w')
+    f.write('0.126\n')
+    f.close()
+    os.utime(files['rin'], (1e9, 1e9))
+    assert collate._jobSignature(path, '001', files, 'options') == plain
+    assert collate._jobSignature(path, '001', files, 'options', hashes=1) != signature
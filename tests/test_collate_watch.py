@@ -0,0 +1,39 @@
+"""
+Checks collate_watch on a directory of fake jobs in various states: complete jobs are collated once, jobs that are
+still missing outputs are left alone until they are complete, and jobs collate skips are listed once.
+"""
+
+import os
+
+import collate
+
+
+def _watch(path, dest):
+    return collate.collate_watch(path, 'test', dest, interval=0.05, settle=0, idle=0.3, workers=1)
+
+
+def test_collate_watch(tmpdir, makeJob):
+    path = str(tmpdir.mkdir('models')) + '/'
+    dest = str(tmpdir.mkdir('collated')) + '/'
+    makeJob(path, '001')
+    makeJob(path, '001', optthin=1)
+    makeJob(path, '003', labelend='other_003')      # collate skips it, the labelend does not match
+    # Job 2 is still running, only its job file and Phot file are there so far:
+    running = makeJob(str(tmpdir.mkdir('running')) + '/', '002')
+    for kind in ['job', 'phot']:
+        os.rename(running[kind], path + os.path.basename(running[kind]))
+
+    summary = _watch(path, dest)
+    assert summary['collated'] == [dest + 'test_001.fits', dest + 'test_OTD_001.fits']
+    assert summary['skipped'] == ['003']
+    assert summary['failed'] == {}
+    assert not os.path.exists(dest + 'test_002.fits')
+    assert sorted(collate._loadManifest(dest + 'test_manifest.json').keys()) == ['001', 'OTD_001']
+
+    # A new watcher picks up where the last one stopped:
+    for kind in ['wall', 'angle', 'rin']:
+        os.rename(running[kind], path + os.path.basename(running[kind]))
+    summary = _watch(path, dest)
+    assert summary['collated'] == [dest + 'test_002.fits']
+    assert summary['skipped'] == ['003']
+    assert sorted(collate._loadManifest(dest + 'test_manifest.json').keys()) == ['001', '002', 'OTD_001']
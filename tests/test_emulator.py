@@ -0,0 +1,28 @@
+"""
+Checks that SEDEmulator gives back the components of the collated models at the nodes of the grid, and that it refuses
+a grid whose models are not all on the same wavelengths.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+
+def test_emulator_reproduces_grid_nodes(gridModels):
+    grid = EDGE.ModelGrid('test', gridModels)
+    emulator = EDGE.SEDEmulator(grid, params=['MDOT', 'ALPHA'])
+    for i in range(len(grid)):
+        data = emulator.predict(mdot=grid.params['MDOT'][i], alpha=grid.params['ALPHA'][i])
+        model = grid.model(grid.jobs[i])
+        assert np.array_equal(data['wl'], model.data['wl'])
+        for key in emulator.comps:
+            assert np.allclose(data[key], model.data[key], rtol=1e-12)
+
+
+def test_emulator_rejects_mixed_wavelengths(gridModels):
+    grid = EDGE.ModelGrid('test', gridModels)
+    grid.flux = np.array(grid.flux)
+    grid.flux[2, 0, 10] *= 1.001
+    with pytest.raises(ValueError):
+        EDGE.SEDEmulator(grid, params=['MDOT', 'ALPHA'])
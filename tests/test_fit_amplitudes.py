@@ -0,0 +1,91 @@
+"""
+Checks that fit_amplitudes, which solves many small non-negative least-squares problems at once, gives the same
+amplitudes and chi-squared values as scipy's nnls on each of them, including one whose design matrix has an empty
+column, and that fit_grid with free components (including the dust) recovers amplitudes injected into observations
+and gives the same amplitudes and reduced chi-squared as nnls on each model.
+"""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from scipy.optimize import nnls
+
+import EDGE
+
+
+def test_fit_amplitudes_matches_nnls():
+    random = np.random.RandomState(2)
+    design = random.normal(size=(200, 30, 3))
+    target = random.normal(size=(200, 30))
+    design[5, :, 1] = 0
+    chisq, amplitudes = EDGE.fit_amplitudes(design, target)
+    for i in range(len(design)):
+        expected, residual = nnls(design[i], target[i])
+        assert np.allclose(amplitudes[i], expected, atol=1e-10)
+        assert np.isclose(chisq[i], residual**2)
+
+
+def _writeDust(path):
+    wl = np.logspace(-1, 3, 100)
+    header = fits.Header()
+    header['WLAXIS'] = 0
+    header['LFLAXIS'] = 1
+    flux = 1e-9 * wl / (1 + wl**2)
+    fits.writeto(path + 'test_OTD_001.fits', np.array([wl, flux]), header)
+    return wl, flux
+
+
+def _injectedObs(path, makeObs, amplitudes, dust=None):
+    """
+    Observations made from model 003, with the inner wall, scattered light and dust scaled by the given amplitudes.
+    """
+    obs = makeObs(1)
+    model = EDGE.TTS_Model('test', 3, dpath=path)
+    model.dataInit()
+    data = model.data
+    total = data['phot'] + amplitudes['iwall']*data['iwall'] + data['disk'] + amplitudes['scatt']*data['scatt']
+    for table in [obs.photometry['B'], obs.spectra['IRS']]:
+        table['lFl'] = np.interp(table['wl'], data['wl'], total)
+        if dust is not None:
+            table['lFl'] = table['lFl'] + amplitudes['dust']*np.interp(table['wl'], dust[0], dust[1])
+    return obs
+
+
+def test_fit_grid_recovers_amplitudes(gridModels, makeObs):
+    obs = _injectedObs(gridModels, makeObs, {'iwall': 2.5, 'scatt': 0.7})
+    results = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels), free=['iwall', 'scatt'])
+    assert results['JOBNUM'][0] == '003' and results['RCHI2'][0] < 1e-10
+    assert np.isclose(results['SCALE_IWALL'][0], 2.5, rtol=1e-8)
+    assert np.isclose(results['SCALE_SCATT'][0], 0.7, rtol=1e-8)
+
+    # With dust, fixed or free:
+    dust = _writeDust(gridModels)
+    obs = _injectedObs(gridModels, makeObs, {'iwall': 2.5, 'scatt': 0.7, 'dust': 1.0}, dust=dust)
+    results = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels), free=['iwall', 'scatt'], dust=1)
+    assert results['JOBNUM'][0] == '003' and results['RCHI2'][0] < 1e-10
+    assert np.isclose(results['SCALE_IWALL'][0], 2.5, rtol=1e-8)
+    obs = _injectedObs(gridModels, makeObs, {'iwall': 2.5, 'scatt': 0.7, 'dust': 1.3}, dust=dust)
+    results = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels), free=['iwall', 'scatt', 'dust'], dust=1)
+    assert results['JOBNUM'][0] == '003' and results['RCHI2'][0] < 1e-10
+    assert np.allclose([results['SCALE_' + key][0] for key in ['IWALL', 'SCATT', 'DUST']], [2.5, 0.7, 1.3],
+                       rtol=1e-8)
+    with pytest.raises(ValueError):
+        EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels), free=['dust'])
+
+
+def test_fit_grid_free_matches_nnls(gridModels, makeObs):
+    dustWl, dustFlux = _writeDust(gridModels)
+    obs = makeObs(2)
+    wavelength, flux, weights = EDGE.obsPrep(obs)
+    scale = weights / flux
+    results = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels), free=['iwall', 'dust'], dust=1)
+    for row in results:
+        data = EDGE.TTS_Model('test', row['JOBNUM'], dpath=gridModels)
+        data.dataInit()
+        data = data.data
+        fixed = np.interp(wavelength, data['wl'], data['phot'] + data['disk'] + data['scatt'])
+        design = np.column_stack((np.interp(wavelength, data['wl'], data['iwall']),
+                                  np.interp(wavelength, dustWl, dustFlux)))
+        expected, residual = nnls(design * scale[:, np.newaxis], (flux - fixed) * scale)
+        assert np.allclose([row['SCALE_IWALL'], row['SCALE_DUST']], expected, rtol=1e-8, atol=1e-12)
+        assert np.isclose(row['RCHI2'], residual**2 / (len(flux) - 1.), rtol=1e-8)
@@ -0,0 +1,44 @@
+"""
+Checks that fit_grid, on the grid read from the container or from the individual models and split between one or more
+worker processes, gives the same reduced chi-squared values as model_rchi2 on one TTS_Model at a time.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+
+def _slowRchi2(obs, path, jobnum):
+    model = EDGE.TTS_Model('test', jobnum, dpath=path)
+    model.dataInit()
+    model.calc_total(verbose=0)
+    return EDGE.model_rchi2(obs, model, path)
+
+
+@pytest.mark.parametrize('grid', [0, 1])
+def test_fit_grid_matches_model_rchi2(gridModels, makeObs, grid):
+    obs = makeObs(1)
+    results = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels, grid=grid))
+    assert len(results) == 6
+    for row in results:
+        assert np.isclose(row['RCHI2'], _slowRchi2(obs, gridModels, int(row['JOBNUM'])), rtol=1e-10)
+    assert np.all(np.diff(results['RCHI2']) >= 0)
+
+
+def test_fit_grid_workers(gridModels, makeObs):
+    obs = makeObs(1)
+    grid = EDGE.ModelGrid('test', gridModels)
+    expected = EDGE.fit_grid(obs, grid, workers=1)
+    results = EDGE.fit_grid(obs, grid, workers=2)
+    assert list(results['JOBNUM']) == list(expected['JOBNUM'])
+    assert np.allclose(results['RCHI2'], expected['RCHI2'], rtol=1e-10)
+    for row in results:
+        assert np.isclose(row['RCHI2'], _slowRchi2(obs, gridModels, int(row['JOBNUM'])), rtol=1e-10)
+
+    # The grid is moved to shared memory once, and later fits reuse it:
+    shared = grid._shared
+    assert shared is not None
+    results = EDGE.fit_grid(obs, grid, workers=2)
+    assert grid._shared is shared
+    assert np.allclose(results['RCHI2'], expected['RCHI2'], rtol=1e-10)
@@ -0,0 +1,18 @@
+"""
+Checks that fit_stream, reading the grid container or the individual models a chunk at a time, keeps the same best
+models with the same reduced chi-squared values as fit_grid on the whole grid.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+
+@pytest.mark.parametrize('grid', [0, 1])
+def test_fit_stream_matches_fit_grid(gridModels, makeObs, grid):
+    obs = makeObs(4)
+    expected = EDGE.fit_grid(obs, EDGE.ModelGrid('test', gridModels))
+    results = EDGE.fit_stream(obs, 'test', dpath=gridModels, k=3, chunk=4, grid=grid)
+    assert list(results['JOBNUM']) == list(expected['JOBNUM'][:3])
+    assert np.allclose(results['RCHI2'], expected['RCHI2'][:3], rtol=1e-10)
@@ -0,0 +1,25 @@
+"""
+Checks that fit_targets, fitting several targets against the grid container or the individual models a chunk at a
+time, gives the same reduced chi-squared values as fit_grid on each target, and that it keeps the order of a ModelGrid
+it is given.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+
+@pytest.mark.parametrize('grid', [0, 1])
+def test_fit_targets_matches_fit_grid(gridModels, makeObs, grid):
+    obslist = [makeObs(seed) for seed in [5, 6, 7]]
+    modelGrid = EDGE.ModelGrid('test', gridModels)
+    jobs, rchi_sq = EDGE.fit_targets(obslist, 'test', dpath=gridModels, grid=grid, chunk=4)
+    assert rchi_sq.shape == (len(obslist), len(modelGrid))
+    for t, obs in enumerate(obslist):
+        expected = EDGE.fit_grid(obs, modelGrid)
+        expected = dict(zip(expected['JOBNUM'], expected['RCHI2']))
+        assert np.allclose(rchi_sq[t], [expected[job] for job in jobs], rtol=1e-10)
+
+    jobs, rchi_sq = EDGE.fit_targets(obslist, modelGrid, chunk=4)
+    assert list(jobs) == list(modelGrid.jobs)
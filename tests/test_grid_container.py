@@ -0,0 +1,94 @@
+"""
+Regression checks for the grid containers made by collate.gridAppend (name_grid.fits, name_OTD_grid.fits): they are
+never mistaken for collated jobs when they sit in the same directory as the job files, and growing them one job at a
+time gives back the same models as writing them at once.
+"""
+
+import os
+
+import numpy as np
+from astropy.io import fits
+
+import EDGE
+import collate
+
+
+def _writeJob(path, filename, jobnum, mdot, optthin=0):
+    header = fits.Header()
+    header['OBJNAME'] = 'test'
+    header['JOBNUM'] = jobnum
+    header['MDOT'] = mdot
+    header['WLAXIS'] = 0
+    if optthin:
+        header['OPTTHIN'] = 1
+        header['LFLAXIS'] = 1
+        data = np.array([np.logspace(-1, 3, 20), np.ones(20)])
+    else:
+        header['PHOTAXIS'] = 1
+        header['WALLAXIS'] = 2
+        header['ANGAXIS'] = 3
+        header['NOEXT'] = 1
+        data = np.array([np.logspace(-1, 3, 20)] + [np.ones(20)]*3)
+    fits.writeto(path + filename, data, header)
+    return path + filename
+
+
+def _makeGrid(tmpdir):
+    path = str(tmpdir) + '/'
+    jobs = [_writeJob(path, 'test_%03d.fits' % i, '%03d' % i, mdot) for i, mdot in [(1, 1e-8), (2, 2e-8)]]
+    otds = [_writeJob(path, 'test_OTD_%03d.fits' % i, '%03d' % i, 1e-8, optthin=1) for i in [1, 2]]
+    collate.gridAppend(collate.gridName(path, 'test'), jobs)
+    collate.gridAppend(collate.gridName(path, 'test', optthin=1), otds)
+    assert os.path.exists(collate.gridName(path, 'test'))
+    assert os.path.exists(collate.gridName(path, 'test', optthin=1))
+    return path
+
+
+def test_searchJobs_unindexed_skips_container(tmpdir):
+    path = _makeGrid(tmpdir)
+    assert list(EDGE.searchJobs('test', dpath=path, indexed=0, mdot=2e-8)) == ['002']
+    assert sorted(EDGE.searchJobs('test', dpath=path, indexed=0)) == ['001', '002']
+
+
+def test_searchJobs_indexed_skips_container(tmpdir):
+    path = _makeGrid(tmpdir)
+    assert list(EDGE.searchJobs('test', dpath=path, mdot=2e-8)) == ['002']
+
+
+def test_failCheck_skips_containers(tmpdir, monkeypatch):
+    path = _makeGrid(tmpdir)
+    scanned = []
+    scanHeaders = collate._scanHeaders
+
+    def recordScan(files, keys, workers):
+        scanned.extend(os.path.basename(file) for file in files)
+        return scanHeaders(files, keys, workers)
+
+    monkeypatch.setattr(collate, '_scanHeaders', recordScan)
+    assert collate.failCheck('test', path=path) == []
+    assert collate.failCheck('test', path=path, optthin=1) == []
+    # 'grid' also fits the 4-digit wildcard:
+    assert collate.failCheck('test', path=path, high=1) == []
+    assert sorted(scanned) == ['test_001.fits', 'test_002.fits', 'test_OTD_001.fits', 'test_OTD_002.fits']
+
+
+def test_gridAppend_in_place_matches_batch(tmpdir):
+    path = str(tmpdir) + '/'
+    jobs = [_writeJob(path, 'test_%03d.fits' % i, '%03d' % i, 1e-8*i) for i in [3, 1, 2]]
+    for job in jobs:
+        fits.setval(job, 'NNAN', value=0)
+        fits.setval(job, 'NSCATNEG', value=4)
+    collate.gridAppend(path + 'batch_grid.fits', jobs)
+    for job in jobs + jobs[:1]:
+        collate.gridAppend(path + 'single_grid.fits', [job])
+    assert fits.getheader(path + 'single_grid.fits')['NJOBS'] == 3
+    assert fits.getdata(path + 'single_grid.fits', 'FLUX').shape == (3, len(collate.GRIDAXES), 20)
+
+    for job in jobs:
+        jobnum = fits.getheader(job)['JOBNUM']
+        expected = dict((key, value) for key, value in fits.getheader(job).items() if key not in collate._GRIDSKIP)
+        for gridfile in ['batch_grid.fits', 'single_grid.fits']:
+            header, data = collate.gridRead(path + gridfile, jobnum)
+            assert dict(header.items()) == expected
+            assert type(header['NNAN']) == type(header['NSCATNEG']) == int
+            assert np.array_equal(data, fits.getdata(job))
@@ -0,0 +1,62 @@
+"""
+Checks that failCheck and healthCheck, which only read the headers, notice collated files that are broken: one cut off
+part way through its data and one whose header has no END card are both reported as UNREADABLE and counted as failed.
+"""
+
+import os
+
+from astropy.io import fits
+
+import collate
+
+
+def _collated(tmpdir, makeJob):
+    path = str(tmpdir) + '/'
+    for jobnum in ['001', '002', '003', '004']:
+        makeJob(path, jobnum)
+        collate.collate(path, jobnum, 'test', path)
+    fits.setval(path + 'test_004.fits', 'FAILED', value=1)
+
+    # Cut 002 off part way through its data, which all fits in the last 2880 byte block of the file:
+    size = os.path.getsize(path + 'test_002.fits')
+    f = open(path + 'test_002.fits', 'r+b')
+    f.truncate(size - 2880 + 700)
+    f.close()
+
+    # Keep only the header of 003, without its END card:
+    f = open(path + 'test_003.fits', 'rb')
+    data = f.read()
+    f.close()
+    end = [i for i in range(0, len(data), 80) if data[i:i+80] == b'END' + b' '*77][0]
+    f = open(path + 'test_003.fits', 'wb')
+    f.write(data[:end] + b' '*(-end % 2880))
+    f.close()
+    return path
+
+
+def test_quickHeader_detects_broken_files(tmpdir, makeJob):
+    path = _collated(tmpdir, makeJob)
+    header = collate._quickHeader(path + 'test_001.fits', ['JOBNUM', 'NOEXT', 'RIN', 'FAILED'])
+    assert header == {'JOBNUM': '001', 'RIN': 0.125}
+    for jobnum in ['002', '003']:
+        try:
+            collate._quickHeader(path + 'test_' + jobnum + '.fits', ['JOBNUM'])
+        except IOError as err:
+            assert ('TRUNCATED' if jobnum == '002' else 'NO END') in str(err)
+        else:
+            raise AssertionError('No IOError for job ' + jobnum)
+
+
+def test_failCheck_counts_unreadable_files(tmpdir, makeJob):
+    path = _collated(tmpdir, makeJob)
+    expected = [path + 'test_' + jobnum + '.fits' for jobnum in ['002', '003', '004']]
+    assert sorted(collate.failCheck('test', path=path, workers=2)) == expected
+    assert sorted(collate.failCheck('test', path=path, index=collate.jobIndex(path, 'test'))) == expected
+
+
+def test_healthCheck_report(tmpdir, makeJob):
+    path = _collated(tmpdir, makeJob)
+    failed, report = collate.healthCheck('test', path=path, workers=2)
+    assert sorted(failed) == [path + 'test_' + jobnum + '.fits' for jobnum in ['002', '003', '004']]
+    rows = dict((row['JOBNUM'], (row['FAILED'], row['MISSING'])) for row in report)
+    assert rows == {'001': (0, ''), '002': (1, 'UNREADABLE'), '003': (1, 'UNREADABLE'), '004': (1, '')}
@@ -0,0 +1,75 @@
+"""
+Checks the interpolation of models onto the observed wavelengths: interpOperator gives the same fluxes as np.interp,
+reuses its cached operator for equal arrays and makes a new one for other observations, even with the same number of
+points and end points, and gridInterp and _streamInterp match np.interp whether or not the models share their
+wavelengths.
+"""
+
+import numpy as np
+
+import EDGE
+
+
+def test_interpOperator_matches_np_interp():
+    wl = np.logspace(-1, 3, 50)
+    wavelength = np.concatenate(([0.05], np.sort(np.random.RandomState(0).uniform(0.1, 1000., 40)), [wl[-1], 2000.]))
+    flux = np.random.RandomState(1).uniform(1, 2, (5, len(wl)))
+    modelFlux = (EDGE.interpOperator(wl, wavelength) * flux.T).T
+    for total, expected in zip(modelFlux, flux):
+        assert np.allclose(total, np.interp(wavelength, wl, expected), rtol=1e-12)
+
+
+def test_interpOperator_cache():
+    EDGE.interpCache.clear()
+    wl = np.logspace(-1, 3, 50)
+    wavelength = np.linspace(1., 30., 20)
+    operator = EDGE.interpOperator(wl, wavelength)
+    assert EDGE.interpOperator(wl.copy(), wavelength.copy()) is operator
+    assert len(EDGE.interpCache) == 1
+
+    # Observations with the same length and end points, but other wavelengths in between:
+    other = wavelength.copy()
+    other[5] += 0.1
+    new = EDGE.interpOperator(wl, other)
+    assert new is not operator
+    flux = np.random.RandomState(2).uniform(1, 2, len(wl))
+    assert np.allclose(new * flux, np.interp(other, wl, flux), rtol=1e-12)
+    assert EDGE.interpOperator(wl, other) is new
+
+    # Only the most recently used operators are kept:
+    for n in range(3):
+        EDGE.interpOperator(wl, np.linspace(1., 30. + n, 20), cachesize=2)
+    assert len(EDGE.interpCache) == 2
+    assert EDGE.interpOperator(wl, wavelength) is not operator
+
+
+def _mixedGrid(path):
+    grid = EDGE.ModelGrid('test', path)
+    grid.flux = np.array(grid.flux)
+    grid.flux[2, 0, 10] *= 1.001
+    return grid
+
+
+def test_gridInterp_matches_np_interp(gridModels, makeObs):
+    wavelength = EDGE.obsPrep(makeObs(1))[0]
+    for grid in [EDGE.ModelGrid('test', gridModels), _mixedGrid(gridModels)]:
+        totals = EDGE.calc_totals(grid)
+        rows = [4, 2, 0]
+        modelFlux = EDGE.gridInterp(grid, totals[rows], wavelength, rows=rows)
+        wls = grid.component('wl')
+        for i, row in enumerate(rows):
+            assert np.allclose(modelFlux[i], np.interp(wavelength, wls[row], totals[row]), rtol=1e-12)
+
+
+def test_streamInterp_matches_np_interp(gridModels, makeObs):
+    wavelength = EDGE.obsPrep(makeObs(1))[0]
+    components = ['phot', 'iwall', 'disk', 'scatt']
+    for grid in [EDGE.ModelGrid('test', gridModels), _mixedGrid(gridModels)]:
+        models = []
+        for row in range(len(grid)):
+            data = dict((key, np.array(grid.component(key)[row])) for key in ['wl'] + components)
+            models.append((grid.jobs[row], {}, data))
+        modelFlux = EDGE._streamInterp(models, components, wavelength)
+        for i, (jobnum, params, data) in enumerate(models):
+            total = sum(data[key] for key in components)
+            assert np.allclose(modelFlux[i], np.interp(wavelength, data['wl'], total), rtol=1e-12)
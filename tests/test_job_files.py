@@ -0,0 +1,119 @@
+"""
+Checks the job file handling shared by job creation and collate: job_file_create and job_optthin_create make the
+expected changes to the sample job files (and nothing else), as read back with jobParse, and collate pulls AMAXS and
+EPS out of the job files the way it always has.
+"""
+
+import os
+import shutil
+
+import pytest
+from astropy.io import fits
+
+import EDGE
+import collate
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..') + '/'
+
+
+def _samples(tmpdir):
+    path = str(tmpdir) + '/'
+    shutil.copy(SAMPLES + 'job_sample', path)
+    shutil.copy(SAMPLES + 'job_optthin_sample', path)
+    return path
+
+
+def _parse(filename):
+    return collate.jobParse(open(filename).read())
+
+
+def _changed(before, after):
+    """
+    Returns the numbers of the lines that differ between two jobParse line lists of the same length.
+    """
+    assert len(before) == len(after)
+    return [i for i, (old, new) in enumerate(zip(before, after)) if old != new]
+
+
+def test_job_file_create_round_trip(tmpdir):
+    path = _samples(tmpdir)
+    EDGE.job_file_create(7, path, iwall=1, amaxs=1.0, epsilon=0.1, temp=1200.5, tshock=9000, mdot=2e-9,
+                         labelend='test_007', altinh=2)
+    params, alts, lines = _parse(path + 'job007')
+    sample = _parse(SAMPLES + 'job_sample')
+
+    assert params['AMAXS'] == '1.0' and params['lamaxs'] == 'amax1p0'
+    assert params['EPS'] == '.1' and params['epsilonbig'] == '11.4'
+    assert params['TEMP'] == '1200.' and params['TSHOCK'] == '9000.'
+    assert params['MDOT'] == '2e-09' and params['labelend'] == 'test_007' and params['ALTINH'] == '2'
+    for switch in ['IPHOT', 'IOPA', 'IVIS', 'IIRR', 'IPROP', 'ISEDT']:
+        assert params[switch] == '0'
+    assert params['ISILCOM'] == '1' and params['IWALLDUST'] == '1'
+    # Exactly one alternative of each switch stays active:
+    for name in ['AMAXS', 'lamaxs', 'EPS', 'epsilonbig']:
+        assert len([alt for alt in alts if alt[0] == name and alt[3]]) == 1
+
+    # Nothing else changed, and the trailing comments and quotes are kept:
+    setlines = dict((name, lineno) for name, value, lineno, active in sample[1] if active)
+    expected = sorted([setlines[name] for name in ['MDOT', 'TSHOCK', 'TEMP', 'ALTINH', 'labelend', 'IPHOT', 'IOPA',
+                                                   'IVIS', 'IIRR', 'IPROP', 'ISEDT']] +
+                      [lineno + n for name, value, lineno, active in sample[1] for n in (0, 1)
+                       if (name, value) in [('AMAXS', '0.25'), ('AMAXS', '1.0'), ('EPS', '.0001'), ('EPS', '.1')]])
+    assert _changed(sample[2], lines) == expected
+    assert lines[setlines['MDOT']] == "set MDOT='2e-09' #in Msun/yr \n"
+    assert lines[setlines['TEMP']] == "set TEMP=1200. #temperature at inner edge (i.e., wall) of disk\n"
+
+    # Unchanged if nothing is asked for:
+    EDGE.job_file_create(8, path)
+    assert open(path + 'job008').read() == open(SAMPLES + 'job_sample').read()
+
+
+def test_job_file_create_errors(tmpdir):
+    path = _samples(tmpdir)
+    with pytest.raises(ValueError):
+        EDGE.job_file_create(1, path, amaxs=0.3)
+    with pytest.raises(ValueError):
+        EDGE.job_file_create(1, path, epsilon=0.3)
+    assert not os.path.exists(path + 'job001')
+
+
+def test_job_optthin_create_round_trip(tmpdir):
+    path = _samples(tmpdir)
+    sample = _parse(SAMPLES + 'job_optthin_sample')
+    for amax, lamax in [('1mm', 'amax1mm'), (1.0, 'amax1p0'), ('amax0p05', 'amax0p05'), (0.25, 'amax0p25')]:
+        EDGE.job_optthin_create(3, path, amax=amax, tstar=4500, labelend='test_003')
+        params, alts, lines = _parse(path + 'job_optthin003')
+        assert params['lamax'] == lamax
+        assert [alt[1] for alt in alts if alt[0] == 'lamax' and alt[3]] == [lamax]
+        assert params['TSTAR'] == '4500' and params['labelend'] == 'test_003'
+        assert params['RSTAR'] == sample[0]['RSTAR']
+        assert len(_changed(sample[2], lines)) == 2 + 2*(lamax != 'amax0p25')
+    with pytest.raises(ValueError):
+        EDGE.job_optthin_create(3, path, amax=0.3)
+    with pytest.raises(ValueError):
+        EDGE.job_optthin_create(3, path, amax='big')
+
+
+def test_collate_amaxs_and_eps(tmpdir, makeJob):
+    path = str(tmpdir) + '/'
+    makeJob(path, '001')
+    collate.collate(path, '001', 'test', path)
+    header = fits.getheader(path + 'test_001.fits')
+    assert header['AMAXS'] == 0.25 and header['EPS'] == 0.0001
+
+    # Without an active AMAXS (the 1 mm grains), AMAXS is 1000:
+    makeJob(path, '002', AMAXS=None, lamaxs=None)
+    collate.collate(path, '002', 'test', path)
+    assert fits.getheader(path + 'test_002.fits')['AMAXS'] == 1000.
+
+    makeJob(path, '003', EPS=None)
+    with pytest.raises(IOError):
+        collate.collate(path, '003', 'test', path)
+
+    # The optically thin dust amax is turned into the AMAXS of the header:
+    makeJob(path, '001', optthin=1, lamax='amax1mm')
+    collate.collate(path, '001', 'test', path, optthin=1)
+    assert fits.getheader(path + 'test_OTD_001.fits')['AMAXS'] == 1000.
+    makeJob(path, '002', optthin=1, lamax='amax2p0')
+    collate.collate(path, '002', 'test', path, optthin=1)
+    assert fits.getheader(path + 'test_OTD_002.fits')['AMAXS'] == 2.0
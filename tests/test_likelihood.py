@@ -0,0 +1,34 @@
+"""
+Checks that Likelihood gives the log-likelihood -chi^2/2 of the total of the components, on grid rows with a scaled
+inner wall and on SEDEmulator predictions between the nodes, and that it refuses non-integer rows and is -inf outside
+the grid.
+"""
+
+import numpy as np
+import pytest
+
+import EDGE
+
+
+def test_likelihood_matches_chisq(gridModels, makeObs):
+    obs = makeObs(3)
+    grid = EDGE.ModelGrid('test', gridModels)
+    wavelength, flux, weights = EDGE.obsPrep(obs)
+
+    like = EDGE.Likelihood(obs, grid, scales=['iwall'])
+    for row in range(len(grid)):
+        data = grid.model(grid.jobs[row]).data
+        total = data['phot'] + 2.0*data['iwall'] + data['disk'] + data['scatt']
+        chi_arr = (flux - np.interp(wavelength, data['wl'], total)) * weights / flux
+        assert np.isclose(like([row, 2.0]), -0.5*np.sum(chi_arr*chi_arr), rtol=1e-10)
+    with pytest.raises(ValueError):
+        like([0.5, 2.0])
+
+    emulator = EDGE.SEDEmulator(grid, params=['MDOT', 'ALPHA'])
+    like = EDGE.Likelihood(obs, emulator)
+    for mdot, alpha in [(3e-9, 2e-3), (1e-8, 1e-2), (5e-8, 5e-3)]:
+        data = emulator.predict(mdot=mdot, alpha=alpha)
+        total = data['phot'] + data['iwall'] + data['disk'] + data['scatt']
+        chi_arr = (flux - np.interp(wavelength, data['wl'], total)) * weights / flux
+        assert np.isclose(like([mdot, alpha]), -0.5*np.sum(chi_arr*chi_arr), rtol=1e-10)
+    assert like([1e-6, 1e-2]) == -np.inf
@@ -0,0 +1,210 @@
+"""
+Checks the loading of single models: LazyData behaves like the usual data dictionary while only reading components
+when they are first used, lazy TTS_Model and PTD_Model give the same data as the eager ones, the eager constructor
+only reads the header, and the components shared through componentCache can't be changed through one model. Job
+numbers can be given as integers or as the (numpy) strings that searchJobs and ModelGrid return, for the model itself
+and for the inner wall of a PTD_Model.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import EDGE
+
+
+def _loader(key, calls):
+    def load():
+        calls.append(key)
+        return np.arange(3) + len(calls)
+    return load
+
+
+def test_LazyData():
+    calls = []
+    data = EDGE.LazyData(dict((key, _loader(key, calls)) for key in ['wl', 'phot', 'disk']))
+    assert 'phot' in data and 'scatt' not in data
+    assert sorted(data.keys()) == ['disk', 'phot', 'wl'] and len(data) == 3
+    assert calls == []
+
+    phot = data['phot']
+    assert calls == ['phot'] and data['phot'] is phot
+    assert data.get('scatt', 'none') == 'none' and calls == ['phot']
+    with pytest.raises(KeyError):
+        data['scatt']
+
+    # Setting a component replaces its loader, and deleting one that was never read does not read it:
+    data['wl'] = np.zeros(3)
+    assert np.array_equal(data['wl'], np.zeros(3))
+    del data['disk']
+    assert 'disk' not in data and sorted(data.keys()) == ['phot', 'wl']
+    with pytest.raises(KeyError):
+        del data['disk']
+    del data['phot']
+    assert list(data) == ['wl']
+    data['total'] = np.ones(3)
+    assert sorted(dict(data.items()).keys()) == ['total', 'wl'] and calls == ['phot']
+
+
+@pytest.fixture
+def models(tmpdir, makeModel):
+    path = str(tmpdir) + '/'
+    makeModel(path, '001', seed=1)
+    makeModel(path, '002', wall=1, seed=2)
+    return path
+
+
+def test_lazy_TTS_Model(models):
+    eager = EDGE.TTS_Model('test', 1, dpath=models)
+    eager.dataInit()
+    lazy = EDGE.TTS_Model('test', 1, dpath=models, lazy=1)
+    lazy.dataInit()
+    assert isinstance(lazy.data, EDGE.LazyData)
+    assert sorted(lazy.data.keys()) == sorted(eager.data.keys()) == ['disk', 'iwall', 'phot', 'scatt', 'wl']
+    assert not any(dict.__contains__(lazy.data, key) for key in lazy.data.keys())
+    assert lazy._extcorr is None
+
+    assert np.array_equal(lazy.data['disk'], eager.data['disk'])
+    assert dict.__contains__(lazy.data, 'disk') and not dict.__contains__(lazy.data, 'phot')
+    assert np.array_equal(lazy.extcorr, eager.extcorr)
+    lazy.calc_total(verbose=0)
+    eager.calc_total(verbose=0)
+    assert np.array_equal(lazy.data['total'], eager.data['total'])
+    for key in eager.data:
+        assert np.array_equal(lazy.data[key], eager.data[key])
+
+
+def test_lazy_PTD_Model(models):
+    eager = EDGE.PTD_Model('test', 1, dpath=models)
+    eager.dataInit(jobw=2)
+    lazy = EDGE.PTD_Model('test', 1, dpath=models, lazy=1)
+    lazy.dataInit(jobw=2)
+    assert sorted(lazy.data.keys()) == sorted(eager.data.keys()) == ['disk', 'iwall', 'owall', 'phot', 'scatt', 'wl']
+    assert not any(dict.__contains__(lazy.data, key) for key in lazy.data.keys())
+    assert lazy.itemp == eager.itemp == 1200.
+
+    wall = fits.getdata(models + 'test_002.fits')[2]
+    data = fits.getdata(models + 'test_001.fits')
+    assert np.allclose(lazy.data['iwall'], wall*np.exp(-data[5]), rtol=1e-15)
+    assert dict.__contains__(lazy.data, 'iwall') and not dict.__contains__(lazy.data, 'owall')
+    lazy.calc_total(verbose=0)
+    eager.calc_total(verbose=0)
+    for key in eager.data:
+        assert np.array_equal(lazy.data[key], eager.data[key])
+
+
+def test_eager_init_reads_header_only(models, monkeypatch):
+    def noData(hdu):
+        raise AssertionError('The data was read')
+    monkeypatch.setattr(fits.PrimaryHDU, 'data', property(noData))
+    model = EDGE.TTS_Model('test', 1, dpath=models)
+    assert model.mdot == 1e-8 and model.tstar == 4060.
+    with pytest.raises(AssertionError):
+        model.dataInit()
+
+
+def _touch(filename, mtime):
+    os.utime(filename, (mtime, mtime))
+    return filename
+
+
+def test_ComponentCache_counts_and_invalidation(tmpdir):
+    files = []
+    for name in ['a', 'b', 'c']:
+        open(str(tmpdir) + '/' + name, 'w').close()
+        files.append(_touch(str(tmpdir) + '/' + name, 1e9))
+    a, b, c = files
+    reads = []
+
+    def fetch(filename, axes=['X']):
+        def reader():
+            reads.append(os.path.basename(filename))
+            return {'X': np.arange(100.), 'HEADER': fits.Header([('TEMP', 1400.)])}
+        return cache.fetch(filename, '001', axes, reader)
+
+    # Room for the two components of two files (800 + 160 bytes each), but not of three:
+    cache = EDGE.ComponentCache(maxbytes=2000)
+    fetch(a)
+    fetch(a, ['HEADER'])                        # Read along with X, so this is a hit
+    assert reads == ['a']
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 2, 'nbytes': 960, 'maxbytes': 2000}
+    fetch(b)
+    fetch(a)
+    assert reads == ['a', 'b'] and cache.stats()['hits'] == 2 and cache.stats()['evictions'] == 0
+
+    # The least recently used components (those of b) make room for c:
+    fetch(c, ['X', 'HEADER'])
+    assert cache.stats()['evictions'] == 2 and cache.stats()['entries'] == 4 and cache.stats()['nbytes'] == 1920
+    fetch(a)
+    fetch(b)
+    assert reads == ['a', 'b', 'c', 'b'] and cache.stats()['misses'] == 5
+
+    # A file modified since it was read is read again:
+    _touch(c, 1e9 + 10)
+    fetch(c)
+    assert reads == ['a', 'b', 'c', 'b', 'c']
+
+    # Callers get copies they can change:
+    comps = fetch(c, ['X', 'HEADER'])
+    comps['X'] *= 2
+    comps['HEADER']['TEMP'] = 1000.
+    comps = fetch(c, ['X', 'HEADER'])
+    assert np.array_equal(comps['X'], np.arange(100.)) and comps['HEADER']['TEMP'] == 1400.
+    assert reads.count('c') == 2
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'nbytes': 0, 'maxbytes': 2000}
+
+
+def test_shared_components_are_not_changed_through_models(models):
+    wl = fits.getdata(models + 'test_001.fits')[0]
+    fits.writeto(models + 'test_OTD_001.fits', np.array([wl, np.ones(len(wl))]))
+    EDGE.componentCache.clear()
+    for i in range(2):
+        model = EDGE.TTS_Model('test', 1, dpath=models)
+        model.dataInit()
+        model.calc_total(dust=1, verbose=0)
+        assert np.array_equal(model.data['dust'], np.ones(len(wl)))
+        model.data['dust'] *= 2
+
+        model = EDGE.PTD_Model('test', 1, dpath=models)
+        model.dataInit(jobw=2)
+        header, wall = model._wallData('test', 2)
+        assert header['TEMP'] == 1200. and np.array_equal(wall, fits.getdata(models + 'test_002.fits')[2])
+        header['TEMP'] = 1000.
+        wall *= 2
+    assert EDGE.componentCache.stats()['hits'] > 0
+
+
+def test_PTD_Model_finds_its_wall(models):
+    eager = EDGE.PTD_Model('test', 1, dpath=models)
+    eager.dataInit(jobw=2)
+    EDGE.componentCache.clear()
+    for jobw in [EDGE.searchJobs('test', dpath=models, temp=1200.)[0], '002', 2]:
+        model = EDGE.PTD_Model('test', 1, dpath=models)
+        model.dataInit(jobw=jobw)
+        assert np.array_equal(model.data['iwall'], eager.data['iwall'])
+
+    # Found by searching the headers, which gives numpy strings:
+    model = EDGE.PTD_Model('test', 1, dpath=models)
+    model.dataInit(temp=1200.)
+    assert model.itemp == 1200. and np.array_equal(model.data['iwall'], eager.data['iwall'])
+    with pytest.raises(IOError):
+        EDGE.PTD_Model('test', 1, dpath=models).dataInit(temp=1000.)
+
+
+@pytest.mark.parametrize('grid', [0, 1])
+def test_TTS_Model_string_job_numbers(gridModels, grid):
+    jobs = [1, '001', EDGE.ModelGrid('test', gridModels).jobs[0], EDGE.searchJobs('test', dpath=gridModels, mdot=1e-9,
+                                                                                   alpha=1e-3)[0]]
+    expected = None
+    for jobn in jobs:
+        model = EDGE.TTS_Model('test', jobn, dpath=gridModels, grid=grid)
+        model.dataInit()
+        model.calc_total(verbose=0, save=1)
+        if expected is None:
+            expected = model.data['total']
+        assert np.array_equal(model.data['total'], expected)
+    assert os.path.exists(gridModels + 'test_001.dat')
@@ -0,0 +1,76 @@
+"""
+Checks the batched inner wall x outer disk pairing of pre-transitional disk grids: every block of pair_totals, however
+small maxbytes makes the blocks, and every pair_rchi2 value match what PTD_Model.dataInit, calc_total and model_rchi2
+give for the same pair.
+"""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import EDGE
+
+WALLS = ['001', '002']
+DISKS = ['003', '004', '005']
+
+
+@pytest.fixture
+def models(tmpdir, makeModel):
+    path = str(tmpdir) + '/'
+    for i, jobnum in enumerate(WALLS + DISKS):
+        makeModel(path, jobnum, wall=jobnum in WALLS, seed=i)
+    return path
+
+
+def _stacks(path):
+    """
+    Returns the wavelengths, inner walls, disk totals (without the inner wall) and extinctions of the grid.
+    """
+    walls = np.array([fits.getdata(path + 'test_' + jobnum + '.fits')[2] for jobnum in WALLS])
+    data = np.array([fits.getdata(path + 'test_' + jobnum + '.fits') for jobnum in DISKS])
+    return data[0, 0], walls, data[:, 1:5].sum(axis=1), data[:, 5]
+
+
+def _ptdModel(path, wall, disk):
+    model = EDGE.PTD_Model('test', DISKS[disk], dpath=path)
+    model.dataInit(jobw=WALLS[wall])
+    model.calc_total(verbose=0)
+    return model
+
+
+# A maxbytes of 1 gives one pair per block. The other leaves room for two pairs of 30 wavelengths (two float arrays
+# of 30 + 30 values each), so without interpolation the 3 disks are split into uneven blocks of 2 and 1:
+@pytest.mark.parametrize('maxbytes', [1, 2 * 8*2*(30 + 30)])
+def test_pair_totals_match_PTD_Model(models, makeObs, maxbytes):
+    wl, walls, disks, extinction = _stacks(models)
+    wavelength = EDGE.obsPrep(makeObs(3))[0]
+    for interp in [0, 1]:
+        blocks = list(EDGE.pair_totals(walls, disks, extinction, wl=wl, wavelength=wavelength if interp else None,
+                                       maxbytes=maxbytes))
+        if interp:
+            assert len(blocks) > 1
+        else:
+            assert len(blocks) == (6 if maxbytes == 1 else 4)
+        covered = np.zeros((len(WALLS), len(DISKS)), dtype=int)
+        for wallSlice, diskSlice, totals in blocks:
+            covered[wallSlice, diskSlice] += 1
+            for i, w in enumerate(range(len(WALLS))[wallSlice]):
+                for j, d in enumerate(range(len(DISKS))[diskSlice]):
+                    model = _ptdModel(models, w, d)
+                    expected = model.data['total']
+                    if interp:
+                        expected = np.interp(wavelength, model.data['wl'], expected)
+                    assert np.allclose(totals[i, j], expected, rtol=1e-12)
+        assert (covered == 1).all()
+
+
+@pytest.mark.parametrize('maxbytes', [1, 2 * 8*2*(30 + 30), 64*2**20])
+def test_pair_rchi2_matches_model_rchi2(models, makeObs, maxbytes):
+    wl, walls, disks, extinction = _stacks(models)
+    obs = makeObs(3)
+    wavelength, flux, weights = EDGE.obsPrep(obs)
+    rchi_sq = EDGE.pair_rchi2(walls, disks, extinction, wl, wavelength, flux, weights, maxbytes=maxbytes)
+    assert rchi_sq.shape == (len(WALLS), len(DISKS))
+    for w in range(len(WALLS)):
+        for d in range(len(DISKS)):
+            assert np.isclose(rchi_sq[w, d], EDGE.model_rchi2(obs, _ptdModel(models, w, d), models), rtol=1e-10)
@@ -0,0 +1,125 @@
+"""
+Checks the parsing of the model output files: the dedicated readers give the same numbers as ascii.read, and
+floatConvert turns the values into floats the way float() does on each one (or recovers Fortran style exponents with
+fortran=1).
+"""
+
+import numpy as np
+import pytest
+from astropy.io import ascii
+
+import collate
+
+TOKENS = ['1.5', '-2.25e-03', '2.5E+01', ' 7 ', '1.234-310', '1.0D+03', '+3.1+02', '-1.5-02', 'nan', '--1', 'abc', '']
+
+
+def _floatOrNan(token):
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
+
+
+def test_floatConvert_numbers_take_fast_path():
+    data, floaterr = collate.floatConvert(np.array([1.0, 2.5, -3.0]))
+    assert floaterr == 0
+    assert np.array_equal(data, [1.0, 2.5, -3.0])
+    data, floaterr = collate.floatConvert(['1.0', '2.5e+03'])
+    assert floaterr == 0
+    assert np.array_equal(data, [1.0, 2500.0])
+
+
+def test_floatConvert_matches_float():
+    data, floaterr = collate.floatConvert(TOKENS)
+    assert floaterr == 1
+    np.testing.assert_array_equal(data, [_floatOrNan(token) for token in TOKENS])
+
+
+@pytest.mark.parametrize('token, value', [('1.234-310', 1.234e-310), ('1.0D+03', 1000.0), ('+3.1+02', 310.0),
+                                          ('-1.5-02', -0.015), ('2.5d-1', 0.25), ('2.5E+01', 25.0), ('7', 7.0)])
+def test_floatConvert_fortran_exponents(token, value):
+    data, floaterr = collate.floatConvert([token, '1.0'], fortran=1)
+    assert floaterr == 0
+    assert data[0] == value
+    data, floaterr = collate.floatConvert([token, '1.0'], fortran=0)
+    np.testing.assert_array_equal(data[:1], [_floatOrNan(token)])
+
+
+def test_floatConvert_fortran_keeps_bad_values_nan():
+    data, floaterr = collate.floatConvert(['--1', 'abc', '1-2-3', '1.5'], fortran=1)
+    assert floaterr == 1
+    assert np.isnan(data[:3]).all()
+    assert data[3] == 1.5
+
+
+# The model output layouts: the reader, the ascii.read keywords collate used to read them with and the columns kept
+LAYOUTS = [(collate.readPhot, {}, (1, 2), 0),
+           (collate.readWall, {'data_start': 9}, (1, 2), 9),
+           (collate.readAngle, {'data_start': 1}, (1, 4, 6), 1),
+           (collate.readScatt, {'data_start': 1}, (1, 4), 1),
+           (collate.readFort16, {}, (1, 3), 0)]
+
+
+def _writeOutput(filename, nheader, ncols, odd=()):
+    """
+    Writes a model output file with nheader header lines, a blank line and a # line among the data rows, and the
+    odd tokens put into the last column of the first rows.
+    """
+    random = np.random.RandomState(ncols + nheader)
+    rows = ['%12.5E' % wl + ''.join(['%12.5E' % value for value in random.uniform(1e-14, 1e-9, ncols-1)])
+            for wl in np.logspace(-1, 3, 12)]
+    for i, token in enumerate(odd):
+        rows[i] = rows[i].rsplit(None, 1)[0] + '  ' + token
+    rows = rows[:4] + ['', '#comment', '   '] + rows[4:]
+    header = [' ' + str(i) + ' 1.0' for i in range(nheader)]
+    f = open(filename, 'w')
+    f.write('\n'.join(header + rows) + '\n')
+    f.close()
+    return filename
+
+
+def _asciiColumns(filename, kwargs, cols, fortran):
+    table = ascii.read(filename, **kwargs)
+    return np.array([collate.floatConvert(table['col' + str(col)], fortran=fortran)[0] for col in cols])
+
+
+@pytest.mark.parametrize('reader, kwargs, cols, nheader', LAYOUTS)
+def test_readers_match_ascii_read(tmpdir, reader, kwargs, cols, nheader):
+    filename = _writeOutput(str(tmpdir) + '/output', nheader, max(cols))
+    data, floaterr = reader(filename)
+    assert floaterr == 0
+    assert data.shape == (len(cols), 12)
+    assert np.array_equal(data, _asciiColumns(filename, kwargs, cols, 0))
+
+
+@pytest.mark.parametrize('fortran', [0, 1])
+@pytest.mark.parametrize('reader, kwargs, cols, nheader', LAYOUTS)
+def test_readers_fortran_tokens(tmpdir, reader, kwargs, cols, nheader, fortran):
+    filename = _writeOutput(str(tmpdir) + '/output', nheader, max(cols), odd=['1.234-310', '1.0D+03', '+3.1+02'])
+    data, floaterr = reader(filename, fortran=fortran)
+    assert floaterr == 1 - fortran
+    np.testing.assert_array_equal(data, _asciiColumns(filename, kwargs, cols, fortran))
+    if fortran:
+        assert list(data[-1, :3]) == [1.234e-310, 1000.0, 310.0]
+    else:
+        assert np.isnan(data[-1, :3]).all()
+
+
+def test_readColumns_gzip_and_errors(tmpdir, makeJob):
+    path = str(tmpdir) + '/'
+    plain = makeJob(path, '001')
+    zipped = makeJob(path, '002', gz=1)
+    for kind, reader in [('phot', collate.readPhot), ('wall', collate.readWall), ('angle', collate.readAngle)]:
+        assert zipped[kind].endswith('.gz')
+        assert np.array_equal(reader(zipped[kind])[0], reader(plain[kind])[0])
+    wl, phot, wall, disk, tau = plain['columns']
+    assert np.allclose(collate.readAngle(plain['angle'])[0], [wl, disk, tau], rtol=1e-6)
+
+    # Ragged rows and missing columns are errors, not silently misread:
+    f = open(path + 'ragged', 'w')
+    f.write('1.0 2.0\n3.0\n')
+    f.close()
+    with pytest.raises(IOError):
+        collate.readPhot(path + 'ragged')
+    with pytest.raises(IOError):
+        collate.readAngle(plain['phot'])
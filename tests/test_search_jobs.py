@@ -0,0 +1,115 @@
+"""
+Checks searchJobs and the header index behind it: after files are changed, added or removed, headerIndex only opens
+the new and changed files again and ends up with the same index as one built from scratch, and searches give the same
+jobs (or the same errors) whether or not they use the index. Nearest searches leave out the jobs without the keywords.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import EDGE
+
+
+def _writeJob(path, jobnum, **keys):
+    header = fits.Header()
+    header['OBJNAME'] = 'test'
+    header['JOBNUM'] = jobnum
+    for key, value in sorted(keys.items()):
+        header[key.upper()] = value
+    filename = path + 'test_' + jobnum + '.fits'
+    fits.writeto(filename, np.ones((2, 10)), header, overwrite=True)
+    os.utime(filename, (1e9, 1e9))
+    return filename
+
+
+def _makeJobs(tmpdir):
+    path = str(tmpdir) + '/'
+    _writeJob(path, '001', mdot=1e-8, alpha=0.01)
+    _writeJob(path, '002', mdot=2e-8, alpha=0.01)
+    _writeJob(path, '003', mdot=3e-8, alpha=0.1, extra=5.0, note='only here')
+    return path
+
+
+def _assertSameIndex(index, expected):
+    assert sorted(index.keys()) == sorted(expected.keys())
+    for key in expected:
+        np.testing.assert_array_equal(index[key], expected[key])
+
+
+def test_headerIndex_incremental(tmpdir, monkeypatch):
+    path = _makeJobs(tmpdir)
+    first = EDGE.headerIndex('test', dpath=path)
+    assert list(first['jobnum']) == ['001', '002', '003']
+    assert os.path.exists(path + 'test_index.npz')
+
+    # Change one file, keeping its size:
+    fits.setval(path + 'test_002.fits', 'MDOT', value=2.5e-8)
+    opened = []
+    getheader = fits.getheader
+    monkeypatch.setattr(fits, 'getheader', lambda filename: opened.append(filename) or getheader(filename))
+    EDGE.headerCache.clear()
+    index = EDGE.headerIndex('test', dpath=path)
+    assert opened == [path + 'test_002.fits']
+    for key in first:
+        changed = [i for i in range(3) if index[key][i] != first[key][i] and not
+                   (index[key].dtype.kind == 'f' and np.isnan(index[key][i]) and np.isnan(first[key][i]))]
+        assert changed == ([1] if key in ['MDOT', 'mtime'] else [])
+
+    # Remove the only file with EXTRA and NOTE, and add a new one:
+    os.remove(path + 'test_003.fits')
+    _writeJob(path, '004', mdot=4e-8, alpha=0.1)
+    del opened[:]
+    EDGE.headerCache.clear()
+    index = EDGE.headerIndex('test', dpath=path)
+    assert opened == [path + 'test_004.fits']
+    assert 'EXTRA' not in index and 'NOTE' not in index
+    assert list(index['jobnum']) == ['001', '002', '004']
+
+    # Loaded back from the .npz file, without opening anything:
+    del opened[:]
+    EDGE.headerCache.clear()
+    saved = EDGE.headerIndex('test', dpath=path)
+    assert opened == []
+    _assertSameIndex(saved, index)
+
+    # The same as an index built from scratch:
+    fresh = EDGE.headerIndex('test', dpath=path, save=0, indexpath=str(tmpdir.mkdir('fresh')) + '/')
+    _assertSameIndex(index, fresh)
+
+
+def test_searchJobs_string_keywords(tmpdir):
+    path = _makeJobs(tmpdir)
+    for indexed in [0, 1]:
+        assert list(EDGE.searchJobs('test', dpath=path, indexed=indexed, jobnum='002')) == ['002']
+        with pytest.raises(TypeError) as err:
+            EDGE.searchJobs('test', dpath=path, indexed=indexed, jobnum=2)
+        assert 'JOBNUM' in str(err.value)
+    with pytest.raises(TypeError):
+        EDGE.searchJobs('test', dpath=path, nearest=1, jobnum=2, mdot=1e-8)
+    with pytest.raises(TypeError):
+        EDGE.searchJobs('test', dpath=path, jobnum=(1, 2))
+
+
+@pytest.mark.parametrize('kwargs, expected', [({'mdot': 1.0000001e-8}, ['001']),
+                                              ({'mdot': 1.0000001e-8, 'rtol': 0}, []),
+                                              ({'mdot': 1.1e-8, 'rtol': 0, 'atol': 2e-9}, ['001']),
+                                              ({'alpha': 0.01}, ['001', '002']),
+                                              ({'alpha': 0.1}, ['003']),
+                                              ({'alpha': 0.1, 'objname': 'test'}, ['003']),
+                                              ({'alpha': 0.1, 'objname': 'other'}, [])])
+def test_searchJobs_indexed_and_unindexed_agree(tmpdir, kwargs, expected):
+    path = _makeJobs(tmpdir)
+    for indexed in [0, 1]:
+        assert sorted(EDGE.searchJobs('test', dpath=path, indexed=indexed, **kwargs)) == expected
+
+
+def test_searchJobs_nearest_skips_missing_keywords(tmpdir):
+    path = str(tmpdir) + '/'
+    _writeJob(path, '001', foo=1.0)
+    _writeJob(path, '002')
+    _writeJob(path, '003', foo=2.0)
+    assert list(EDGE.searchJobs('test', dpath=path, nearest=3, foo=1.0)) == ['001', '003']
+    assert list(EDGE.searchJobs('test', dpath=path, nearest=1, foo=1.9)) == ['003']